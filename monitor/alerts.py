@@ -0,0 +1,188 @@
+"""Threshold alerts evaluated on every incoming sensor reading.
+
+Rules come from herbs.yaml for each configured plant: water temperature
+outside temp_min_c..temp_max_c, and light below light_min_lux during
+alerts.light_hours (the grow light's full-intensity period). They are
+compiled once into per-sensor lists, so a reading only touches the rules
+for its own sensor.
+
+Each rule is a small state machine:
+
+    ok -> pending     threshold crossed
+    pending -> active     still crossed after min_duration_seconds ("raised")
+    active -> clearing    back past the threshold by the hysteresis margin
+    clearing -> ok        still back after min_duration_seconds ("cleared")
+
+A reading that bounces around a threshold therefore raises nothing, and an
+active alert does not flap. Transitions go out through publish(): MQTT
+(<publish_topic>/alert) and the /api/events push channel.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+import events
+from knowledge import load_herbs
+
+log = logging.getLogger(__name__)
+
+
+def publish(state, alert):
+    """Send an alert payload to MQTT and the event stream."""
+    events.publish("alert", alert)
+    mqtt = state.get("mqtt_client")
+    if mqtt:
+        mqtt.publish_alert(alert)
+
+
+def _minutes(hhmm):
+    hour, minute = (int(part) for part in hhmm.split(":"))
+    return hour * 60 + minute
+
+
+class Rule:
+    """One plant's threshold on one sensor, with its alert state."""
+
+    def __init__(self, plant, kind, sensor, direction, threshold, hysteresis, unit, hours=None):
+        self.plant = plant
+        self.kind = kind
+        self.sensor = sensor
+        self.direction = direction    # "below" or "above"
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.unit = unit
+        self.hours = hours            # (start, end) minutes of day the rule applies, or None
+        self.status = "ok"
+        self.since = None
+        self.value = None
+
+    def violated(self, value):
+        return value < self.threshold if self.direction == "below" else value > self.threshold
+
+    def recovered(self, value):
+        if self.direction == "below":
+            return value >= self.threshold + self.hysteresis
+        return value <= self.threshold - self.hysteresis
+
+    def applies(self, minute_of_day):
+        return self.hours is None or self.hours[0] <= minute_of_day < self.hours[1]
+
+    def message(self):
+        word = "low" if self.direction == "below" else "high"
+        limit = "min" if self.direction == "below" else "max"
+        return (f"{self.kind.capitalize()} too {word} for {self.plant}: "
+                f"{self.value}{self.unit} ({limit} {self.threshold}{self.unit})")
+
+    def snapshot(self):
+        return {"plant": self.plant, "type": self.kind, "sensor": self.sensor,
+                "direction": self.direction, "threshold": self.threshold,
+                "status": self.status, "value": self.value}
+
+
+class AlertEngine:
+    """Compiled plant rules, fed one reading at a time (see observe())."""
+
+    def __init__(self, config, state, herbs=None):
+        cfg = config["alerts"]
+        self.state = state
+        self.min_duration = cfg["min_duration_seconds"]
+        herbs = herbs or load_herbs()
+        light_hours = tuple(_minutes(t) for t in cfg["light_hours"])
+
+        self._lock = threading.Lock()
+        self.rules = {}   # sensor -> [Rule]
+        for plant in config["plants"]:
+            herb = herbs.get(plant["species"])
+            if not herb:
+                continue
+            name = plant["name"]
+            if "temp_min_c" in herb:
+                self._add(Rule(name, "temperature", "temp_c", "below", herb["temp_min_c"],
+                               cfg["temp_hysteresis_c"], "C"))
+            if "temp_max_c" in herb:
+                self._add(Rule(name, "temperature", "temp_c", "above", herb["temp_max_c"],
+                               cfg["temp_hysteresis_c"], "C"))
+            if "light_min_lux" in herb:
+                self._add(Rule(name, "light", "lux", "below", herb["light_min_lux"],
+                               cfg["light_hysteresis_lux"], " lux", hours=light_hours))
+        log.info("Alert rules compiled: %s",
+                 ", ".join(f"{len(r)} on {s}" for s, r in self.rules.items()) or "none")
+
+    def _add(self, rule):
+        self.rules.setdefault(rule.sensor, []).append(rule)
+
+    def observe(self, sensor, value, now=None, wall=None):
+        """Evaluate the rules for one sensor reading.
+
+        Args:
+            sensor: Sensor name from ingest ("temp_c", "lux", ...).
+            value: The reading.
+            now: time.monotonic() of the reading.
+            wall: datetime of the reading, for time-of-day rules.
+        """
+        rules = self.rules.get(sensor)
+        if not rules:
+            return
+        now = time.monotonic() if now is None else now
+        wall = wall or datetime.now()
+        minute_of_day = wall.hour * 60 + wall.minute
+        transitions = []
+        with self._lock:
+            for rule in rules:
+                rule.value = value
+                # Outside its hours a rule sees only "fine" readings
+                bad = rule.applies(minute_of_day) and rule.violated(value)
+                good = not rule.applies(minute_of_day) or rule.recovered(value)
+                change = self._step(rule, bad, good, now)
+                if change:
+                    transitions.append((change, rule.snapshot(), rule.message()))
+        for change, snapshot, message in transitions:
+            self._publish(change, snapshot, message)
+
+    def _step(self, rule, bad, good, now):
+        """Advance one rule; returns "raised"/"cleared" on a transition."""
+        if rule.status == "ok":
+            if bad:
+                rule.status, rule.since = "pending", now
+        elif rule.status == "pending":
+            if not bad:
+                rule.status, rule.since = "ok", None
+        elif rule.status == "active":
+            if good:
+                rule.status, rule.since = "clearing", now
+        elif rule.status == "clearing":
+            if not good:
+                rule.status, rule.since = "active", None
+
+        if rule.since is not None and now - rule.since >= self.min_duration:
+            if rule.status == "pending":
+                rule.status, rule.since = "active", None
+                return "raised"
+            if rule.status == "clearing":
+                rule.status, rule.since = "ok", None
+                return "cleared"
+        return None
+
+    def _publish(self, change, snapshot, message):
+        alert = {
+            **snapshot,
+            "state": change,
+            "message": message if change == "raised" else f"Cleared: {message}",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        }
+        (log.warning if change == "raised" else log.info)(alert["message"])
+        publish(self.state, alert)
+
+    def active(self):
+        """Rules currently alerting (active, or clearing but not yet cleared)."""
+        with self._lock:
+            return [dict(rule.snapshot(), message=rule.message())
+                    for rules in self.rules.values() for rule in rules
+                    if rule.status in ("active", "clearing")]
+
+    def describe(self):
+        """Every compiled rule with its current state."""
+        with self._lock:
+            return [rule.snapshot() for rules in self.rules.values() for rule in rules]
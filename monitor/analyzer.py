@@ -4,10 +4,20 @@ import logging
 import os
 from datetime import date, datetime
 
-from knowledge import get_growth_stage, get_plant_age, load_herbs
+import catalog
+import metrics
+import photostore
+import storage
+from influxdb_writer import QUERY_FAILURES, QUERY_SECONDS
+from knowledge import get_index, load_herbs
 
 log = logging.getLogger(__name__)
 
+API_SECONDS = metrics.histogram(
+    "ecogarden_analysis_api_seconds", "Claude API call duration for plant analysis")
+ANALYSES = metrics.counter(
+    "ecogarden_analyses_total", "Plant analysis runs by outcome", ["result"])
+
 
 def _load_previous_analysis(config):
     """Load the most recent analysis for comparison context."""
@@ -55,8 +65,9 @@ def _enrich_with_light_data(config, sensors):
                 "Accept": "application/csv",
             },
         )
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            csv_data = resp.read().decode()
+        with QUERY_SECONDS.labels(query="light_latest").time():
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                csv_data = resp.read().decode()
 
         for line in csv_data.strip().split("\n"):
             if line.startswith(","):
@@ -84,8 +95,9 @@ def _enrich_with_light_data(config, sensors):
                     "Accept": "application/csv",
                 },
             )
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                csv_data = resp.read().decode()
+            with QUERY_SECONDS.labels(query=f"light_{stat_name}").time():
+                with urllib.request.urlopen(req, timeout=10) as resp:
+                    csv_data = resp.read().decode()
 
             for line in csv_data.strip().split("\n"):
                 if line.startswith(","):
@@ -103,27 +115,47 @@ def _enrich_with_light_data(config, sensors):
             )
 
     except Exception as e:
+        QUERY_FAILURES.labels(query="light_summary").inc()
         log.warning("Failed to fetch light data from InfluxDB: %s", e)
 
 
+def _add_sensor_stats(sensors, stats):
+    """Add 24h summaries from the ingested MQTT stats to the sensors dict."""
+    temp = (stats.get("temp_c") or {}).get("24h")
+    if temp:
+        sensors["temp_history"] = f"min {temp['min']}C, max {temp['max']}C, avg {temp['mean']}C"
+    light = stats.get("light_pct") or {}
+    if light.get("24h"):
+        sensors["light_pct"] = round(light["value"], 1)
+        summary = light["24h"]
+        sensors["light_history"] = (
+            f"min {round(summary['min'], 1)}%, max {round(summary['max'], 1)}%, "
+            f"avg {round(summary['mean'], 1)}%"
+        )
+
+
 def _build_prompt(plants, sensors, herbs, previous):
     """Build the analysis prompt with plant context."""
     plant_lines = []
-    for plant in plants:
-        age = get_plant_age(plant["planted_date"])
-        stage, progress = get_growth_stage(plant["species"], age)
+    for plant, forecast in zip(plants, get_index().forecast(plants, 30)):
         herb = herbs.get(plant["species"], {})
         harvest = herb.get("days_to_harvest", [60, 90])
-
-        plant_lines.append(
+        stages = forecast["stages"]
+        stage, progress = (stages[0]["stage"], stages[0]["progress_start"]) if stages else ("unknown", 0)
+        line = (
             f"- {plant['name']} ({herb.get('scientific_name', plant['species'])}): "
-            f"{plant['position']} position, {age} days old, {stage} stage ({progress}% through), "
+            f"{plant['position']} position, {forecast['age_days']} days old, {stage} stage ({progress}% through), "
             f"harvest expected at {harvest[0]}-{harvest[1]} days"
         )
+        if len(stages) > 1:
+            line += f", entering {stages[1]['stage']} stage around {stages[1]['start']}"
+        plant_lines.append(line)
 
     sensor_lines = []
     if sensors.get("temp_c") is not None:
         sensor_lines.append(f"- Water temp: {sensors['temp_c']}C")
+    if sensors.get("temp_history"):
+        sensor_lines.append(f"- Water temp 24h summary: {sensors['temp_history']}")
     if sensors.get("light_pct") is not None:
         sensor_lines.append(f"- Light level: {sensors['light_pct']}% (from TSL2561 sensor above grow lights)")
     if sensors.get("light_history"):
@@ -183,19 +215,26 @@ def analyze_plants(config, state):
         state: Shared state dict (reads mqtt_client for sensors, last_capture for photo).
 
     Returns:
-        Analysis dict, or None if failed.
+        Analysis dict, or None if skipped (no usable photo or no API key).
+
+    Raises:
+        RuntimeError: The API call failed or its response could not be parsed.
     """
     import anthropic
 
     # Get latest photo
     from capture import get_latest_photo
     photo_path = state.get("last_capture") or get_latest_photo(config)
+    if photo_path and catalog.is_flagged(catalog.get(config, photo_path)):
+        photo_path = get_latest_photo(config, usable_only=True)
     if not photo_path or not os.path.exists(photo_path):
+        ANALYSES.labels(result="skipped").inc()
         log.warning("No photo available for analysis")
         return None
 
     api_key = os.environ.get("ANTHROPIC_API_KEY")
     if not api_key:
+        ANALYSES.labels(result="skipped").inc()
         log.error("ANTHROPIC_API_KEY not set, skipping analysis")
         return None
 
@@ -206,9 +245,11 @@ def analyze_plants(config, state):
     mqtt = state.get("mqtt_client")
     if mqtt:
         sensors = mqtt.get_latest_sensor_data()
+        _add_sensor_stats(sensors, mqtt.get_sensor_stats())
 
-    # Fetch light sensor data from InfluxDB
-    _enrich_with_light_data(config, sensors)
+    # Light from InfluxDB when it isn't ingested over MQTT
+    if "light_history" not in sensors:
+        _enrich_with_light_data(config, sensors)
 
     # Load previous analysis for comparison
     previous = _load_previous_analysis(config)
@@ -217,38 +258,38 @@ def analyze_plants(config, state):
     prompt = _build_prompt(config["plants"], sensors, herbs, previous)
 
     # Read and encode photo
-    with open(photo_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode("utf-8")
+    image_data = base64.b64encode(photostore.read_jpeg(config, photo_path)).decode("utf-8")
 
     # Call Claude API
     try:
         client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": image_data,
+        with API_SECONDS.time():
+            response = client.messages.create(
+                model="claude-sonnet-4-5-20250929",
+                max_tokens=2000,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image",
+                                "source": {
+                                    "type": "base64",
+                                    "media_type": "image/jpeg",
+                                    "data": image_data,
+                                },
                             },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt,
-                        },
-                    ],
-                }
-            ],
-        )
+                            {
+                                "type": "text",
+                                "text": prompt,
+                            },
+                        ],
+                    }
+                ],
+            )
     except Exception as e:
-        log.error("Claude API call failed: %s", e)
-        return None
+        ANALYSES.labels(result="api_error").inc()
+        raise RuntimeError(f"Claude API call failed: {e}") from e
 
     # Parse response
     try:
@@ -259,9 +300,9 @@ def analyze_plants(config, state):
             text = "\n".join(lines[1:-1])
         analysis = json.loads(text)
     except (json.JSONDecodeError, IndexError) as e:
-        log.error("Failed to parse analysis response: %s", e)
+        ANALYSES.labels(result="parse_error").inc()
         log.debug("Raw response: %s", response.content[0].text if response.content else "empty")
-        return None
+        raise RuntimeError(f"Failed to parse analysis response: {e}") from e
 
     # Add metadata
     now = datetime.now()
@@ -278,7 +319,9 @@ def analyze_plants(config, state):
     analysis_path = os.path.join(analysis_dir, f"{today}_{time_str}.json")
     with open(analysis_path, "w") as f:
         json.dump(analysis, f, indent=2)
+    storage.update(config, analysis_path)
 
+    ANALYSES.labels(result="ok").inc()
     log.info("Analysis saved: %s (overall health: %s/5)", analysis_path,
              analysis.get("overall_health", "?"))
 
@@ -5,7 +5,9 @@ import logging
 import os
 import sys
 
+from alerts import AlertEngine
 from config import load_config
+from device import get_gateway
 from scheduler import start_scheduler
 from mqtt_client import MQTTClient
 from web import create_app
@@ -28,16 +30,26 @@ def main():
     }
 
     # Ensure storage directories exist
-    for key in ["photo_dir", "timelapse_dir", "analysis_dir"]:
+    for key in ["photo_dir", "timelapse_dir", "analysis_dir", "cache_dir", "state_dir", "archive_dir"]:
         os.makedirs(config["storage"][key], exist_ok=True)
     os.makedirs(os.path.join(config["storage"]["timelapse_dir"], "daily"), exist_ok=True)
     os.makedirs(os.path.join(config["storage"]["timelapse_dir"], "weekly"), exist_ok=True)
 
     # Start MQTT client
     mqtt = MQTTClient(config)
-    mqtt.start()
     state["mqtt_client"] = mqtt
 
+    # Threshold alerts on every sensor reading
+    if config["alerts"]["enabled"]:
+        engine = AlertEngine(config, state)
+        mqtt.ingest.add_listener(engine.observe)
+        state["alerts"] = engine
+
+    mqtt.start()
+
+    # Keep the device's LED state and temperature cached
+    get_gateway(config).start()
+
     # Start scheduler (capture, timelapse, analysis, cleanup)
     start_scheduler(config, state)
 
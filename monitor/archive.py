@@ -0,0 +1,319 @@
+"""Monthly photo packs: closed days packed into one file per month.
+
+archive/2026-02.pack holds the photo bytes of every packed day of the
+month back to back; archive/2026-02.idx.json maps each date and photo name
+to its offset and size, and names the pack file it describes (a repack
+writes a new generation, 2026-02.1.pack, and switches the index over).
+Reads memory-map the pack and slice one photo out, so nothing is ever
+unpacked to disk.
+
+Packed photos keep their usual path (photos/2026-02-08/<name>), which no
+longer exists on disk; photostore falls back to the archive for those.
+Removing a photo only drops it from the index; repack() rewrites a month
+once enough of it is dead space.
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+
+import metrics
+import photostore
+import storage
+
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+PACKED_DAYS = metrics.counter("ecogarden_archive_packed_days_total", "Photo days packed into archives")
+ARCHIVE_READS = metrics.counter("ecogarden_archive_reads_total", "Photos read from archive packs")
+
+_lock = threading.Lock()
+_indexes = {}  # idx path -> (mtime_ns, index)
+_maps = {}     # pack path -> ((size, mtime_ns), mmap)
+
+
+def _archive_dir(config):
+    return config["storage"]["archive_dir"]
+
+
+def _idx_path(config, month):
+    return os.path.join(_archive_dir(config), month + ".idx.json")
+
+
+def _pack_path(config, index):
+    return os.path.join(_archive_dir(config), index["pack"])
+
+
+def _empty_index(month):
+    return {"version": INDEX_VERSION, "month": month, "pack": month + ".pack",
+            "generation": 0, "length": 0, "dead_bytes": 0, "days": {}}
+
+
+def _load_index(idx_path):
+    """Index dict for a month (cached until the file changes), or None."""
+    try:
+        mtime = os.stat(idx_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _indexes.get(idx_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(idx_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION:
+        return None
+    _indexes[idx_path] = (mtime, index)
+    return index
+
+
+def _save_index(idx_path, index):
+    tmp_path = idx_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, idx_path)
+
+
+def _mapped(pack_path):
+    """Read-only mmap of a pack, remapped when the file changes."""
+    st = os.stat(pack_path)
+    key = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        cached = _maps.get(pack_path)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(pack_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Older maps are left to the GC: a reader may still be slicing one
+        _maps[pack_path] = (key, mm)
+        return mm
+
+
+def _day_entries(config, date_str):
+    if len(date_str) != 10:
+        return None, None
+    index = _load_index(_idx_path(config, date_str[:7]))
+    if not index:
+        return None, None
+    return index, index["days"].get(date_str)
+
+
+def packed_days(config):
+    """All dates that live in an archive pack."""
+    days = []
+    try:
+        names = os.listdir(_archive_dir(config))
+    except OSError:
+        return days
+    for name in names:
+        if name.endswith(".idx.json"):
+            index = _load_index(os.path.join(_archive_dir(config), name))
+            if index:
+                days.extend(d for d, entries in index["days"].items() if entries)
+    return sorted(days)
+
+
+def list_day(config, date_str):
+    """Photo paths of a packed day, in the same form as unpacked photos."""
+    entries = _day_entries(config, date_str)[1] or {}
+    day_dir = os.path.join(config["storage"]["photo_dir"], date_str)
+    return [os.path.join(day_dir, name) for name in sorted(entries)]
+
+
+def _find(config, path):
+    """(pack path, entry name, entry) for a packed photo path, or None."""
+    date_str = os.path.basename(os.path.dirname(path))
+    index, entries = _day_entries(config, date_str)
+    if not entries:
+        return None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name, entry in entries.items():
+        if os.path.splitext(name)[0] == stem:
+            return _pack_path(config, index), name, entry
+    return None
+
+
+def lookup(config, path):
+    """Stored name, mtime and size of a packed photo, or None."""
+    found = _find(config, path)
+    if not found:
+        return None
+    _, name, entry = found
+    return {"name": name, "mtime": entry["mtime"], "size": entry["size"]}
+
+
+def read(config, path):
+    """Bytes of a packed photo, sliced from the mmapped pack, or None."""
+    found = _find(config, path)
+    if not found:
+        return None
+    pack_path, _, entry = found
+    ARCHIVE_READS.inc()
+    mm = _mapped(pack_path)
+    return mm[entry["offset"]:entry["offset"] + entry["size"]]
+
+
+def _pack_month(config, month, days):
+    """Append whole days to a month's pack, then drop their directories."""
+    idx_path = _idx_path(config, month)
+    os.makedirs(_archive_dir(config), exist_ok=True)
+
+    with _lock:
+        index = _load_index(idx_path) or _empty_index(month)
+        index = json.loads(json.dumps(index))  # don't mutate the cached copy
+        pack_path = _pack_path(config, index)
+        added = []
+        with open(pack_path, "ab") as f:
+            # Drop bytes past the indexed length (an append that crashed)
+            f.truncate(index["length"])
+            f.seek(index["length"])
+            for date_str, day_dir in days:
+                if date_str in index["days"]:
+                    continue
+                entries = {}
+                for photo in photostore.list_photos(day_dir):
+                    st = os.stat(photo)
+                    with open(photo, "rb") as src:
+                        data = src.read()
+                    entries[os.path.basename(photo)] = {
+                        "offset": f.tell(), "size": len(data), "mtime": st.st_mtime,
+                    }
+                    f.write(data)
+                index["days"][date_str] = entries
+                added.append(date_str)
+            f.flush()
+            os.fsync(f.fileno())
+            index["length"] = f.tell()
+        _save_index(idx_path, index)
+
+    # Only once the index is durable do the loose files go, and only if
+    # every photo in the directory made it into the pack
+    for date_str, day_dir in days:
+        entries = index["days"].get(date_str)
+        if entries is None:
+            continue
+        loose = [os.path.basename(p) for p in photostore.list_photos(day_dir)]
+        if any(name not in entries for name in loose):
+            log.warning("Not removing %s: it has photos missing from %s", day_dir, index["pack"])
+            continue
+        shutil.rmtree(day_dir, ignore_errors=True)
+        storage.update(config, day_dir)
+    storage.update(config, pack_path)
+    PACKED_DAYS.inc(len(added))
+    return added
+
+
+def run_packing(config):
+    """Pack photo days older than archive.pack_after_days into monthly packs.
+
+    Returns:
+        Number of days packed.
+    """
+    horizon = date.today() - timedelta(days=config["storage"]["archive"]["pack_after_days"])
+    photo_dir = config["storage"]["photo_dir"]
+    by_month = {}
+    try:
+        names = sorted(os.listdir(photo_dir))
+    except OSError:
+        return 0
+    for name in names:
+        try:
+            day = datetime.strptime(name, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if day < horizon:
+            by_month.setdefault(name[:7], []).append((name, os.path.join(photo_dir, name)))
+
+    packed = 0
+    for month, days in sorted(by_month.items()):
+        added = _pack_month(config, month, days)
+        if added:
+            log.info("Packed %d days into %s.pack", len(added), month)
+        packed += len(added)
+        repack(config, month)
+    return packed
+
+
+def remove(config, path):
+    """Drop a packed photo from its index.
+
+    Returns:
+        Bytes released, or None if the photo is not packed.
+    """
+    date_str = os.path.basename(os.path.dirname(path))
+    idx_path = _idx_path(config, date_str[:7])
+    with _lock:
+        index = _load_index(idx_path)
+        if not index:
+            return None
+        index = json.loads(json.dumps(index))
+        pack_path = _pack_path(config, index)
+        entries = index["days"].get(date_str, {})
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = next((n for n in entries if os.path.splitext(n)[0] == stem), None)
+        if name is None:
+            return None
+        size = entries.pop(name)["size"]
+        if not entries:
+            del index["days"][date_str]
+        index["dead_bytes"] += size
+        _save_index(idx_path, index)
+    storage.update(config, pack_path)
+    return size
+
+
+def repack(config, month, force=False):
+    """Rewrite a month's pack without dead space once it passes the threshold.
+
+    The compacted pack is written as a new generation and the index is
+    switched to it atomically, so a crash at any point leaves a matching
+    index and pack.
+    """
+    idx_path = _idx_path(config, month)
+    threshold = config["storage"]["archive"]["repack_dead_ratio"]
+    with _lock:
+        index = _load_index(idx_path)
+        if not index or not index["length"]:
+            return False
+        if not force and index["dead_bytes"] / index["length"] < threshold:
+            return False
+
+        index = json.loads(json.dumps(index))
+        old_pack = _pack_path(config, index)
+        old_length = index["length"]
+        if not index["days"]:
+            os.remove(idx_path)
+            os.remove(old_pack)
+        else:
+            index["generation"] += 1
+            index["pack"] = f"{month}.{index['generation']}.pack"
+            with open(old_pack, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                with open(_pack_path(config, index), "wb") as out:
+                    for date_str in sorted(index["days"]):
+                        for entry in index["days"][date_str].values():
+                            data = mm[entry["offset"]:entry["offset"] + entry["size"]]
+                            entry["offset"] = out.tell()
+                            out.write(data)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    index["length"] = out.tell()
+            finally:
+                mm.close()
+            index["dead_bytes"] = 0
+            _save_index(idx_path, index)
+            os.remove(old_pack)
+        _maps.pop(old_pack, None)
+
+    storage.update(config, idx_path)
+    log.info("Repacked %s, reclaimed %.1f MB", month,
+             (old_length - index["length"] if index["days"] else old_length) / (1024 * 1024))
+    return True
@@ -0,0 +1,12 @@
+"""Benchmarks for the plant monitor.
+
+Run from the monitor directory:
+
+    python -m bench.run --days 365 --shots 32
+    python -m bench.run --days 365 --shots 32 --save-baseline
+    python -m bench.run --days 365 --shots 32 --compare
+
+synth builds a synthetic photo store (photos, analyses, timelapses);
+run times the storage helpers and the main Flask endpoints against it and
+reports throughput and latency percentiles.
+"""
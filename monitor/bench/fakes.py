@@ -0,0 +1,239 @@
+"""Local stand-ins for the EcoGarden device, MQTT broker and InfluxDB.
+
+Each fake runs on 127.0.0.1 in a background thread and can be pointed at
+by a normal config (device_ip "127.0.0.1:PORT", influxdb url), so the
+monitor code under test is unchanged.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+class _FakeServer:
+    """HTTP fake with injectable latency and failures.
+
+    Args:
+        latency_ms: Base delay added to every response.
+        jitter_ms: Uniform random extra delay on top of latency_ms.
+        failure_rate: Fraction of requests answered with a 503.
+        serial: Handle one request at a time, like the single-threaded
+            Mongoose server on the ESP8266.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0, serial=False, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.requests = Counter()
+        self.failures = Counter()
+        self._rng = random.Random(seed)
+        self._serial = threading.Lock() if serial else None
+        self._stats_lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Bind an ephemeral port and serve in a daemon thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._dispatch(self, "GET")
+
+            def do_POST(self):
+                fake._dispatch(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def _dispatch(self, handler, method):
+        path = handler.path.split("?", 1)[0]
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        with self._stats_lock:
+            self.requests[path] += 1
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            fail = self._rng.random() < self.failure_rate
+
+        if self._serial:
+            self._serial.acquire()
+        try:
+            time.sleep(delay / 1000.0)
+            if fail:
+                with self._stats_lock:
+                    self.failures[path] += 1
+                status, ctype, payload = 503, "application/json", b'{"error": "injected failure"}'
+            else:
+                status, ctype, payload = self.handle(method, path, body)
+        finally:
+            if self._serial:
+                self._serial.release()
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", ctype)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def handle(self, method, path, body):
+        """Return (status, content_type, payload bytes) for one request."""
+        raise NotImplementedError
+
+
+def _json(data, status=200):
+    return status, "application/json", json.dumps(data).encode()
+
+
+class FakeDevice(_FakeServer):
+    """The ESP8266 endpoints the monitor calls, with firmware-shaped replies.
+
+    Serial by default; feed_now holds the connection for pulse_ms like the
+    real GPIO pulse, which blocks every other request meanwhile.
+    """
+
+    def __init__(self, pulse_ms=2000, serial=True, **kwargs):
+        super().__init__(serial=serial, **kwargs)
+        self.pulse_ms = pulse_ms
+        self.led = False
+        self.brightness = 1.0
+        self.feeds = 0
+        self.temp_c = 22.0
+
+    def handle(self, method, path, body):
+        if path == "/hooks/water_temperature":
+            return _json({"value": round(self.temp_c + self._rng.uniform(-0.2, 0.2), 2)})
+        if path == "/rpc/LED.Get":
+            return _json({"state": self.led, "brightness": self.brightness})
+        if path == "/rpc/LED.Toggle":
+            self.led = not self.led
+            return _json({"ok": True, "state": self.led})
+        if path == "/rpc/LED.Set":
+            try:
+                self.led = bool(json.loads(body or b"{}")["state"])
+            except (ValueError, KeyError):
+                return _json({"error": "state is required"}, 400)
+            return _json({"ok": True, "state": self.led})
+        if path == "/hooks/feed_now":
+            time.sleep(self.pulse_ms / 1000.0)
+            self.feeds += 1
+            return _json({"ok": True, "pin": 1, "pulse_ms": self.pulse_ms})
+        return _json({"error": "not found"}, 404)
+
+
+class FakeInflux(_FakeServer):
+    """InfluxDB v2 write and Flux query endpoints.
+
+    Writes are counted and discarded; queries return an annotated CSV
+    series of `points` mean values, enough for the light-history parser.
+    """
+
+    def __init__(self, points=288, **kwargs):
+        super().__init__(**kwargs)
+        self.points = points
+        self.writes = 0
+        self.lines_written = 0
+
+    def handle(self, method, path, body):
+        if path == "/api/v2/write":
+            self.writes += 1
+            self.lines_written += body.count(b"\n") + 1 if body else 0
+            return 204, "application/json", b""
+        if path == "/api/v2/query":
+            return 200, "text/csv", self._csv()
+        if path in ("/ping", "/health"):
+            return _json({"status": "pass"})
+        return _json({"error": "not found"}, 404)
+
+    def _csv(self):
+        now = time.time()
+        rows = [
+            "#datatype,string,long,dateTime:RFC3339,double",
+            "#group,false,false,false,false",
+            "#default,mean,,,",
+            ",result,table,_time,_value",
+        ]
+        for i in range(self.points):
+            ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now - (self.points - i) * 300))
+            rows.append(f",,0,{ts},{self._rng.uniform(0, 1):.4f}")
+        return ("\r\n".join(rows) + "\r\n").encode()
+
+
+class SensorReplay:
+    """Feeds MQTTClient._on_message as if the broker delivered device events.
+
+    No broker or network is involved: messages are built in-process and
+    handed to the client's callback at `rate` messages per second, so the
+    ingest path and its locking are exercised at rates the real device
+    (one event per 5 s) never reaches.
+
+    Args:
+        mqtt_client: An MQTTClient (not started).
+        rate: Messages per second; 0 replays as fast as possible.
+        stream: Optional list of payload dicts to cycle through instead
+            of the generated sensor walk.
+    """
+
+    def __init__(self, mqtt_client, rate=100, stream=None, seed=0):
+        self.client = mqtt_client
+        self.rate = rate
+        self.stream = stream
+        self.sent = 0
+        self._rng = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _payloads(self):
+        if self.stream:
+            while True:
+                yield from self.stream
+        temp, lux = 22.0, 5000.0
+        while True:
+            temp = min(30.0, max(15.0, temp + self._rng.uniform(-0.05, 0.05)))
+            lux = min(20000.0, max(0.0, lux + self._rng.uniform(-200, 200)))
+            yield {"water_temperature": round(temp, 2), "lux": round(lux), "led": True, "brightness": 1.0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mqtt-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        topic = self.client.ecogarden_topic
+        interval = 1.0 / self.rate if self.rate else 0
+        next_at = time.monotonic()
+        for payload in self._payloads():
+            if self._stop.is_set():
+                return
+            msg = SimpleNamespace(topic=topic, payload=json.dumps(payload).encode())
+            self.client._on_message(self.client.client, None, msg)
+            self.sent += 1
+            if interval:
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,214 @@
+"""Drive many concurrent dashboard clients against the monitor.
+
+The app from create_app() is served by a threaded werkzeug server, with
+the device, InfluxDB and the MQTT feed replaced by the fakes in
+bench.fakes, and a small synthetic photo store behind it:
+
+    python -m bench.load --clients 50 --duration 30
+    python -m bench.load --clients 20 --device-latency 300 --device-failures 0.2
+"""
+
+import argparse
+import json
+import logging
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date
+
+from bench.fakes import FakeDevice, FakeInflux, SensorReplay
+from bench.run import percentile
+from bench.synth import generate_store
+
+# What an open dashboard tab requests, weighted by how often app.js polls
+# it (status and temp history every minute, latest photo every 5 minutes,
+# the rest on load or interaction)
+DASHBOARD_MIX = [
+    ("GET", "/api/status", 12),
+    ("GET", "/api/sensors/temp/history", 12),
+    ("GET", "/api/photos/latest", 3),
+    ("GET", "/api/light", 2),
+    ("GET", "/api/sensors/light/history?range=24h", 2),
+    ("GET", "/api/photos/{today}/sprite", 1),
+    ("GET", "/api/photos/{today}", 1),
+    ("GET", "/api/timelapse", 1),
+    ("GET", "/api/storage", 1),
+    ("GET", "/api/dates", 1),
+]
+
+
+class LoadResult:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.latencies[name].append(seconds * 1000)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, wall):
+        rows = {}
+        for name, samples in sorted(self.latencies.items()):
+            samples.sort()
+            rows[name] = {
+                "n": len(samples),
+                "rps": round(len(samples) / wall, 1),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(samples, 50), 1),
+                "p90_ms": round(percentile(samples, 90), 1),
+                "p99_ms": round(percentile(samples, 99), 1),
+                "max_ms": round(samples[-1], 1),
+            }
+        return rows
+
+
+def _client(base, mix, deadline, think_ms, result, seed):
+    rng = random.Random(seed)
+    paths = [(m, p) for m, p, _ in mix]
+    weights = [w for _, _, w in mix]
+    while time.monotonic() < deadline:
+        method, path = rng.choices(paths, weights)[0]
+        req = urllib.request.Request(base + path, method=method,
+                                     data=b"" if method == "POST" else None)
+        start = time.monotonic()
+        ok = True
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+        except urllib.error.HTTPError as e:
+            # 503 from the device routes is the expected degraded answer
+            ok = e.code < 500 or e.code == 503
+        except Exception:
+            ok = False
+        result.record(f"{method} {path.split('?')[0]}", time.monotonic() - start, ok)
+        if think_ms:
+            time.sleep(rng.uniform(0, 2 * think_ms) / 1000.0)
+
+
+def _influx_writer(config, interval, deadline):
+    from influxdb_writer import write_health_scores
+    analysis = {"plants": [{"name": p["name"], "health_score": 4} for p in config["plants"]],
+                "overall_health": 4}
+    while time.monotonic() < deadline:
+        write_health_scores(config, analysis)
+        time.sleep(interval)
+
+
+def run_load(args):
+    from mqtt_client import MQTTClient
+    from werkzeug.serving import make_server
+    from web import create_app
+
+    root = tempfile.mkdtemp(prefix="ecogarden-load-")
+    device = FakeDevice(latency_ms=args.device_latency, jitter_ms=args.device_jitter,
+                        failure_rate=args.device_failures, pulse_ms=args.feed_pulse_ms).start()
+    influx = FakeInflux(latency_ms=args.influx_latency).start()
+    replay = server = None
+    try:
+        config = generate_store(root, args.days, args.shots, resolution="640x360", link=True)
+        config["ecogarden"]["device_ip"] = device.address
+        config["influxdb"].update(url=f"http://{influx.address}", token="bench")
+
+        mqtt = MQTTClient(config)
+        state = {"mqtt_client": mqtt, "last_capture": None}
+        if args.mqtt_rate >= 0:
+            replay = SensorReplay(mqtt, rate=args.mqtt_rate).start()
+
+        server = make_server("127.0.0.1", 0, create_app(config, state), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        mix = [(m, p.format(today=date.today().isoformat()), w) for m, p, w in DASHBOARD_MIX]
+        if args.toggle_weight:
+            mix.append(("POST", "/api/light/toggle", args.toggle_weight))
+        if args.feed_weight:
+            mix.append(("POST", "/api/feed", args.feed_weight))
+
+        print(f"{args.clients} clients for {args.duration}s against {base} "
+              f"(device {device.address}, influx {influx.address})")
+        result = LoadResult()
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=_client, args=(base, mix, deadline, args.think_ms, result, i),
+                             daemon=True)
+            for i in range(args.clients)
+        ]
+        if args.influx_writes:
+            threads.append(threading.Thread(
+                target=_influx_writer, args=(config, 1.0 / args.influx_writes, deadline), daemon=True))
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.monotonic() - start
+
+        return {
+            "clients": args.clients,
+            "wall_s": round(wall, 1),
+            "endpoints": result.summary(wall),
+            "device": {"requests": dict(device.requests), "failures": dict(device.failures)},
+            "influx": {"requests": dict(influx.requests), "writes": influx.writes},
+            "mqtt_messages": replay.sent if replay else 0,
+        }
+    finally:
+        if replay:
+            replay.stop()
+        if server:
+            server.shutdown()
+        device.stop()
+        influx.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the monitor against local fakes")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--think-ms", type=float, default=50,
+                        help="Mean pause between a client's requests")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--shots", type=int, default=32)
+    parser.add_argument("--device-latency", type=float, default=80)
+    parser.add_argument("--device-jitter", type=float, default=40)
+    parser.add_argument("--device-failures", type=float, default=0.0)
+    parser.add_argument("--feed-pulse-ms", type=float, default=2000)
+    parser.add_argument("--influx-latency", type=float, default=20)
+    parser.add_argument("--influx-writes", type=float, default=0, help="Health-score writes per second")
+    parser.add_argument("--mqtt-rate", type=float, default=200,
+                        help="Replayed sensor messages per second (0 = unthrottled, -1 = off)")
+    parser.add_argument("--toggle-weight", type=int, default=0)
+    parser.add_argument("--feed-weight", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # Slow requests still land in the store's state/slow_requests.log
+    logging.getLogger("ecogarden.slow_requests").propagate = False
+    report = run_load(args)
+
+    print(f"{'endpoint':<36} {'n':>6} {'rps':>7} {'err':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, r in report["endpoints"].items():
+        print(f"{name:<36} {r['n']:>6} {r['rps']:>7} {r['errors']:>5} {r['p50_ms']:>8} "
+              f"{r['p90_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8}")
+    print(f"device requests: {sum(report['device']['requests'].values())} "
+          f"(failures injected: {sum(report['device']['failures'].values())}); "
+          f"influx requests: {sum(report['influx']['requests'].values())}; "
+          f"mqtt messages replayed: {report['mqtt_messages']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
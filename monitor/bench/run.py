@@ -0,0 +1,212 @@
+"""Time storage helpers and Flask endpoints against a synthetic store."""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.synth import generate_store
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+class FakeOutbox:
+    def depth(self):
+        return 0
+
+
+class FakeMQTT:
+    """Stands in for MQTTClient so /api/status never hits the network."""
+
+    outbox = FakeOutbox()
+
+    def get_latest_sensor_data(self):
+        return {"temp_c": 21.5, "lux": 5400}
+
+    def get_sensor_stats(self, name=None):
+        stats = {
+            "temp_c": {"value": 21.5, "timestamp": time.time(), "topic": "bench",
+                       "1h": {"count": 60, "min": 21.2, "max": 21.8, "mean": 21.5, "stddev": 0.1},
+                       "24h": {"count": 1440, "min": 20.4, "max": 22.6, "mean": 21.5, "stddev": 0.4}},
+        }
+        return stats.get(name) if name else stats
+
+    def is_connected(self):
+        return True
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def measure(fn, iterations, warmup=1):
+    """Call fn repeatedly and summarise latency (ms) and throughput."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    wall = time.perf_counter() - start
+    samples.sort()
+    return {
+        "n": iterations,
+        "ops_per_s": round(iterations / wall, 1) if wall > 0 else None,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p90_ms": round(percentile(samples, 90), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def _get(client, path):
+    def call():
+        resp = client.get(path)
+        if resp.status_code >= 500:
+            raise RuntimeError(f"{path} returned {resp.status_code}")
+        resp.get_data()
+    return call
+
+
+def run_benchmarks(config, iterations):
+    """Run every benchmark against the store described by config."""
+    from analyzer import _load_previous_analysis
+    from capture import get_latest_photo, get_photos_for_date
+    from cleanup import get_storage_stats, run_cleanup
+    from web import create_app
+
+    photo_dir = config["storage"]["photo_dir"]
+    dates = sorted(os.listdir(photo_dir))
+    latest_date = dates[-1]
+    state = {"mqtt_client": FakeMQTT(), "last_capture": None}
+    client = create_app(config, state).test_client()
+
+    results = {}
+
+    def bench(name, fn, n=iterations, warmup=1):
+        results[name] = measure(fn, n, warmup=warmup)
+        r = results[name]
+        print(f"  {name:<36} p50 {r['p50_ms']:>9.2f} ms  p90 {r['p90_ms']:>9.2f} ms  "
+              f"p99 {r['p99_ms']:>9.2f} ms  {r['ops_per_s']:>9} ops/s")
+
+    bench("get_latest_photo", lambda: get_latest_photo(config))
+    bench("get_photos_for_date", lambda: get_photos_for_date(config, latest_date))
+    bench("get_storage_stats", lambda: get_storage_stats(config), n=max(3, iterations // 10))
+    bench("_load_previous_analysis", lambda: _load_previous_analysis(config))
+
+    for path in ("/api/status", f"/api/photos/{latest_date}", "/api/photos/latest",
+                 "/api/storage", "/api/timelapse", "/api/dates", "/metrics"):
+        n = max(3, iterations // 10) if path == "/api/storage" else iterations
+        bench(f"GET {path.replace(latest_date, '<date>')}", _get(client, path), n=n)
+
+    # Cleanup deletes on its first pass; time that once, then the steady
+    # state where it only rescans the tree
+    bench("run_cleanup (first pass)", lambda: run_cleanup(config), n=1, warmup=0)
+    bench("run_cleanup (steady state)", lambda: run_cleanup(config), n=max(3, iterations // 10))
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return benchmarks whose p50 regressed by more than threshold."""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("p50_ms"):
+            continue
+        ratio = r["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["p50_ms"], r["p50_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plant monitor")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--shots", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--resolution", default="1280x720",
+                        help="Synthetic photo resolution (smaller generates faster)")
+    parser.add_argument("--store", help="Reuse/keep the store in this directory")
+    parser.add_argument("--link", action="store_true", help="Hard-link photos to templates")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed p50 slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    root = args.store or tempfile.mkdtemp(prefix="ecogarden-bench-")
+    scale = f"{args.days}x{args.shots}"
+
+    try:
+        from bench.synth import synth_config
+        if args.store and os.path.isdir(os.path.join(root, "photo")):
+            config = synth_config(root)
+            print(f"Reusing store at {root}")
+        else:
+            print(f"Generating {scale} store at {root} ...")
+            t0 = time.monotonic()
+            config = generate_store(root, args.days, args.shots,
+                                    resolution=args.resolution, link=args.link)
+            print(f"  done in {time.monotonic() - t0:.1f}s")
+
+        print(f"Benchmarks ({args.iterations} iterations):")
+        results = run_benchmarks(config, args.iterations)
+    finally:
+        if not args.store:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    status = 0
+    if args.compare:
+        baseline = baselines.get(scale, {}).get("results", {})
+        if not baseline:
+            print(f"No baseline for scale {scale} in {args.baseline}")
+        else:
+            regressions = compare(results, baseline, args.threshold)
+            for name, before, after, ratio in regressions:
+                print(f"REGRESSION {name}: p50 {before:.2f} -> {after:.2f} ms ({ratio:.2f}x)")
+            if regressions:
+                status = 1
+            else:
+                print("No regressions against baseline")
+
+    if args.save_baseline:
+        baselines[scale] = {
+            "saved": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baseline for {scale} to {args.baseline}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"scale": scale, "results": results}, f, indent=2)
+
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
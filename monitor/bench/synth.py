@@ -0,0 +1,174 @@
+"""Generate a synthetic photo store that looks like months of captures."""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+from config import load_config
+
+
+def _template_jpegs(count, resolution, quality, seed):
+    """Encode a few camera-like frames: a gradient scene plus sensor noise.
+
+    Real captures compress to a few hundred KB; pure noise would be several
+    MB and a flat image a few KB, so mix the two.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = (int(v) for v in resolution.split("x"))
+    y, x = np.mgrid[0:h, 0:w]
+    templates = []
+    for i in range(count):
+        base = np.stack([
+            (x / w) * 120 + 40 + i * 10,
+            (y / h) * 140 + 60,
+            ((x + y) / (w + h)) * 80 + 30,
+        ], axis=-1)
+        noise = rng.normal(0, 12, size=(h, w, 3))
+        frame = np.clip(base + noise, 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(frame).save(buf, format="JPEG", quality=quality)
+        templates.append(buf.getvalue())
+    return templates
+
+
+def synth_config(root):
+    """App config with every storage directory under root."""
+    config = load_config()
+    for key in ("photo_dir", "timelapse_dir", "analysis_dir", "cache_dir", "state_dir",
+                "archive_dir"):
+        config["storage"][key] = os.path.join(root, key.replace("_dir", ""))
+    return config
+
+
+def generate_store(root, days, shots, end=None, resolution="1920x1080", quality=85,
+                   timelapse_kb=3000, link=False, seed=0):
+    """Write a synthetic store of days x shots photos under root.
+
+    Photos follow the capture naming (photos/YYYY-MM-DD/YYYY-MM-DD_HH-MM.jpg)
+    with mtimes set to their capture time. Each day also gets two analysis
+    JSONs and a daily timelapse; each ISO week a weekly timelapse.
+
+    Args:
+        link: Hard-link photos to a few template files instead of copying,
+            for very large stores on small disks (sizes are still real, but
+            linked photos share the template's mtime).
+
+    Returns:
+        Config dict pointing at the store.
+    """
+    config = synth_config(root)
+    storage = config["storage"]
+    for key in ("photo_dir", "timelapse_dir", "analysis_dir", "cache_dir", "state_dir",
+                "archive_dir"):
+        os.makedirs(storage[key], exist_ok=True)
+    for kind in ("daily", "weekly"):
+        os.makedirs(os.path.join(storage["timelapse_dir"], kind), exist_ok=True)
+
+    rng = random.Random(seed)
+    templates = _template_jpegs(4, resolution, quality, seed)
+    template_paths = []
+    if link:
+        tdir = os.path.join(root, ".templates")
+        os.makedirs(tdir, exist_ok=True)
+        for i, data in enumerate(templates):
+            path = os.path.join(tdir, f"t{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(data)
+            template_paths.append(path)
+
+    end = end or date.today()
+    start_hour = config["capture"]["start_hour"]
+    span = (config["capture"]["end_hour"] - start_hour) * 60
+    step = max(1, span // shots)
+    weeks = set()
+
+    for d in range(days):
+        day = end - timedelta(days=days - 1 - d)
+        date_str = day.strftime("%Y-%m-%d")
+        day_dir = os.path.join(storage["photo_dir"], date_str)
+        os.makedirs(day_dir, exist_ok=True)
+
+        for s in range(shots):
+            minute = start_hour * 60 + s * step
+            taken = datetime(day.year, day.month, day.day, minute // 60, minute % 60)
+            path = os.path.join(day_dir, taken.strftime("%Y-%m-%d_%H-%M") + ".jpg")
+            t = rng.randrange(len(templates))
+            if link:
+                os.link(template_paths[t], path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(templates[t])
+                ts = taken.timestamp()
+                os.utime(path, (ts, ts))
+
+        for hhmm in config["analysis"]["times"]:
+            name = f"{date_str}_{hhmm.replace(':', '-')}.json"
+            with open(os.path.join(storage["analysis_dir"], name), "w") as f:
+                json.dump(_fake_analysis(config, date_str, hhmm, rng), f)
+
+        _write_blob(os.path.join(storage["timelapse_dir"], "daily", f"{date_str}.mp4"),
+                    timelapse_kb * 1024, rng)
+        weeks.add(day.isocalendar()[:2])
+
+    for year, week in weeks:
+        _write_blob(os.path.join(storage["timelapse_dir"], "weekly", f"{year}-W{week:02d}.mp4"),
+                    timelapse_kb * 1024 // 2, rng)
+
+    return config
+
+
+def _write_blob(path, size, rng):
+    with open(path, "wb") as f:
+        f.write(rng.randbytes(size))
+
+
+def _fake_analysis(config, date_str, hhmm, rng):
+    return {
+        "plants": [
+            {
+                "name": p["name"],
+                "observed_stage": "vegetative",
+                "health_score": rng.randint(3, 5),
+                "observations": "Synthetic observation text for benchmarking.",
+                "concerns": "",
+                "days_to_harvest": rng.randint(5, 40),
+            }
+            for p in config["plants"]
+        ],
+        "overall_health": rng.randint(3, 5),
+        "summary": "Synthetic analysis.",
+        "alerts": [],
+        "date": date_str,
+        "time": hhmm,
+        "photo": f"{date_str}_12-00.jpg",
+        "sensors": {"temp_c": 21.5},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic photo store")
+    parser.add_argument("root", help="Directory to create the store in")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--shots", type=int, default=32, help="Photos per day")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--link", action="store_true", help="Hard-link photos to templates")
+    parser.add_argument("--clean", action="store_true", help="Delete root first")
+    args = parser.parse_args()
+
+    if args.clean and os.path.isdir(args.root):
+        shutil.rmtree(args.root)
+    start = time.monotonic()
+    generate_store(args.root, args.days, args.shots, resolution=args.resolution, link=args.link)
+    print(f"Generated {args.days} days x {args.shots} photos in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,63 @@ import logging
 import os
 import shutil
 import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 
+import catalog
+import events
+import imaging
+import metrics
+import photostore
+import storage
+
 log = logging.getLogger(__name__)
 
+CAPTURE_SECONDS = metrics.histogram(
+    "ecogarden_capture_seconds", "Camera capture time, excluding post-processing", ["backend"])
+CAPTURE_FAILURES = metrics.counter(
+    "ecogarden_capture_failures_total", "Failed capture attempts", ["backend"])
+POSTPROCESS_SECONDS = metrics.histogram(
+    "ecogarden_capture_postprocess_seconds", "Rotation and timestamp overlay time")
+QUALITY_REJECTS = metrics.counter(
+    "ecogarden_capture_quality_rejects_total", "Kept captures that failed the quality gate", ["issue"])
+QUALITY_RETRIES = metrics.counter(
+    "ecogarden_capture_quality_retries_total", "Captures retaken after failing the quality gate")
+DUPLICATES = metrics.counter(
+    "ecogarden_capture_duplicates_total", "Captures matching the previous frame", ["policy"])
+CAPTURE_REQUESTS = metrics.counter(
+    "ecogarden_capture_requests_total", "Manual capture requests", ["result"])
+
+MAX_JOBS_KEPT = 50
+
+# One camera open at a time: scheduled and manual captures queue here
+_camera_lock = threading.Lock()
+
 
 def capture_photo(config):
-    """Capture a photo from the USB camera. Returns the saved file path."""
+    """Capture a photo from the USB camera.
+
+    Frames failing the quality gate are retaken up to
+    capture.quality_gate.retries times; a frame that still fails is kept
+    but tagged in the catalog, so timelapses and analysis skip it.
+
+    Returns:
+        The saved file path, or None on failure. A capture dropped as a
+        duplicate (capture.dedup.policy "drop") returns the earlier photo
+        it matched.
+    """
+    with _camera_lock:
+        return _capture_photo(config)
+
+
+def _capture_photo(config):
+    previous = get_latest_photo(config)
     now = datetime.now()
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%Y-%m-%d_%H-%M")
@@ -19,86 +67,286 @@ def capture_photo(config):
     os.makedirs(photo_dir, exist_ok=True)
     filepath = os.path.join(photo_dir, f"{time_str}.jpg")
 
+    gate = config["capture"]["quality_gate"]
+    for attempt in range(gate["retries"] + 1):
+        backend = _grab(config, filepath)
+        if backend is None:
+            return None
+        fields = imaging.run(config, _check_quality, filepath, gate, reserved=True)
+        if not fields.get("quality") or attempt == gate["retries"]:
+            break
+        QUALITY_RETRIES.inc()
+        log.info("Capture %s looks %s, retaking in %ds", os.path.basename(filepath),
+                 "/".join(fields["quality"]), gate["retry_delay_seconds"])
+        time.sleep(gate["retry_delay_seconds"])
+
+    for issue in fields.get("quality", []):
+        QUALITY_REJECTS.labels(issue=issue).inc()
+    digest = _postprocess(filepath, config)
+    kept = _dedupe(config, filepath, previous, digest, **fields)
+    if kept != filepath:
+        return kept
+    storage.update(config, filepath)
+    log.info("Captured photo (%s): %s", backend, filepath)
+    return filepath
+
+
+def _grab(config, filepath):
+    """Write one camera frame to filepath.
+
+    Returns:
+        Name of the backend that took the frame, or None on failure.
+    """
     resolution = config["capture"].get("resolution", "1920x1080")
     quality = config["capture"].get("quality", 85)
 
     # Primary: fswebcam (Linux/Pi)
     if shutil.which("fswebcam"):
         try:
-            subprocess.run(
-                [
-                    "fswebcam",
-                    "-r", resolution,
-                    "--jpeg", str(quality),
-                    "--no-banner",
-                    "-S", "10",  # skip first 10 frames for auto-exposure
-                    filepath,
-                ],
-                capture_output=True,
-                check=True,
-                timeout=30,
-            )
-            _rotate_if_needed(filepath, config)
-            _add_timestamp(filepath)
-            log.info("Captured photo: %s", filepath)
-            return filepath
+            with CAPTURE_SECONDS.labels(backend="fswebcam").time():
+                subprocess.run(
+                    [
+                        "fswebcam",
+                        "-r", resolution,
+                        "--jpeg", str(quality),
+                        "--no-banner",
+                        "-S", "10",  # skip first 10 frames for auto-exposure
+                        filepath,
+                    ],
+                    capture_output=True,
+                    check=True,
+                    timeout=30,
+                )
+            return "fswebcam"
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            CAPTURE_FAILURES.labels(backend="fswebcam").inc()
             log.warning("fswebcam failed: %s, trying OpenCV", e)
 
     # Fallback: OpenCV (Mac dev / if fswebcam unavailable)
     try:
         import cv2
 
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            log.error("Cannot open camera")
-            return None
+        with CAPTURE_SECONDS.labels(backend="opencv").time():
+            cap = cv2.VideoCapture(0)
+            if not cap.isOpened():
+                CAPTURE_FAILURES.labels(backend="opencv").inc()
+                log.error("Cannot open camera")
+                return None
 
-        # Set resolution
-        w, h = resolution.split("x")
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, int(w))
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(h))
+            # Set resolution
+            w, h = resolution.split("x")
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, int(w))
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(h))
 
-        # Skip frames for auto-exposure
-        for _ in range(10):
-            cap.read()
+            # Skip frames for auto-exposure
+            for _ in range(10):
+                cap.read()
 
-        ret, frame = cap.read()
-        cap.release()
+            ret, frame = cap.read()
+            cap.release()
 
         if not ret:
+            CAPTURE_FAILURES.labels(backend="opencv").inc()
             log.error("Failed to read frame from camera")
             return None
 
         params = [cv2.IMWRITE_JPEG_QUALITY, quality]
         cv2.imwrite(filepath, frame, params)
-        _rotate_if_needed(filepath, config)
-        _add_timestamp(filepath)
-        log.info("Captured photo (OpenCV): %s", filepath)
-        return filepath
+        return "opencv"
 
     except ImportError:
         log.error("No camera backend available (fswebcam or OpenCV)")
         return None
 
 
-def _rotate_if_needed(filepath, config):
-    """Rotate photo if rotation is configured."""
-    rotation = config["capture"].get("rotation", 0)
-    if rotation == 0:
-        return
+def _check_quality(filepath, gate):
+    """Exposure and sharpness of a raw frame, with any issues found.
+
+    Works on a grayscale copy analysis_width pixels wide, so thresholds
+    don't depend on the capture resolution. Runs before the timestamp
+    overlay, whose text would read as detail.
+
+    Returns:
+        Catalog fields: luminance (mean, 0-255), clipped (share of blown
+        highlights), crushed (share of black shadows), sharpness (variance
+        of the Laplacian) and, if any check failed, quality: a list of
+        "dark", "overexposed" and "blurred".
+    """
+    if not gate["enabled"]:
+        return {}
+    try:
+        with Image.open(filepath) as img:
+            width = gate["analysis_width"]
+            height = max(1, round(img.height * width / img.width))
+            img.draft("L", (width, height))
+            gray = np.asarray(img.convert("L").resize((width, height), Image.BILINEAR),
+                              dtype=np.float32)
+    except OSError as e:
+        log.warning("Could not check quality of %s: %s", filepath, e)
+        return {}
+
+    luminance = float(gray.mean())
+    # Counted apart: a dark tank or cabinet behind the plants is not overexposure
+    clipped = float(np.count_nonzero(gray >= 250)) / gray.size
+    crushed = float(np.count_nonzero(gray <= 5)) / gray.size
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    sharpness = float(laplacian.var())
+
+    issues = []
+    if luminance < gate["min_luminance"] or crushed > gate["max_crushed_ratio"]:
+        issues.append("dark")
+    elif luminance > gate["max_luminance"] or clipped > gate["max_clipped_ratio"]:
+        issues.append("overexposed")
+    if sharpness < gate["min_sharpness"] and "dark" not in issues:
+        # A dark frame has no detail to measure; it is already rejected
+        issues.append("blurred")
+
+    fields = {"luminance": round(luminance, 1), "clipped": round(clipped, 3),
+              "crushed": round(crushed, 3), "sharpness": round(sharpness, 1)}
+    if issues:
+        fields["quality"] = issues
+    return fields
+
+
+def _postprocess(filepath, config):
+    """Rotate and stamp a freshly captured photo, in the image pool.
+
+    Returns:
+        dHash of the finished photo, or None if it could not be read.
+    """
+    with POSTPROCESS_SECONDS.time():
+        return imaging.run(config, _finish_frame, filepath, config["capture"].get("rotation", 0),
+                           config["capture"]["dedup"]["hash_size"], reserved=True)
+
+
+def _finish_frame(filepath, rotation, hash_size):
+    """Worker: rotate, stamp and re-save a frame in one decode/encode."""
     try:
         img = Image.open(filepath)
-        img = img.rotate(rotation, expand=True)
-        img.save(filepath, quality=85)
+        img.load()
+    except OSError as e:
+        log.warning("Failed to open %s for post-processing: %s", filepath, e)
+        return None
+    img = _rotate_if_needed(img, rotation)
+    img = _add_timestamp(img)
+    try:
+        img.save(filepath, format="JPEG", quality=85)
+    except OSError as e:
+        log.warning("Failed to save post-processed photo: %s", e)
+    return _dhash(img, hash_size)
+
+
+def _dhash(img, size):
+    """Difference hash: one bit per horizontally adjacent pixel pair."""
+    img.draft("L", ((size + 1) * 4, size * 4))
+    small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = small.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return format(bits, f"0{size * size // 4}x")
+
+
+def _hash_photo(config, path, size):
+    """Worker: dHash of a stored photo in any tier, or None."""
+    try:
+        with photostore.open_image(config, path) as img:
+            return _dhash(img, size)
+    except OSError:
+        return None
+
+
+def _taken_at(name):
+    try:
+        return datetime.strptime(os.path.splitext(name)[0], "%Y-%m-%d_%H-%M")
+    except ValueError:
+        return None
+
+
+def _previous_hash(config, previous, size):
+    """(dhash, catalog entry) of the previous frame, hashing it if needed."""
+    entry = catalog.get(config, previous)
+    if len(entry.get("dhash", "")) == size * size // 4:
+        return entry["dhash"], entry
+    return imaging.run(config, _hash_photo, config, previous, size, reserved=True), entry
+
+
+def _shrink(filepath, dedup):
+    """Worker: replace a photo with a small JPEG thumbnail of itself."""
+    size = tuple(int(v) for v in dedup["thumbnail_resolution"].split("x"))
+    tmp_path = os.path.join(os.path.dirname(filepath), "." + os.path.basename(filepath) + ".tmp")
+    with Image.open(filepath) as img:
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.LANCZOS)
+        img.save(tmp_path, format="JPEG", quality=dedup["thumbnail_quality"])
+    os.replace(tmp_path, filepath)
+
+
+def _dedupe(config, filepath, previous, digest, **fields):
+    """Apply capture.dedup.policy if a new capture repeats the last frame.
+
+    Extra fields are recorded in the catalog along with the hash.
+
+    A frame is a duplicate when its dHash is within threshold bits of the
+    previous frame's and the run of duplicates started less than
+    keep_every_minutes ago, so a static scene still keeps one frame per
+    interval. The catalog records the hash of every capture and, for
+    duplicates, the first frame of the run.
+
+    Returns:
+        filepath, or previous if the capture was dropped.
+    """
+    dedup = config["capture"]["dedup"]
+    size = dedup["hash_size"]
+    if digest is None:
+        catalog.put(config, filepath, fields)
+        return filepath
+
+    fields["dhash"] = digest
+    if (dedup["enabled"] and previous
+            and photostore.logical_name(previous) != photostore.logical_name(filepath)):
+        prev_hash, prev_entry = _previous_hash(config, previous, size)
+        original = prev_entry.get("duplicate_of") or photostore.logical_name(previous)
+        start, now = _taken_at(original), _taken_at(os.path.basename(filepath))
+        if (prev_hash is not None and start and now
+                and 0 <= (now - start).total_seconds() < dedup["keep_every_minutes"] * 60):
+            distance = bin(int(digest, 16) ^ int(prev_hash, 16)).count("1")
+            if distance <= dedup["threshold"]:
+                policy = dedup["policy"]
+                DUPLICATES.labels(policy=policy).inc()
+                if policy == "drop":
+                    os.remove(filepath)
+                    log.info("Dropped capture %s: duplicate of %s (distance %d)",
+                             os.path.basename(filepath), original, distance)
+                    return previous
+                if policy == "thumbnail":
+                    imaging.run(config, _shrink, filepath, dedup, reserved=True)
+                    fields["thumbnail"] = True
+                fields.update(duplicate_of=original, distance=distance)
+                log.info("Capture %s duplicates %s (distance %d, %s)",
+                         os.path.basename(filepath), original, distance, policy)
+    catalog.put(config, filepath, fields)
+    return filepath
+
+
+def _rotate_if_needed(img, rotation):
+    """Rotate image if rotation is configured."""
+    if rotation == 0:
+        return img
+    try:
+        return img.rotate(rotation, expand=True)
     except Exception as e:
         log.warning("Failed to rotate photo: %s", e)
+        return img
 
 
-def _add_timestamp(filepath):
-    """Add timestamp overlay to bottom-right of photo."""
+def _add_timestamp(img):
+    """Add timestamp overlay to bottom-right of image."""
     try:
-        img = Image.open(filepath)
         draw = ImageDraw.Draw(img)
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -127,14 +375,17 @@ def _add_timestamp(filepath):
                     draw.text((x + dx, y + dy), timestamp, fill="black", font=font)
         # White text
         draw.text((x, y), timestamp, fill="white", font=font)
-
-        img.save(filepath, quality=85)
     except Exception as e:
         log.warning("Failed to add timestamp overlay: %s", e)
+    return img
+
 
+def get_latest_photo(config, usable_only=False):
+    """Return the path to the most recent photo, or None.
 
-def get_latest_photo(config):
-    """Return the path to the most recent photo, or None."""
+    With usable_only, photos flagged in the catalog (e.g. duplicates) are
+    passed over.
+    """
     photo_dir = config["storage"]["photo_dir"]
     if not os.path.isdir(photo_dir):
         return None
@@ -145,23 +396,94 @@ def get_latest_photo(config):
         reverse=True,
     )
     for date_dir in dates:
-        full_dir = os.path.join(photo_dir, date_dir)
-        photos = sorted(
-            [f for f in os.listdir(full_dir) if f.endswith(".jpg")],
-            reverse=True,
-        )
+        photos = photostore.list_photos(os.path.join(photo_dir, date_dir))
+        if usable_only:
+            photos = catalog.usable(config, photos)
         if photos:
-            return os.path.join(full_dir, photos[0])
+            return photos[-1]
     return None
 
 
 def get_photos_for_date(config, date_str):
-    """Return sorted list of photo paths for a given date (YYYY-MM-DD)."""
+    """Return sorted list of photo paths for a given date (YYYY-MM-DD).
+
+    Paths are the files on disk, so older days may list compact-tier
+    .webp/.avif files; use photostore.logical_name() for URLs. Days packed
+    into an archive list paths that no longer exist on disk; read those
+    with photostore.read_bytes()/open_image().
+    """
     date_dir = os.path.join(config["storage"]["photo_dir"], date_str)
     if not os.path.isdir(date_dir):
-        return []
-    return sorted(
-        os.path.join(date_dir, f)
-        for f in os.listdir(date_dir)
-        if f.endswith(".jpg")
-    )
+        # Packed days list paths that only photostore's readers can open
+        import archive
+        return archive.list_day(config, date_str)
+    return photostore.list_photos(date_dir)
+
+
+class CaptureJobs:
+    """Manual capture requests, run off the request thread and coalesced.
+
+    A request arriving within capture.coalesce_seconds of the newest job
+    (and that job hasn't failed) joins it instead of starting another
+    capture. Job updates are published as "capture" events.
+    """
+
+    def __init__(self, config, state):
+        self.config = config
+        self.state = state
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # id -> job, oldest first
+
+    def request(self):
+        """Queue a capture, or join one requested moments ago.
+
+        Returns:
+            Snapshot of the job dict.
+        """
+        now = time.time()
+        with self._lock:
+            newest = next(reversed(self._jobs.values()), None)
+            if (newest and newest["status"] != "failed"
+                    and now - newest["requested"] <= self.config["capture"]["coalesce_seconds"]):
+                newest["coalesced"] += 1
+                CAPTURE_REQUESTS.labels(result="coalesced").inc()
+                return dict(newest)
+            job = {"id": uuid.uuid4().hex[:12], "status": "queued", "requested": now,
+                   "coalesced": 1, "filename": None, "url": None, "error": None}
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+            snapshot = dict(job)
+        CAPTURE_REQUESTS.labels(result="queued").inc()
+        events.publish("capture", snapshot)
+        threading.Thread(target=self._run, args=(job,), name=f"capture-{job['id']}",
+                         daemon=True).start()
+        return snapshot
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+            snapshot = dict(job)
+        events.publish("capture", snapshot)
+
+    def _run(self, job):
+        self._update(job, status="running")
+        try:
+            path = capture_photo(self.config)
+        except Exception as e:
+            log.exception("Manual capture failed")
+            self._update(job, status="failed", error=str(e))
+            return
+        if not path:
+            self._update(job, status="failed", error="Capture failed")
+            return
+        self.state["last_capture"] = path
+        date_str = os.path.basename(os.path.dirname(path))
+        name = photostore.logical_name(path)
+        self._update(job, status="done", filename=name, url=f"/photos/{date_str}/{name}")
@@ -0,0 +1,109 @@
+"""Per-photo metadata that doesn't belong in the image file.
+
+state/catalog/2026-02-08.json maps each photo's capture name to a small
+dict, for example:
+
+    "2026-02-08_12-30.jpg": {"dhash": "3c3e...", "duplicate_of": "2026-02-08_12-00.jpg"}
+    "2026-02-08_21-30.jpg": {"dhash": "...", "luminance": 12.4, "quality": ["dark"]}
+
+Entries are keyed by the logical .jpg name and kept outside the photo
+tree, so they survive transcoding and packing. Selection code (timelapse
+frames, the photo sent for analysis) uses usable() to skip flagged photos.
+"""
+
+import json
+import os
+import threading
+
+import photostore
+
+_lock = threading.Lock()
+_days = {}  # catalog path -> (mtime_ns, entries)
+
+
+def _day_path(config, date_str):
+    return os.path.join(config["storage"]["state_dir"], "catalog", date_str + ".json")
+
+
+def _split(photo_path):
+    """(date, logical name) of a photo path."""
+    return os.path.basename(os.path.dirname(photo_path)), photostore.logical_name(photo_path)
+
+
+def _save_day(path, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entries, f)
+    os.replace(tmp_path, path)
+
+
+def get_day(config, date_str):
+    """All entries of a day, by logical name (cached until the file changes).
+
+    The returned dict is shared; treat it as read-only.
+    """
+    path = _day_path(config, date_str)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _days.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    _days[path] = (mtime, entries)
+    return entries
+
+
+def get(config, photo_path):
+    """Entry of one photo, or an empty dict."""
+    date_str, name = _split(photo_path)
+    return get_day(config, date_str).get(name, {})
+
+
+def tag(config, photo_path, **fields):
+    """Merge fields into a photo's entry; a None value removes the field."""
+    date_str, name = _split(photo_path)
+    path = _day_path(config, date_str)
+    with _lock:
+        entries = dict(get_day(config, date_str))
+        entry = dict(entries.get(name, {}))
+        for key, value in fields.items():
+            if value is None:
+                entry.pop(key, None)
+            else:
+                entry[key] = value
+        if entry:
+            entries[name] = entry
+        else:
+            entries.pop(name, None)
+        _save_day(path, entries)
+
+
+def put(config, photo_path, entry):
+    """Replace a photo's entry, e.g. for a fresh capture under the same name."""
+    date_str, name = _split(photo_path)
+    with _lock:
+        entries = dict(get_day(config, date_str))
+        entries[name] = entry
+        _save_day(_day_path(config, date_str), entries)
+
+
+def is_flagged(entry):
+    """Whether a catalog entry marks its photo as unfit for selection."""
+    return bool(entry.get("duplicate_of") or entry.get("quality"))
+
+
+def usable(config, photos):
+    """The photos (paths) not flagged in the catalog, in the same order."""
+    kept = []
+    for path in photos:
+        date_str, name = _split(path)
+        if not is_flagged(get_day(config, date_str).get(name, {})):
+            kept.append(path)
+    return kept
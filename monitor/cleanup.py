@@ -1,137 +1,354 @@
+"""Retention cleanup: thin photo days past retention_days to their noon shot.
+
+A run first builds a plan from a single scan of the photo tree (and the
+archive indexes), then deletes it in parallel per-day batches. The plan is
+written to state/cleanup_journal.json before anything is deleted and every
+finished day is recorded in it, so a run interrupted half-way is completed
+by the next one instead of leaving days half-cleaned.
+
+    python cleanup.py --dry-run     # print the plan, change nothing
+"""
+
+import argparse
+import json
 import logging
 import os
-import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 
+import metrics
+import photostore
+import storage
+
 log = logging.getLogger(__name__)
 
+JOURNAL_VERSION = 1
+MB = 1024 * 1024
 
-def run_cleanup(config):
-    """Delete photos older than retention period, keeping noon shots as archive."""
-    retention_days = config["storage"].get("retention_days", 30)
-    photo_dir = config["storage"]["photo_dir"]
+CLEANUP_SECONDS = metrics.histogram("ecogarden_cleanup_seconds", "Storage cleanup run time")
+CLEANUP_DELETED = metrics.counter("ecogarden_cleanup_deleted_photos_total", "Photos removed by cleanup")
+CLEANUP_FREED = metrics.counter("ecogarden_cleanup_freed_bytes_total", "Bytes freed by cleanup")
+CLEANUP_ERRORS = metrics.counter("ecogarden_cleanup_errors_total", "Files cleanup failed to remove")
 
-    if not os.path.isdir(photo_dir):
-        return
 
-    cutoff = date.today() - timedelta(days=retention_days)
-    cleaned_count = 0
-    kept_count = 0
+def _journal_path(config):
+    return os.path.join(config["storage"]["state_dir"], "cleanup_journal.json")
 
-    for date_dir_name in os.listdir(photo_dir):
-        date_path = os.path.join(photo_dir, date_dir_name)
-        if not os.path.isdir(date_path):
-            continue
 
+def _load_journal(config):
+    try:
+        with open(_journal_path(config)) as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if journal.get("version") != JOURNAL_VERSION:
+        return None
+    return journal
+
+
+def _save_journal(config, journal):
+    path = _journal_path(config)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(journal, f)
+    os.replace(tmp_path, path)
+
+
+def _plan_loose_day(date_str, day_dir):
+    """Plan entry for an on-disk day directory, from one scandir pass."""
+    files = []
+    with os.scandir(day_dir) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                files.append((entry.name, entry.stat(follow_symlinks=False).st_size))
+    keep = photostore.find_noon_photo([name for name, _ in files])
+    # A half-transcoded noon shot exists twice; tiering settles which stays
+    keep_stem = os.path.splitext(keep)[0] if keep else None
+    delete = [[name, size] for name, size in sorted(files)
+              if os.path.splitext(name)[0] != keep_stem]
+    return {"date": date_str, "packed": False, "keep": keep, "delete": delete,
+            "rmdir": keep is None}
+
+
+def _plan_packed_day(config, date_str):
+    """Plan entry for a day that lives in an archive pack.
+
+    Packed days are normally thinned before packing; this catches up when
+    retention_days is lowered later.
+    """
+    import archive
+    names = [os.path.basename(p) for p in archive.list_day(config, date_str)]
+    keep = photostore.find_noon_photo(names)
+    delete = []
+    for name in names:
+        if name != keep:
+            entry = archive.lookup(config, os.path.join(config["storage"]["photo_dir"], date_str, name))
+            delete.append([name, entry["size"] if entry else 0])
+    return {"date": date_str, "packed": True, "keep": keep, "delete": delete, "rmdir": False}
+
+
+def build_plan(config):
+    """Scan once and list everything a cleanup run would delete.
+
+    Returns:
+        Plan dict: the cutoff date and one entry per day with photos to
+        delete (name and size), the photo kept and whether the directory
+        goes too. Days that are already thinned are left out.
+    """
+    cutoff = date.today() - timedelta(days=config["storage"].get("retention_days", 30))
+    photo_dir = config["storage"]["photo_dir"]
+    days = []
+    try:
+        with os.scandir(photo_dir) as it:
+            dirs = sorted((e.name, e.path) for e in it if e.is_dir(follow_symlinks=False))
+    except OSError:
+        dirs = []
+    for name, path in dirs:
         try:
-            dir_date = datetime.strptime(date_dir_name, "%Y-%m-%d").date()
+            day = datetime.strptime(name, "%Y-%m-%d").date()
         except ValueError:
             continue
+        if day >= cutoff:
+            continue
+        entry = _plan_loose_day(name, path)
+        if entry["delete"] or entry["rmdir"]:
+            days.append(entry)
+
+    import archive
+    for date_str in archive.packed_days(config):
+        if date_str < cutoff.isoformat():
+            entry = _plan_packed_day(config, date_str)
+            if entry["delete"]:
+                days.append(entry)
+
+    return {"version": JOURNAL_VERSION, "cutoff": cutoff.isoformat(),
+            "created": datetime.now().isoformat(timespec="seconds"), "days": days, "done": []}
 
-        if dir_date >= cutoff:
+
+def _apply_day(config, entry):
+    """Delete one planned day. Missing files count as already deleted.
+
+    Returns:
+        (photos deleted, bytes freed, errors)
+    """
+    from timelapse import invalidate_timelapses
+    day_dir = os.path.join(config["storage"]["photo_dir"], entry["date"])
+    deleted = freed = errors = 0
+    for name, size in entry["delete"]:
+        path = os.path.join(day_dir, name)
+        try:
+            if entry["packed"]:
+                import archive
+                if archive.remove(config, path) is None:
+                    continue
+            else:
+                os.remove(path)
+        except FileNotFoundError:
             continue
+        except OSError as e:
+            log.warning("Cleanup could not remove %s: %s", path, e)
+            errors += 1
+            continue
+        deleted += 1
+        freed += size
+
+    if entry["rmdir"]:
+        try:
+            os.rmdir(day_dir)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Something new landed in the directory; leave it for next time
+            log.warning("Cleanup could not remove %s: %s", day_dir, e)
+    if not entry["packed"]:
+        storage.update(config, day_dir)
+    if deleted:
+        invalidate_timelapses(config, entry["date"])
+    return deleted, freed, errors
 
-        # Find the noon photo to keep
-        photos = sorted(os.listdir(date_path))
-        noon_photo = _find_noon_photo(photos)
 
-        for photo in photos:
-            photo_path = os.path.join(date_path, photo)
-            if photo == noon_photo:
-                kept_count += 1
-                continue
-            os.remove(photo_path)
-            cleaned_count += 1
+def _execute(config, journal, stats):
+    """Run the pending days of a journal in parallel, recording each one."""
+    done = set(journal["done"])
+    pending = [entry for entry in journal["days"] if entry["date"] not in done]
+    if not pending:
+        return
+    lock = threading.Lock()
 
-        # Remove directory if only noon shot (or empty)
-        remaining = os.listdir(date_path)
-        if not remaining:
-            os.rmdir(date_path)
+    def run(entry):
+        deleted, freed, errors = _apply_day(config, entry)
+        CLEANUP_DELETED.inc(deleted)
+        CLEANUP_FREED.inc(freed)
+        CLEANUP_ERRORS.inc(errors)
+        with lock:
+            stats["days"] += 1
+            stats["deleted"] += deleted
+            stats["freed_bytes"] += freed
+            stats["errors"] += errors
+            stats["kept"] += int(entry["keep"] is not None)
+            stats["packed_days"] += int(entry["packed"])
+            if not errors:
+                # A day with errors stays pending and is retried on resume
+                journal["done"].append(entry["date"])
+                _save_journal(config, journal)
 
-    if cleaned_count > 0:
-        log.info("Cleanup: removed %d old photos, kept %d noon archives", cleaned_count, kept_count)
+    with ThreadPoolExecutor(max_workers=config["storage"]["cleanup"]["workers"]) as pool:
+        for future in [pool.submit(run, entry) for entry in pending]:
+            future.result()
 
 
-def _find_noon_photo(photo_filenames):
-    """Find the photo closest to noon from a list of filenames."""
-    best = None
-    best_diff = float("inf")
+def _plan_report(plan):
+    days = []
+    for entry in plan["days"]:
+        days.append({
+            "date": entry["date"],
+            "packed": entry["packed"],
+            "delete": len(entry["delete"]),
+            "freed_mb": round(sum(size for _, size in entry["delete"]) / MB, 2),
+            "keep": entry["keep"],
+            "rmdir": entry["rmdir"],
+        })
+    return {
+        "dry_run": True,
+        "cutoff": plan["cutoff"],
+        "days": len(days),
+        "deleted": sum(d["delete"] for d in days),
+        "freed_mb": round(sum(size for e in plan["days"] for _, size in e["delete"]) / MB, 1),
+        "by_day": days,
+    }
+
+
+def plan_cleanup(config):
+    """Report what a cleanup run would delete, without changing anything."""
+    return _plan_report(build_plan(config))
 
-    for fname in photo_filenames:
-        if not fname.endswith(".jpg"):
-            continue
-        try:
-            parts = fname.replace(".jpg", "").split("_")
-            time_parts = parts[-1].split("-")
-            hour = int(time_parts[0])
-            minute = int(time_parts[1])
-            diff = abs((hour * 60 + minute) - 720)
-            if diff < best_diff:
-                best_diff = diff
-                best = fname
-        except (IndexError, ValueError):
-            continue
 
-    return best
+def run_cleanup(config, dry_run=False):
+    """Delete photos older than retention period, keeping noon shots as archive.
+
+    An unfinished journal from an interrupted run is completed first.
+
+    Args:
+        config: App config dict.
+        dry_run: Only build and report the plan.
+
+    Returns:
+        Run stats dict (or the plan report for a dry run).
+    """
+    if dry_run:
+        return plan_cleanup(config)
+
+    start = time.monotonic()
+    stats = {"dry_run": False, "resumed": False, "days": 0, "deleted": 0, "freed_bytes": 0,
+             "kept": 0, "packed_days": 0, "errors": 0}
+    with CLEANUP_SECONDS.time():
+        journal = _load_journal(config)
+        if journal:
+            log.info("Resuming interrupted cleanup from %s", journal["created"])
+            stats["resumed"] = True
+            _execute(config, journal, stats)
+
+        plan = build_plan(config)
+        if plan["days"]:
+            _save_journal(config, plan)
+            _execute(config, plan, stats)
+        if not stats["errors"]:
+            try:
+                os.remove(_journal_path(config))
+            except FileNotFoundError:
+                pass
+
+    stats["freed_mb"] = round(stats.pop("freed_bytes") / MB, 1)
+    stats["seconds"] = round(time.monotonic() - start, 2)
+    if stats["deleted"] or stats["errors"]:
+        log.info("Cleanup: removed %d old photos (%.1f MB) from %d days, kept %d noon archives, "
+                 "%d errors, %.1fs", stats["deleted"], stats["freed_mb"], stats["days"],
+                 stats["kept"], stats["errors"], stats["seconds"])
+    return stats
 
 
 def get_storage_stats(config):
-    """Get storage usage statistics for the dashboard."""
+    """Get storage usage statistics for the dashboard.
+
+    Reads the running totals kept by the storage accountant instead of
+    walking the photo and timelapse trees.
+    """
+    mb = 1024 * 1024
+    accountant = storage.get_accountant(config)
+    snap = accountant.snapshot()
+    totals, buckets = snap["totals"], snap["buckets"]
+    # Packed days count as photos; their size is the packs'
+    packed_days = sum(b.get("days", 0) for b in buckets["archive"].values())
+
+    timelapse_counts = {"daily": 0, "weekly": 0}
+    for key, bucket in buckets["timelapse"].items():
+        kind = key.split("/", 1)[0]
+        if kind in timelapse_counts:
+            timelapse_counts[kind] += bucket["items"]
+
     stats = {
-        "photos": {"count": 0, "size_mb": 0, "days": 0},
-        "timelapse": {"daily": 0, "weekly": 0, "size_mb": 0},
-        "analysis": {"count": 0},
+        "photos": {
+            "count": totals["photos"]["items"] + totals["archive"]["items"],
+            "size_mb": round((totals["photos"]["bytes"] + totals["archive"]["bytes"]) / mb, 1),
+            "days": len(buckets["photos"]) + packed_days,
+            "packed_days": packed_days,
+        },
+        "timelapse": {
+            "daily": timelapse_counts["daily"],
+            "weekly": timelapse_counts["weekly"],
+            "size_mb": round(totals["timelapse"]["bytes"] / mb, 1),
+        },
+        "analysis": {"count": totals["analysis"]["items"]},
+        "reconciled": snap["reconciled"],
     }
 
-    # Photos
-    photo_dir = config["storage"]["photo_dir"]
-    if os.path.isdir(photo_dir):
-        date_dirs = [d for d in os.listdir(photo_dir)
-                     if os.path.isdir(os.path.join(photo_dir, d))]
-        stats["photos"]["days"] = len(date_dirs)
-        for dd in date_dirs:
-            dp = os.path.join(photo_dir, dd)
-            for f in os.listdir(dp):
-                fp = os.path.join(dp, f)
-                if f.endswith(".jpg"):
-                    stats["photos"]["count"] += 1
-                    stats["photos"]["size_mb"] += os.path.getsize(fp) / (1024 * 1024)
-
-    # Timelapse
-    tl_dir = config["storage"]["timelapse_dir"]
-    for kind in ("daily", "weekly"):
-        kd = os.path.join(tl_dir, kind)
-        if os.path.isdir(kd):
-            files = [f for f in os.listdir(kd) if f.endswith(".mp4")]
-            stats["timelapse"][kind] = len(files)
-            for f in files:
-                stats["timelapse"]["size_mb"] += os.path.getsize(os.path.join(kd, f)) / (1024 * 1024)
-
-    # Analysis
-    analysis_dir = config["storage"]["analysis_dir"]
-    if os.path.isdir(analysis_dir):
-        stats["analysis"]["count"] = len(
-            [f for f in os.listdir(analysis_dir) if f.endswith(".json")]
-        )
-
-    stats["photos"]["size_mb"] = round(stats["photos"]["size_mb"], 1)
-    stats["timelapse"]["size_mb"] = round(stats["timelapse"]["size_mb"], 1)
-
     # Totals and forecast
     total_mb = stats["photos"]["size_mb"] + stats["timelapse"]["size_mb"]
     stats["total_size_mb"] = round(total_mb, 1)
-    stats["max_storage_mb"] = config["storage"].get("max_storage_mb", 8192)
+    stats["max_storage_mb"] = config["storage"]["max_storage_mb"]
 
+    # Forecast from recorded net growth per day (captures minus cleanup);
+    # before a full day is on record, fall back to the average per photo day
+    growth = accountant.daily_growth()
     days_tracked = stats["photos"]["days"]
-    if days_tracked > 0:
+    if growth is not None:
+        stats["daily_avg_mb"] = round(growth / mb, 1)
+    elif days_tracked > 0:
         stats["daily_avg_mb"] = round(total_mb / days_tracked, 1)
-        remaining = stats["max_storage_mb"] - total_mb
-        if stats["daily_avg_mb"] > 0 and remaining > 0:
-            stats["forecast_days_to_full"] = int(remaining / stats["daily_avg_mb"])
-        else:
-            stats["forecast_days_to_full"] = None
     else:
         stats["daily_avg_mb"] = 0
+
+    remaining = stats["max_storage_mb"] - total_mb
+    if stats["daily_avg_mb"] > 0 and remaining > 0:
+        stats["forecast_days_to_full"] = int(remaining / stats["daily_avg_mb"])
+    else:
         stats["forecast_days_to_full"] = None
 
     return stats
+
+
+def main():
+    from config import load_config
+    parser = argparse.ArgumentParser(description="Thin photo days past retention to their noon shot")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan, delete nothing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    report = run_cleanup(load_config(args.config), dry_run=args.dry_run)
+    if args.dry_run:
+        for day in report["by_day"]:
+            where = "pack" if day["packed"] else "disk"
+            print(f"{day['date']} ({where}): delete {day['delete']} ({day['freed_mb']} MB), "
+                  f"keep {day['keep'] or 'nothing'}")
+        print(f"{report['days']} days before {report['cutoff']}: "
+              f"{report['deleted']} photos, {report['freed_mb']} MB")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -23,28 +23,144 @@ def load_config(path="config.yaml"):
                 raise ValueError(f"Plant {i} missing required field: {field}")
 
     # Set defaults
+    config["capture"].setdefault("coalesce_seconds", 5)
+    config["capture"].setdefault("dedup", {})
+    dedup = config["capture"]["dedup"]
+    dedup.setdefault("enabled", True)
+    dedup.setdefault("policy", "mark")
+    dedup.setdefault("hash_size", 16)
+    dedup.setdefault("threshold", 6)
+    dedup.setdefault("keep_every_minutes", 120)
+    dedup.setdefault("thumbnail_resolution", "320x180")
+    dedup.setdefault("thumbnail_quality", 70)
+
+    config["capture"].setdefault("quality_gate", {})
+    gate = config["capture"]["quality_gate"]
+    gate.setdefault("enabled", True)
+    gate.setdefault("analysis_width", 320)
+    gate.setdefault("min_luminance", 35)
+    gate.setdefault("max_luminance", 235)
+    gate.setdefault("max_clipped_ratio", 0.25)
+    gate.setdefault("max_crushed_ratio", 0.6)
+    gate.setdefault("min_sharpness", 15)
+    gate.setdefault("retries", 1)
+    gate.setdefault("retry_delay_seconds", 10)
+
     config.setdefault("timelapse", {})
     config["timelapse"].setdefault("daily_time", "22:30")
     config["timelapse"].setdefault("weekly_day", "sunday")
     config["timelapse"].setdefault("weekly_time", "23:00")
     config["timelapse"].setdefault("fps", 3)
     config["timelapse"].setdefault("min_photos", 5)
+    config["timelapse"].setdefault("crf", 28)
+    config["timelapse"].setdefault("preset", "fast")
+    config["timelapse"].setdefault("preview", True)
+    config["timelapse"].setdefault("preview_resolution", "640x360")
+    config["timelapse"].setdefault("preview_crf", 32)
+    config["timelapse"].setdefault("hls", False)
+    config["timelapse"].setdefault("hls_segment_seconds", 2)
 
     config.setdefault("analysis", {})
     config["analysis"].setdefault("times", ["10:00", "18:00"])
 
+    config.setdefault("scheduler", {})
+    config["scheduler"].setdefault("group_limits", {
+        "capture": 1,
+        "analysis": 1,
+        "timelapse": 1,
+        "maintenance": 1,
+    })
+    config["scheduler"]["group_limits"].setdefault("feeding", 1)
+    config["scheduler"].setdefault("catch_up_grace_minutes", 180)
+    config["scheduler"].setdefault("catch_up_stagger_seconds", 60)
+
+    config["mqtt"].setdefault("subscriptions", [])
+    config["mqtt"].setdefault("stats_windows", ["1h", "24h"])
+    config["mqtt"].setdefault("outbox", {})
+    config["mqtt"]["outbox"].setdefault("qos", 1)
+    config["mqtt"]["outbox"].setdefault("max_messages", 1000)
+    config["mqtt"]["outbox"].setdefault("ack_timeout_seconds", 10)
+
+    config.setdefault("alerts", {})
+    config["alerts"].setdefault("enabled", True)
+    config["alerts"].setdefault("min_duration_seconds", 300)
+    config["alerts"].setdefault("temp_hysteresis_c", 0.5)
+    config["alerts"].setdefault("light_hysteresis_lux", 250)
+    config["alerts"].setdefault("light_hours", ["07:00", "20:30"])
+
     config.setdefault("web", {})
     config["web"].setdefault("host", "0.0.0.0")
     config["web"].setdefault("port", 8080)
+    config["web"].setdefault("slow_request_ms", 500)
+    config["web"].setdefault("profile", False)
+    config["web"].setdefault("profile_interval_ms", 10)
 
     config["storage"].setdefault("photo_dir", "photos")
     config["storage"].setdefault("timelapse_dir", "timelapse")
     config["storage"].setdefault("analysis_dir", "analysis")
+    config["storage"].setdefault("cache_dir", "cache")
+    config["storage"].setdefault("state_dir", "state")
+    config["storage"].setdefault("archive_dir", "archive")
     config["storage"].setdefault("retention_days", 30)
+    config["storage"].setdefault("max_storage_mb", 8192)
+    config["storage"].setdefault("archive", {})
+    config["storage"]["archive"].setdefault("pack_after_days", 60)
+    config["storage"]["archive"].setdefault("repack_dead_ratio", 0.25)
+    config["storage"].setdefault("cleanup", {})
+    config["storage"]["cleanup"].setdefault("workers", 4)
+    config["storage"].setdefault("tiers", {})
+    tiers = config["storage"]["tiers"]
+    tiers.setdefault("compact_after_days", 7)
+    tiers.setdefault("format", "webp")
+    tiers.setdefault("resolution", "1280x720")
+    tiers.setdefault("quality", 75)
+    tiers.setdefault("workers", 1)
+    tiers.setdefault("nice", 10)
+    config["storage"].setdefault("eviction", {})
+    eviction = config["storage"]["eviction"]
+    eviction.setdefault("high_water", 0.90)
+    eviction.setdefault("low_water", 0.80)
+    eviction.setdefault("order", ["thin_photos", "downscale_archives", "drop_daily_timelapses"])
+    eviction.setdefault("thin_interval_minutes", 120)
+    eviction.setdefault("thin_after_days", 2)
+    eviction.setdefault("archive_resolution", "1280x720")
+    eviction.setdefault("archive_quality", 75)
+    eviction.setdefault("keep_daily_timelapses", 14)
+
+    config.setdefault("imaging", {})
+    config["imaging"].setdefault("workers", 2)
+    config["imaging"].setdefault("queue_size", 16)
+    config["imaging"].setdefault("reserved_slots", 2)
+    config["imaging"].setdefault("submit_timeout_seconds", 10)
+    config["imaging"].setdefault("nice", 5)
+
+    config.setdefault("ecogarden", {})
+    dev = config["ecogarden"]
+    dev.setdefault("timeout_seconds", 3)
+    dev.setdefault("feed_timeout_seconds", 10)
+    dev.setdefault("cache_ttl_seconds", 15)
+    dev.setdefault("poll_seconds", 10)
+    dev.setdefault("breaker_failures", 3)
+    dev.setdefault("breaker_reset_seconds", 30)
+    dev.setdefault("toggle_debounce_ms", 400)
+
+    config.setdefault("feeding", {})
+    feeding = config["feeding"]
+    feeding.setdefault("min_interval_minutes", 120)
+    feeding.setdefault("max_portions_per_day", 3)
+    feeding.setdefault("pulses_per_portion", 1)
+    feeding.setdefault("pulse_spacing_seconds", 3)
+    feeding.setdefault("schedule", [])
+    feeding.setdefault("catch_up_minutes", 30)
+
+    config.setdefault("sprites", {})
+    config["sprites"].setdefault("tile_size", "150x100")
+    config["sprites"].setdefault("columns", 10)
+    config["sprites"].setdefault("quality", 70)
 
     # Resolve storage paths relative to monitor directory
     base_dir = os.path.dirname(__file__)
-    for key in ["photo_dir", "timelapse_dir", "analysis_dir"]:
+    for key in ["photo_dir", "timelapse_dir", "analysis_dir", "cache_dir", "state_dir", "archive_dir"]:
         if not os.path.isabs(config["storage"][key]):
             config["storage"][key] = os.path.join(base_dir, config["storage"][key])
 
@@ -0,0 +1,258 @@
+"""Gateway to the EcoGarden ESP8266, so dashboards can't overload it.
+
+The device serves one HTTP connection at a time and falls over when
+several dashboards poll it at once. Everything that talks to it goes
+through one DeviceGateway per device:
+
+    Cached reads      LED state and water temperature are kept for
+                      ecogarden.cache_ttl_seconds and refreshed by a
+                      background poller, so most reads never hit the
+                      device.
+    Single flight     Concurrent readers of the same stale value share one
+                      in-flight request instead of queueing their own.
+    Circuit breaker   After breaker_failures consecutive failures the
+                      device is considered offline for breaker_reset_seconds:
+                      calls fail fast with DeviceUnavailable instead of
+                      holding a request thread for the full timeout. One
+                      probe request then decides whether it is back.
+"""
+
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+REQUESTS = metrics.counter(
+    "ecogarden_device_requests_total", "Requests to the EcoGarden device", ["endpoint", "result"])
+REQUEST_SECONDS = metrics.histogram(
+    "ecogarden_device_request_seconds", "EcoGarden device request time", ["endpoint"])
+READS = metrics.counter(
+    "ecogarden_device_reads_total", "Device state reads by how they were served", ["key", "source"])
+BREAKER_OPEN = metrics.gauge(
+    "ecogarden_device_breaker_open", "1 while the device circuit breaker is open")
+
+READ_PATHS = {
+    "led": "/rpc/LED.Get",
+    "temperature": "/hooks/water_temperature",
+}
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+class DeviceUnavailable(Exception):
+    """The device did not answer, or the circuit breaker is open."""
+
+
+class CircuitOpen(DeviceUnavailable):
+    """The request was not sent: the device is considered offline."""
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a pause."""
+
+    def __init__(self, failures, reset_seconds):
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened is None:
+                return "closed"
+            if time.monotonic() - self._opened >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """Whether a request may go out now (one probe at a time when half-open)."""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if time.monotonic() - self._opened < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self._opened is not None:
+                log.info("Device is reachable again")
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+        BREAKER_OPEN.set(0)
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened is not None or self._failures >= self.max_failures:
+                if self._opened is None:
+                    log.warning("Device failed %d times in a row, failing fast for %ds",
+                                self._failures, self.reset_seconds)
+                self._opened = time.monotonic()
+        if self._opened is not None:
+            BREAKER_OPEN.set(1)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class DeviceGateway:
+    """Cached, single-flight, breaker-guarded access to one device."""
+
+    def __init__(self, config):
+        dev = config["ecogarden"]
+        self.base_url = f"http://{dev['device_ip']}"
+        self.timeout = dev["timeout_seconds"]
+        self.ttl = dev["cache_ttl_seconds"]
+        self.poll_seconds = dev["poll_seconds"]
+        self.breaker = CircuitBreaker(dev["breaker_failures"], dev["breaker_reset_seconds"])
+        self._lock = threading.Lock()
+        self._cache = {}     # key -> (monotonic time fetched, value)
+        self._inflight = {}  # key -> _Flight
+        self._poller = None
+        self._stop = threading.Event()
+
+    def request(self, path, body=None, timeout=None):
+        """One request to the device, through the circuit breaker.
+
+        Args:
+            path: Endpoint path, e.g. "/rpc/LED.Get".
+            body: Optional JSON-able body; sends a POST.
+            timeout: Seconds, defaulting to ecogarden.timeout_seconds.
+
+        Returns:
+            Decoded JSON reply.
+
+        Raises:
+            DeviceUnavailable: Breaker open, or the request failed.
+        """
+        if not self.breaker.allow():
+            REQUESTS.labels(endpoint=path, result="rejected").inc()
+            raise CircuitOpen("device offline (circuit open)")
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data)
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                reply = json.loads(resp.read() or b"{}")
+        except Exception as e:
+            self.breaker.failure()
+            REQUESTS.labels(endpoint=path, result="error").inc()
+            raise DeviceUnavailable(str(e)) from e
+        finally:
+            REQUEST_SECONDS.labels(endpoint=path).observe(time.monotonic() - start)
+        self.breaker.success()
+        REQUESTS.labels(endpoint=path, result="ok").inc()
+        return reply
+
+    def _single_flight(self, key, fn):
+        """Run fn once for all concurrent callers asking for key."""
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if leader:
+            try:
+                flight.value = fn()
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                flight.done.set()
+        else:
+            READS.labels(key=key, source="shared").inc()
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _fetch(self, key):
+        value = self.request(READ_PATHS[key])
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+        return value
+
+    def read(self, key, max_age=None):
+        """Cached device state ("led" or "temperature"), refreshed when stale.
+
+        Raises:
+            DeviceUnavailable: Nothing fresh enough and the device didn't answer.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] <= max_age:
+            READS.labels(key=key, source="cache").inc()
+            return cached[1]
+        READS.labels(key=key, source="device").inc()
+        return self._single_flight(key, lambda: self._fetch(key))
+
+    def cached(self, key):
+        """(age in seconds, value) of the last successful read, or None."""
+        with self._lock:
+            cached = self._cache.get(key)
+        return (time.monotonic() - cached[0], cached[1]) if cached else None
+
+    def invalidate(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def remember(self, key, value):
+        """Store a value learned from a command reply as a fresh read."""
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+
+    def led(self):
+        """LED state dict from LED.Get ({"state": bool, "brightness": float})."""
+        return self.read("led")
+
+    def temperature(self):
+        """Water temperature in degrees C, or None if the sensor has no reading."""
+        return self.read("temperature").get("value")
+
+    def start(self):
+        """Start the background poller that keeps the cached reads fresh."""
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name="device-poller", daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll(self):
+        while not self._stop.is_set():
+            for key in READ_PATHS:
+                try:
+                    # Refresh a bit early so readers rarely see a stale entry
+                    self.read(key, max_age=self.ttl / 2)
+                except DeviceUnavailable:
+                    pass
+            self._stop.wait(self.poll_seconds)
+
+
+def get_gateway(config):
+    """Shared gateway for the configured device."""
+    ip = config["ecogarden"]["device_ip"]
+    with _gateways_lock:
+        gateway = _gateways.get(ip)
+        if gateway is None:
+            gateway = _gateways[ip] = DeviceGateway(config)
+        return gateway
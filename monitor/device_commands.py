@@ -0,0 +1,329 @@
+"""Serialized command queue for the EcoGarden device: light and feeder.
+
+Commands go through one worker thread per device, so the ESP8266 only
+ever sees one command at a time:
+
+    Light   Toggle presses update a desired state and are applied once
+            they stop for ecogarden.toggle_debounce_ms, as an LED.Set of
+            the final state. A double click therefore sends nothing
+            instead of two toggles that cancel out.
+    Feed    A request feeds whole portions (feeding.pulses_per_portion
+            feeder pulses each, pulse_spacing_seconds apart). A portion is
+            refused if the last one was less than min_interval_minutes
+            ago or max_portions_per_day have been fed today; the counts
+            live in state/feeding.json so a restart doesn't reset them.
+
+Every command is kept in a short log with its latency (see recent()) and
+published as a "device" event.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date, datetime
+
+import events
+import metrics
+from device import CircuitOpen, DeviceUnavailable, get_gateway
+
+log = logging.getLogger(__name__)
+
+LOG_SIZE = 100
+
+COMMANDS = metrics.counter(
+    "ecogarden_device_commands_total", "Device commands by outcome", ["command", "result"])
+COMMAND_SECONDS = metrics.histogram(
+    "ecogarden_device_command_seconds", "Device command time, queue wait excluded", ["command"])
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class FeedRefused(Exception):
+    """A feed was refused by the rate limit or the daily cap."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CommandQueue:
+    """Runs device commands one at a time and keeps a log of them."""
+
+    def __init__(self, config):
+        self.config = config
+        self.gateway = get_gateway(config)
+        self.feed_state_path = os.path.join(config["storage"]["state_dir"], "feeding.json")
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._log = deque(maxlen=LOG_SIZE)
+        self._desired_light = None
+        self._light_timer = None
+        threading.Thread(target=self._worker, name="device-commands", daemon=True).start()
+
+    # --- Log ---
+
+    def _record(self, command, source, **args):
+        entry = {"id": uuid.uuid4().hex[:12], "command": command, "source": source, "args": args,
+                 "status": "queued", "queued_at": datetime.now().isoformat(timespec="seconds"),
+                 "latency_ms": None, "reply": None, "error": None}
+        with self._lock:
+            self._log.append(entry)
+        events.publish("device", dict(entry))
+        return entry
+
+    def _update(self, entry, **fields):
+        with self._lock:
+            entry.update(fields)
+            snapshot = dict(entry)
+        events.publish("device", snapshot)
+        return snapshot
+
+    def recent(self):
+        """Logged commands, newest first."""
+        with self._lock:
+            return [dict(e) for e in reversed(self._log)]
+
+    # --- Worker ---
+
+    def _worker(self):
+        while True:
+            entry, fn, done = self._queue.get()
+            self._update(entry, status="running")
+            start = time.monotonic()
+            try:
+                status, reply = fn()
+                error = None
+            except DeviceUnavailable as e:
+                status, reply, error = "failed", None, str(e)
+            except Exception as e:
+                log.exception("Device command %s failed", entry["command"])
+                status, reply, error = "failed", None, str(e)
+            elapsed = time.monotonic() - start
+            try:
+                COMMAND_SECONDS.labels(command=entry["command"]).observe(elapsed)
+                COMMANDS.labels(command=entry["command"], result=status).inc()
+                self._update(entry, status=status, reply=reply, error=error,
+                             latency_ms=round(elapsed * 1000, 1))
+            finally:
+                if done is not None:
+                    # Only now is the entry final
+                    done.set()
+
+    def _submit(self, entry, fn, done=None):
+        """Queue fn; done (a threading.Event) is set once entry holds the outcome."""
+        self._queue.put((entry, fn, done))
+        return entry
+
+    # --- Light ---
+
+    def light_state(self):
+        """Current LED state, with a debounced change still pending applied."""
+        with self._lock:
+            desired = self._desired_light
+        if desired is None:
+            return self.gateway.led()
+        cached = self.gateway.cached("led")
+        led = dict(cached[1]) if cached else {}
+        led.update(state=desired, pending=True)
+        return led
+
+    def toggle_light(self, source="dashboard"):
+        """Flip the desired light state; applied after the debounce delay.
+
+        Returns:
+            The new desired state.
+
+        Raises:
+            DeviceUnavailable: The current state is unknown and can't be read.
+        """
+        with self._lock:
+            base = self._desired_light
+        if base is None:
+            base = bool(self.gateway.led().get("state"))
+        with self._lock:
+            if self._desired_light is not None:
+                base = self._desired_light
+            self._desired_light = not base
+            if self._light_timer:
+                self._light_timer.cancel()
+            delay = self.config["ecogarden"]["toggle_debounce_ms"] / 1000.0
+            self._light_timer = threading.Timer(delay, self._queue_light, args=(source,))
+            self._light_timer.daemon = True
+            self._light_timer.start()
+            return self._desired_light
+
+    def _queue_light(self, source):
+        with self._lock:
+            desired = self._desired_light
+        entry = self._record("light", source, state=desired)
+        self._submit(entry, lambda: self._apply_light(entry))
+
+    def _apply_light(self, entry):
+        with self._lock:
+            desired = self._desired_light
+        try:
+            if desired is None or self.gateway.read("led", max_age=0).get("state") == desired:
+                return "skipped", None
+            reply = self.gateway.request("/rpc/LED.Set", body={"state": desired})
+            cached = self.gateway.cached("led")
+            led = dict(cached[1]) if cached else {}
+            led["state"] = reply.get("state", desired)
+            self.gateway.remember("led", led)
+            return "ok", reply
+        finally:
+            with self._lock:
+                # A press during the request re-armed the timer; keep its state
+                if self._desired_light == desired and not (
+                        self._light_timer and self._light_timer.is_alive()):
+                    self._desired_light = None
+
+    # --- Feed ---
+
+    def _load_feed_state(self):
+        try:
+            with open(self.feed_state_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        today = date.today().isoformat()
+        if data.get("date") != today:
+            data = {"date": today, "portions": 0, "last_feed": data.get("last_feed"), "slots": {}}
+        data.setdefault("slots", {})
+        return data
+
+    def _save_feed_state(self, data):
+        os.makedirs(os.path.dirname(self.feed_state_path), exist_ok=True)
+        tmp_path = self.feed_state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.feed_state_path)
+
+    def feed_status(self):
+        """Portions fed today, the cap, when the next feed is allowed, and schedule slots."""
+        feeding = self.config["feeding"]
+        with self._lock:
+            data = self._load_feed_state()
+        next_allowed = None
+        if data.get("last_feed"):
+            next_allowed = data["last_feed"] + feeding["min_interval_minutes"] * 60
+        return {
+            "portions_today": data["portions"],
+            "max_portions_per_day": feeding["max_portions_per_day"],
+            "last_feed": (datetime.fromtimestamp(data["last_feed"]).isoformat(timespec="seconds")
+                          if data.get("last_feed") else None),
+            "next_allowed": (datetime.fromtimestamp(next_allowed).isoformat(timespec="seconds")
+                             if next_allowed and next_allowed > time.time() else None),
+            "slots": data["slots"],
+        }
+
+    def mark_slot(self, slot, **fields):
+        """Update (or create) today's record for a schedule slot."""
+        with self._lock:
+            data = self._load_feed_state()
+            data["slots"].setdefault(slot, {}).update(fields)
+            self._save_feed_state(data)
+
+    def feed(self, source="dashboard", portions=1, wait=False, enforce_limits=True, slot=None):
+        """Queue portions for the feeder.
+
+        The portions are counted against the limits when they are queued,
+        so a burst of presses can't slip past them while the first is
+        running. With a slot, the slot is recorded in the same write, so
+        it never runs twice in a day, restarts included.
+
+        Args:
+            source: Who asked ("dashboard", "schedule@08:00", ...), for the log.
+            portions: Portions of feeding.pulses_per_portion pulses each.
+            wait: Block until the command has run.
+            enforce_limits: Apply min_interval_minutes (the daily cap always applies).
+            slot: Schedule slot ("HH:MM") this feed is for.
+
+        Returns:
+            Snapshot of the command log entry.
+
+        Raises:
+            FeedRefused: Too soon after the last portion, the daily cap is
+                reached, or the slot already ran today.
+            CircuitOpen: The device is offline; nothing was queued.
+        """
+        if self.gateway.breaker.state == "open":
+            raise CircuitOpen("device offline (circuit open)")
+        feeding = self.config["feeding"]
+        pulses = portions * feeding["pulses_per_portion"]
+        now = time.time()
+        with self._lock:
+            data = self._load_feed_state()
+            if slot is not None and slot in data["slots"]:
+                raise FeedRefused(f"The {slot} feed already ran today")
+            if data["portions"] + portions > feeding["max_portions_per_day"]:
+                COMMANDS.labels(command="feed", result="refused").inc()
+                raise FeedRefused(f"Daily limit of {feeding['max_portions_per_day']} portions reached")
+            wait_s = (data.get("last_feed") or 0) + feeding["min_interval_minutes"] * 60 - now
+            if enforce_limits and wait_s > 0:
+                COMMANDS.labels(command="feed", result="refused").inc()
+                raise FeedRefused(f"Fed {int((now - data['last_feed']) / 60)} minutes ago",
+                                  retry_after=int(wait_s) + 1)
+            previous_feed = data.get("last_feed")
+            data.update(portions=data["portions"] + portions, last_feed=now)
+            if slot is not None:
+                data["slots"][slot] = {"status": "queued", "portions": portions}
+            self._save_feed_state(data)
+
+        entry = self._record("feed", source, portions=portions, pulses=pulses)
+        done = threading.Event()
+
+        def run():
+            sent = []
+            try:
+                result = self._apply_feed(pulses, sent)
+            except Exception as e:
+                if isinstance(e, CircuitOpen) and not sent:
+                    # Nothing reached the feeder: give the portions back
+                    self._release(portions, now, previous_feed)
+                if slot is not None:
+                    self.mark_slot(slot, status="failed", pulses_sent=len(sent), error=str(e))
+                raise
+            else:
+                if slot is not None:
+                    self.mark_slot(slot, status="ok", pulses_sent=len(sent),
+                                   fed_at=datetime.now().isoformat(timespec="seconds"))
+                return result
+
+        self._submit(entry, run, done)
+        if wait:
+            done.wait()
+        with self._lock:
+            return dict(entry)
+
+    def _release(self, portions, reserved_at, previous_feed):
+        with self._lock:
+            data = self._load_feed_state()
+            data["portions"] = max(0, data["portions"] - portions)
+            if data.get("last_feed") == reserved_at:
+                data["last_feed"] = previous_feed
+            self._save_feed_state(data)
+
+    def _apply_feed(self, pulses, sent):
+        spacing = self.config["feeding"]["pulse_spacing_seconds"]
+        timeout = self.config["ecogarden"]["feed_timeout_seconds"]
+        for i in range(pulses):
+            if i:
+                time.sleep(spacing)
+            sent.append(self.gateway.request("/hooks/feed_now", timeout=timeout))
+        return "ok", sent
+
+
+def get_queue(config):
+    """Shared command queue for the configured device."""
+    ip = config["ecogarden"]["device_ip"]
+    with _queues_lock:
+        q = _queues.get(ip)
+        if q is None:
+            q = _queues[ip] = CommandQueue(config)
+        return q
@@ -0,0 +1,64 @@
+"""In-process event bus, pushed to browsers as server-sent events.
+
+Modules publish() small JSON-able payloads ("capture" job updates, ...);
+every open GET /api/events stream gets its own bounded queue. A client
+that stops reading loses events rather than holding memory, and a
+comment line is sent every few seconds so dead connections are noticed.
+"""
+
+import json
+import queue
+import threading
+
+import metrics
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+
+SUBSCRIBERS = metrics.gauge("ecogarden_events_subscribers", "Open /api/events streams")
+DROPPED = metrics.counter("ecogarden_events_dropped_total", "Events dropped for slow subscribers")
+
+_lock = threading.Lock()
+_subscribers = set()
+
+
+def publish(event, data):
+    """Send an event to every subscriber without blocking."""
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    with _lock:
+        subscribers = list(_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(message)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def subscribe():
+    """Register a new subscriber queue; pass it to stream()."""
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        _subscribers.add(q)
+    SUBSCRIBERS.inc()
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        if q not in _subscribers:
+            return
+        _subscribers.discard(q)
+    SUBSCRIBERS.dec()
+
+
+def stream(q):
+    """Server-sent event body for one subscriber; unsubscribes on disconnect."""
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                yield q.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        unsubscribe(q)
@@ -0,0 +1,266 @@
+"""Byte-budget eviction: keep photos + timelapses under max_storage_mb.
+
+When usage crosses storage.eviction.high_water (a fraction of the budget)
+the configured stages run in order until usage is back under low_water:
+
+    thin_photos            Drop intra-day photos of recent days, keeping
+                           the noon shot and one photo per thin interval.
+    downscale_archives     Re-encode noon archives past retention at a
+                           smaller size.
+    drop_daily_timelapses  Delete the oldest daily timelapses (with their
+                           renditions), always keeping the newest few.
+
+Weekly timelapses and noon shots are never deleted. plan_eviction()
+produces the same report without touching anything.
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from PIL import Image
+
+import metrics
+import photostore
+import storage
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+EVICTION_RUNS = metrics.counter("ecogarden_eviction_runs_total", "Eviction runs that freed space")
+EVICTED_BYTES = metrics.counter(
+    "ecogarden_eviction_freed_bytes_total", "Bytes freed by eviction", ["stage"])
+
+
+class _Action:
+    """One eviction step: what it touches, what it should free, how to do it."""
+
+    def __init__(self, stage, path, estimate, apply):
+        self.stage = stage
+        self.path = path
+        self.estimate = estimate
+        self.apply = apply
+
+
+def _usage_bytes(config):
+    totals = storage.get_accountant(config).snapshot()["totals"]
+    return totals["photos"]["bytes"] + totals["archive"]["bytes"] + totals["timelapse"]["bytes"]
+
+
+def _limits(config):
+    """(budget, high-water, low-water) in bytes."""
+    budget = config["storage"]["max_storage_mb"] * MB
+    ev = config["storage"]["eviction"]
+    return budget, int(budget * ev["high_water"]), int(budget * ev["low_water"])
+
+
+def _photo_days(config):
+    """Photo date directories as (date, path), oldest first."""
+    photo_dir = config["storage"]["photo_dir"]
+    if not os.path.isdir(photo_dir):
+        return []
+    days = []
+    for name in sorted(os.listdir(photo_dir)):
+        try:
+            day = datetime.strptime(name, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        days.append((day, os.path.join(photo_dir, name)))
+    return days
+
+
+def _delete_photo(config, path):
+    def apply():
+        size = os.path.getsize(path)
+        os.remove(path)
+        storage.update(config, path)
+        from timelapse import invalidate_timelapses
+        invalidate_timelapses(config, os.path.basename(os.path.dirname(path)),
+                              os.path.basename(path))
+        return size
+    return apply
+
+
+def _thin_photos(config):
+    """Intra-day photos of days inside retention, oldest day first."""
+    ev = config["storage"]["eviction"]
+    slot = ev["thin_interval_minutes"]
+    newest = date.today() - timedelta(days=ev["thin_after_days"])
+    oldest = date.today() - timedelta(days=config["storage"].get("retention_days", 30))
+
+    for day, day_path in _photo_days(config):
+        if not oldest <= day <= newest:
+            continue
+        photos = [os.path.basename(p) for p in photostore.list_photos(day_path)]
+        keep = {photostore.find_noon_photo(photos)}
+        seen_slots = set()
+        for name in photos:
+            taken = photostore.parse_photo_time(name)
+            if taken is None:
+                keep.add(name)
+                continue
+            minute = taken.hour * 60 + taken.minute
+            if minute // slot not in seen_slots:
+                seen_slots.add(minute // slot)
+                keep.add(name)
+        for name in photos:
+            if name not in keep:
+                path = os.path.join(day_path, name)
+                yield _Action("thin_photos", path, os.path.getsize(path), _delete_photo(config, path))
+
+
+def _downscale(config, path, size):
+    ev = config["storage"]["eviction"]
+
+    def apply():
+        before = os.path.getsize(path)
+        tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+        with Image.open(path) as img:
+            fmt = img.format
+            img = img.convert("RGB")
+            img.thumbnail(size, Image.LANCZOS)
+            img.save(tmp_path, format=fmt, quality=ev["archive_quality"])
+        os.replace(tmp_path, path)
+        storage.update(config, path)
+        return before - os.path.getsize(path)
+    return apply
+
+
+def _downscale_archives(config):
+    """Noon archives past retention that are still above archive size."""
+    ev = config["storage"]["eviction"]
+    width, height = (int(v) for v in ev["archive_resolution"].split("x"))
+    cutoff = date.today() - timedelta(days=config["storage"].get("retention_days", 30))
+
+    for day, day_path in _photo_days(config):
+        if day >= cutoff:
+            continue
+        for path in photostore.list_photos(day_path):
+            try:
+                with Image.open(path) as img:
+                    w, h = img.size
+            except OSError:
+                continue
+            if w <= width and h <= height:
+                continue
+            # JPEG size scales roughly with pixel count
+            ratio = min(width / w, height / h) ** 2
+            estimate = int(os.path.getsize(path) * (1 - ratio))
+            yield _Action("downscale_archives", path, estimate, _downscale(config, path, (width, height)))
+
+
+def _drop_daily_timelapses(config):
+    """Daily timelapses oldest first, keeping the newest keep_daily_timelapses."""
+    from timelapse import remove_timelapse
+    ev = config["storage"]["eviction"]
+    daily_dir = os.path.join(config["storage"]["timelapse_dir"], "daily")
+    if not os.path.isdir(daily_dir):
+        return
+    videos = sorted(f for f in os.listdir(daily_dir) if f.endswith(".mp4") and not f.startswith("."))
+    keep = ev["keep_daily_timelapses"]
+    buckets = storage.get_accountant(config).snapshot()["buckets"]["timelapse"]
+    for name in videos[:max(0, len(videos) - keep)]:
+        path = os.path.join(daily_dir, name)
+        bucket = buckets.get(f"daily/{name[:-4]}")
+        estimate = bucket["bytes"] if bucket else os.path.getsize(path)
+        yield _Action("drop_daily_timelapses", path, estimate,
+                      lambda path=path: remove_timelapse(config, path))
+
+
+STAGES = {
+    "thin_photos": _thin_photos,
+    "downscale_archives": _downscale_archives,
+    "drop_daily_timelapses": _drop_daily_timelapses,
+}
+
+
+def _report(config, usage, actions, dry_run):
+    budget, high, low = _limits(config)
+    by_stage = {}
+    for action, freed in actions:
+        entry = by_stage.setdefault(action.stage, {"count": 0, "freed_mb": 0.0})
+        entry["count"] += 1
+        entry["freed_mb"] += freed / MB
+    for entry in by_stage.values():
+        entry["freed_mb"] = round(entry["freed_mb"], 1)
+    freed_total = sum(freed for _, freed in actions)
+    root = os.path.dirname(os.path.abspath(config["storage"]["photo_dir"]))
+    return {
+        "dry_run": dry_run,
+        "usage_mb": round(usage / MB, 1),
+        "max_storage_mb": config["storage"]["max_storage_mb"],
+        "high_water_mb": round(high / MB, 1),
+        "low_water_mb": round(low / MB, 1),
+        "over_high_water": usage >= high,
+        "freed_mb": round(freed_total / MB, 1),
+        "usage_after_mb": round((usage - freed_total) / MB, 1),
+        "reaches_low_water": usage - freed_total <= low,
+        "by_stage": by_stage,
+        "actions": [
+            {"stage": a.stage, "path": os.path.relpath(a.path, root), "freed_mb": round(f / MB, 2)}
+            for a, f in actions
+        ],
+    }
+
+
+def plan_eviction(config):
+    """Report what an eviction run would free, without changing anything.
+
+    Plans down to low_water even when usage is still under high_water, so
+    the report shows what the next real run would do. Downscale savings
+    are estimates.
+    """
+    _, _, low = _limits(config)
+    usage = remaining = _usage_bytes(config)
+    actions = []
+    for stage in config["storage"]["eviction"]["order"]:
+        for action in STAGES[stage](config):
+            if remaining <= low:
+                break
+            actions.append((action, action.estimate))
+            remaining -= action.estimate
+    return _report(config, usage, actions, dry_run=True)
+
+
+def run_eviction(config, force=False):
+    """Evict until usage is under low_water, if it is over high_water.
+
+    Args:
+        config: App config dict.
+        force: Run even if usage is below high_water.
+
+    Returns:
+        Report dict, or None if usage was under the high-water mark.
+    """
+    _, high, low = _limits(config)
+    usage = _usage_bytes(config)
+    if usage < high and not force:
+        return None
+
+    log.info("Storage at %.0f MB (high water %.0f MB), evicting down to %.0f MB",
+             usage / MB, high / MB, low / MB)
+    done = []
+    for stage in config["storage"]["eviction"]["order"]:
+        if _usage_bytes(config) <= low:
+            break
+        for action in STAGES[stage](config):
+            if _usage_bytes(config) <= low:
+                break
+            try:
+                freed = action.apply()
+            except OSError as e:
+                log.warning("Eviction step %s on %s failed: %s", action.stage, action.path, e)
+                continue
+            EVICTED_BYTES.labels(stage=action.stage).inc(max(0, freed))
+            done.append((action, freed))
+
+    report = _report(config, usage, done, dry_run=False)
+    if done:
+        EVICTION_RUNS.inc()
+    log.info("Eviction freed %.1f MB (%s); usage now %.0f MB", report["freed_mb"],
+             ", ".join(f"{s}: {v['count']}" for s, v in report["by_stage"].items()) or "nothing",
+             _usage_bytes(config) / MB)
+    if not report["reaches_low_water"]:
+        log.warning("Eviction could not reach low water; protected data exceeds the budget")
+    return report
@@ -0,0 +1,117 @@
+"""Scheduled fish feeding, with missed-feed alerts.
+
+feeding.schedule lists the day's slots ("08:00", or {time, portions}).
+Each slot is a Daily scheduler job that queues its portions on the
+device command queue. The slot is recorded in state/feeding.json when
+it is queued, before any pulse goes out. A slot therefore runs at most
+once a day, even across restarts, and a feed that may have half-happened
+is never repeated.
+
+The feeding_watch job runs every few minutes. It feeds a slot the
+service was down for if it is at most catch_up_minutes late. A slot that
+is later than that, or whose feed failed, is reported once as a "feeding"
+alert, on MQTT (<publish_topic>/alert) and as an SSE event.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import alerts
+from device import DeviceUnavailable
+from device_commands import FeedRefused, get_queue
+
+log = logging.getLogger(__name__)
+
+
+def schedule(config):
+    """Configured slots as a sorted list of ("HH:MM", portions)."""
+    slots = {}
+    for entry in config["feeding"]["schedule"]:
+        if isinstance(entry, str):
+            entry = {"time": entry}
+        hour, minute = (int(part) for part in str(entry["time"]).split(":"))
+        slots[f"{hour:02d}:{minute:02d}"] = int(entry.get("portions", 1))
+    return sorted(slots.items())
+
+
+def _slot_time(slot, day):
+    hour, minute = (int(part) for part in slot.split(":"))
+    return datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+def feed_slot(config, slot, portions, source=None):
+    """Feed one schedule slot unless it already ran today.
+
+    Returns:
+        The command log entry, or None if the slot already ran.
+
+    Raises:
+        FeedRefused: The daily portion cap would be exceeded.
+        DeviceUnavailable: The device is offline or the feed failed.
+    """
+    commands = get_queue(config)
+    if slot in commands.feed_status()["slots"]:
+        log.info("Feed for %s already ran today, skipping", slot)
+        return None
+    # The schedule is deliberate: only the daily cap applies, not min_interval
+    entry = commands.feed(source=source or f"schedule@{slot}", portions=portions,
+                          wait=True, enforce_limits=False, slot=slot)
+    if entry["status"] != "ok":
+        raise DeviceUnavailable(f"Feed for {slot} failed: {entry['error']}")
+    log.info("Fed %d portion(s) for %s in %.0f ms", portions, slot, entry["latency_ms"])
+    return entry
+
+
+def check_missed(config, state, now=None):
+    """Catch up recently missed slots and alert on the rest (once each)."""
+    now = now or datetime.now()
+    commands = get_queue(config)
+    catch_up = timedelta(minutes=config["feeding"]["catch_up_minutes"])
+    for slot, portions in schedule(config):
+        due = _slot_time(slot, now.date())
+        if now < due + timedelta(minutes=2):
+            # Not due yet, or the regular job is still on it
+            continue
+        late = now - due > catch_up
+        record = commands.feed_status()["slots"].get(slot)
+        if record is None and not late:
+            log.warning("Feed for %s was missed, catching up", slot)
+            try:
+                feed_slot(config, slot, portions, source=f"catch-up@{slot}")
+                continue
+            except FeedRefused as e:
+                commands.mark_slot(slot, status="missed", error=str(e))
+            except DeviceUnavailable as e:
+                log.warning("Catch-up feed for %s failed: %s", slot, e)
+            record = commands.feed_status()["slots"].get(slot)
+        if record is None:
+            if not late:
+                # Device offline before anything was queued; retry next round
+                continue
+            commands.mark_slot(slot, status="missed", error="not run (monitor or device down)")
+        elif record.get("status") == "queued" and late:
+            # Queued but never confirmed: the service stopped mid-feed
+            commands.mark_slot(slot, status="unconfirmed", error="feed was interrupted")
+        record = commands.feed_status()["slots"][slot]
+        if record.get("status") in ("missed", "failed", "unconfirmed") and not record.get("alerted"):
+            _alert(state, slot, record)
+            commands.mark_slot(slot, alerted=datetime.now().isoformat(timespec="seconds"))
+
+
+def _alert(state, slot, record):
+    payload = {
+        "type": "feeding",
+        "slot": slot,
+        "status": record["status"],
+        "message": f"Scheduled {slot} feed {record['status']}: {record.get('error') or 'unknown error'}",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+    log.warning(payload["message"])
+    alerts.publish(state, payload)
+
+
+def status(config):
+    """Today's schedule with each slot's record, for the API."""
+    slots = get_queue(config).feed_status()["slots"]
+    return [{"time": slot, "portions": portions, **slots.get(slot, {"status": "pending"})}
+            for slot, portions in schedule(config)]
@@ -0,0 +1,164 @@
+"""Shared process pool for CPU-bound image work.
+
+Decoding, resizing and re-encoding photos holds the GIL for tens to
+hundreds of milliseconds per frame, which stalls Flask request threads
+when it runs in-process. Capture post-processing, thumbnails, sprite
+tiles and on-the-fly JPEG encoding are submitted here instead and run in
+a few worker processes at lowered priority.
+
+The queue is bounded: submit() waits up to imaging.submit_timeout_seconds
+for a free slot and then raises Busy, so a burst of requests gets
+backpressure rather than an ever-growing backlog. Large inputs (photo
+bytes) go to the workers through shared memory via share() instead of
+being pickled down the pool's pipe.
+
+Capture post-processing is submitted with reserved=True: it runs in a
+separate pool of imaging.reserved_slots workers (started on first use),
+so it never waits behind queued sprite tiles or encodes, and runs inline
+if those are all taken rather than raise Busy.
+
+With imaging.workers set to 0, tasks run inline on the calling thread.
+"""
+
+import atexit
+import contextlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import metrics
+
+QUEUE_DEPTH = metrics.gauge("ecogarden_imaging_queue_depth", "Image tasks queued or running")
+TASKS = metrics.counter("ecogarden_imaging_tasks_total", "Image tasks by outcome", ["task", "result"])
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+_reserved_pool = None
+_reserved = None
+
+
+class Busy(RuntimeError):
+    """The image queue stayed full for longer than submit_timeout_seconds."""
+
+
+def _lower_priority(niceness):
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+def _new_pool(cfg, workers):
+    # forkserver: forking the threaded web process could copy held locks
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_lower_priority, initargs=(cfg["nice"],))
+    atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+    return pool
+
+
+def _get_pool(config, reserved=False):
+    """(executor, slot semaphore) of the shared or the reserved pool."""
+    global _pool, _slots, _reserved_pool, _reserved
+    cfg = config["imaging"]
+    with _lock:
+        if reserved:
+            if _reserved_pool is None:
+                size = max(1, cfg["reserved_slots"])
+                _reserved_pool = _new_pool(cfg, size)
+                _reserved = threading.BoundedSemaphore(size)
+            return _reserved_pool, _reserved
+        if _pool is None:
+            _pool = _new_pool(cfg, cfg["workers"])
+            _slots = threading.BoundedSemaphore(cfg["queue_size"])
+        return _pool, _slots
+
+
+def _task_done(name, slots, future):
+    QUEUE_DEPTH.dec()
+    slots.release()
+    TASKS.labels(task=name, result="failed" if future.exception() else "ok").inc()
+
+
+def _run_inline(name, fn, args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+        TASKS.labels(task=name, result="ok").inc()
+    except Exception as e:
+        future.set_exception(e)
+        TASKS.labels(task=name, result="failed").inc()
+    return future
+
+
+def submit(config, fn, *args, reserved=False):
+    """Queue fn(*args) on the image pool.
+
+    fn must be a module-level function so the workers can import it.
+
+    Args:
+        reserved: Run on the reserved capture pool instead of the shared
+            one, and inline rather than raise Busy.
+
+    Returns:
+        concurrent.futures.Future with fn's result.
+
+    Raises:
+        Busy: No queue slot freed up within imaging.submit_timeout_seconds.
+    """
+    name = fn.__name__.lstrip("_")
+    if not config["imaging"]["workers"]:
+        return _run_inline(name, fn, args)
+
+    pool, slots = _get_pool(config, reserved)
+    if not slots.acquire(timeout=config["imaging"]["submit_timeout_seconds"]):
+        if reserved:
+            TASKS.labels(task=name, result="inline").inc()
+            return _run_inline(name, fn, args)
+        TASKS.labels(task=name, result="busy").inc()
+        raise Busy(f"image queue full ({config['imaging']['queue_size']} tasks)")
+    QUEUE_DEPTH.inc()
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        QUEUE_DEPTH.dec()
+        slots.release()
+        raise
+    future.add_done_callback(lambda f: _task_done(name, slots, f))
+    return future
+
+
+def run(config, fn, *args, reserved=False):
+    """submit() and wait for the result; worker exceptions are re-raised."""
+    return submit(config, fn, *args, reserved=reserved).result()
+
+
+@contextlib.contextmanager
+def share(data):
+    """Expose bytes to the workers through a shared memory block.
+
+    Yields a small picklable reference to pass as a task argument; the
+    block is released when the with-block ends, so wait for the task's
+    result inside it.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        yield (shm.name, len(data))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def read_shared(ref):
+    """Worker side of share(): the bytes behind a reference."""
+    name, size = ref
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
@@ -1,8 +1,19 @@
 import logging
 from datetime import datetime, timezone
 
+import metrics
+
 log = logging.getLogger(__name__)
 
+WRITE_SECONDS = metrics.histogram(
+    "ecogarden_influxdb_write_seconds", "Time to write a batch of health scores")
+WRITE_FAILURES = metrics.counter(
+    "ecogarden_influxdb_write_failures_total", "Failed InfluxDB writes")
+QUERY_SECONDS = metrics.histogram(
+    "ecogarden_influxdb_query_seconds", "Flux query round-trip time", ["query"])
+QUERY_FAILURES = metrics.counter(
+    "ecogarden_influxdb_query_failures_total", "Failed Flux queries", ["query"])
+
 _client = None
 _write_api = None
 
@@ -49,35 +60,41 @@ def write_health_scores(config, analysis):
     bucket = config["influxdb"]["bucket"]
     org = config["influxdb"]["org"]
 
-    from influxdb_client import Point
-
     try:
-        for plant in analysis.get("plants", []):
-            point = (
-                Point("plant_health")
-                .tag("plant_name", plant["name"])
-                .tag("growth_stage", plant.get("observed_stage", "unknown"))
-                .field("health_score", plant.get("health_score", 0))
-                .time(datetime.now(timezone.utc))
-            )
-
-            days_to_harvest = plant.get("days_to_harvest")
-            if isinstance(days_to_harvest, (int, float)):
-                point = point.field("days_to_harvest", int(days_to_harvest))
-
-            write_api.write(bucket=bucket, org=org, record=point)
-
-        # Write overall health
-        overall = analysis.get("overall_health")
-        if overall is not None:
-            point = (
-                Point("plant_health")
-                .tag("plant_name", "_overall")
-                .field("health_score", overall)
-                .time(datetime.now(timezone.utc))
-            )
-            write_api.write(bucket=bucket, org=org, record=point)
-
+        with WRITE_SECONDS.time():
+            _write_points(write_api, bucket, org, analysis)
         log.info("Wrote health scores to InfluxDB")
     except Exception as e:
+        WRITE_FAILURES.inc()
         log.error("Failed to write to InfluxDB: %s", e)
+
+
+def _write_points(write_api, bucket, org, analysis):
+    """Write one point per plant plus the overall score."""
+    from influxdb_client import Point
+
+    for plant in analysis.get("plants", []):
+        point = (
+            Point("plant_health")
+            .tag("plant_name", plant["name"])
+            .tag("growth_stage", plant.get("observed_stage", "unknown"))
+            .field("health_score", plant.get("health_score", 0))
+            .time(datetime.now(timezone.utc))
+        )
+
+        days_to_harvest = plant.get("days_to_harvest")
+        if isinstance(days_to_harvest, (int, float)):
+            point = point.field("days_to_harvest", int(days_to_harvest))
+
+        write_api.write(bucket=bucket, org=org, record=point)
+
+    # Write overall health
+    overall = analysis.get("overall_health")
+    if overall is not None:
+        point = (
+            Point("plant_health")
+            .tag("plant_name", "_overall")
+            .field("health_score", overall)
+            .time(datetime.now(timezone.utc))
+        )
+        write_api.write(bucket=bucket, org=org, record=point)
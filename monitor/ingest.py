@@ -0,0 +1,274 @@
+"""MQTT sensor ingestion: topic patterns, field mappings, rolling statistics.
+
+mqtt.subscriptions maps topic patterns (MQTT wildcards + and #) to the
+payload fields they carry:
+
+    subscriptions:
+      - topic: "/devices/esp8266_5A604B/events"
+        fields:
+          temp_c: [water_temperature, temperature, temp]   # first present wins
+          lux: lux
+      - topic: "homeassistant/sensor/ecogarden_light_level/state"
+        fields:
+          light_pct: {key: value, scale: 100}
+
+A payload that is not a JSON object (a bare number, as Home Assistant's
+statestream publishes) is read as {"value": payload}.
+
+Each sensor keeps its latest timestamped reading and min/max/mean/stddev
+over every window in mqtt.stats_windows. Windows are kept as fixed-size
+buckets with running sums and monotonic min/max queues, so an update is
+O(1) amortized and memory is bounded however fast readings arrive; window
+edges are accurate to one bucket.
+"""
+
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import deque
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+MESSAGES = metrics.counter(
+    "ecogarden_ingest_messages_total", "MQTT messages by ingestion result", ["result"])
+READINGS = metrics.counter(
+    "ecogarden_ingest_readings_total", "Sensor readings ingested", ["sensor"])
+
+# Buckets per window: 1h -> 10 s buckets, 24h -> 4 min buckets
+BUCKETS_PER_WINDOW = 360
+
+DEFAULT_FIELDS = {
+    "temp_c": ["water_temperature", "temperature", "temp"],
+    "lux": ["lux"],
+}
+
+
+def compile_topic(pattern):
+    """Regex for an MQTT subscription pattern with + and # wildcards."""
+    parts = []
+    for level in pattern.split("/"):
+        if level == "#":
+            # "a/#" also matches "a" itself
+            return re.compile("/".join(parts) + ("(?:/.*)?" if parts else ".*") + r"\Z")
+        parts.append("[^/]*" if level == "+" else re.escape(level))
+    return re.compile("/".join(parts) + r"\Z")
+
+
+def _compile_field(spec):
+    """(keys, scale) from a field mapping: "key", [keys], or {key(s), scale}."""
+    scale = 1.0
+    if isinstance(spec, dict):
+        scale = float(spec.get("scale", 1.0))
+        spec = spec.get("keys", spec.get("key"))
+    keys = [spec] if isinstance(spec, str) else list(spec)
+    return keys, scale
+
+
+class RollingStats:
+    """min/max/mean/stddev over a sliding time window, O(1) per update."""
+
+    def __init__(self, window_seconds, buckets=BUCKETS_PER_WINDOW):
+        self.window = window_seconds
+        self.resolution = window_seconds / buckets
+        self._buckets = deque()   # closed buckets: (index, count, sum, sumsq)
+        self._mins = deque()      # (index, min) increasing
+        self._maxs = deque()      # (index, max) decreasing
+        self._current = None      # open bucket: [index, count, sum, sumsq, min, max]
+        self._count = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._shift = None        # first value seen; sums are of (v - shift) for precision
+
+    def add(self, value, now=None):
+        now = time.monotonic() if now is None else now
+        if self._shift is None:
+            self._shift = value
+        index = int(now // self.resolution)
+        if self._current is not None and self._current[0] != index:
+            self._close()
+        if self._current is None:
+            self._current = [index, 0, 0.0, 0.0, value, value]
+        d = value - self._shift
+        b = self._current
+        b[1] += 1
+        b[2] += d
+        b[3] += d * d
+        b[4] = min(b[4], value)
+        b[5] = max(b[5], value)
+        self._expire(index)
+
+    def _close(self):
+        index, count, total, sumsq, lo, hi = self._current
+        self._current = None
+        self._buckets.append((index, count, total, sumsq))
+        self._count += count
+        self._sum += total
+        self._sumsq += sumsq
+        while self._mins and self._mins[-1][1] >= lo:
+            self._mins.pop()
+        self._mins.append((index, lo))
+        while self._maxs and self._maxs[-1][1] <= hi:
+            self._maxs.pop()
+        self._maxs.append((index, hi))
+
+    def _expire(self, index):
+        oldest = index - int(round(self.window / self.resolution)) + 1
+        while self._buckets and self._buckets[0][0] < oldest:
+            _, count, total, sumsq = self._buckets.popleft()
+            self._count -= count
+            self._sum -= total
+            self._sumsq -= sumsq
+        while self._mins and self._mins[0][0] < oldest:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] < oldest:
+            self._maxs.popleft()
+        if self._current is not None and self._current[0] < oldest:
+            self._current = None
+
+    def summary(self, now=None):
+        """{"count", "min", "max", "mean", "stddev"} for the window, or None if empty."""
+        now = time.monotonic() if now is None else now
+        self._expire(int(now // self.resolution))
+        count, total, sumsq = self._count, self._sum, self._sumsq
+        lows = [self._mins[0][1]] if self._mins else []
+        highs = [self._maxs[0][1]] if self._maxs else []
+        if self._current is not None:
+            _, c, s, sq, lo, hi = self._current
+            count, total, sumsq = count + c, total + s, sumsq + sq
+            lows.append(lo)
+            highs.append(hi)
+        if not count:
+            return None
+        mean = total / count
+        variance = max(0.0, sumsq / count - mean * mean)
+        return {
+            "count": count,
+            "min": round(min(lows), 3),
+            "max": round(max(highs), 3),
+            "mean": round(mean + self._shift, 3),
+            "stddev": round(math.sqrt(variance), 3),
+        }
+
+
+class Sensor:
+    """Latest reading of one sensor plus its rolling windows."""
+
+    def __init__(self, windows):
+        self.value = None
+        self.timestamp = None
+        self.topic = None
+        self.windows = {label: RollingStats(seconds) for label, seconds in windows.items()}
+
+    def add(self, value, topic, now):
+        self.value = value
+        self.timestamp = time.time()
+        self.topic = topic
+        for stats in self.windows.values():
+            stats.add(value, now)
+
+    def snapshot(self, now):
+        return {
+            "value": self.value,
+            "timestamp": self.timestamp,
+            "topic": self.topic,
+            **{label: stats.summary(now) for label, stats in self.windows.items()},
+        }
+
+
+def _parse_window(value):
+    """Seconds from "1h", "24h", "30m" or a number of seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(value[:-1]) * units[value[-1]]
+
+
+class Ingest:
+    """Maps MQTT messages to sensor readings and keeps their statistics."""
+
+    def __init__(self, config):
+        mqtt_cfg = config["mqtt"]
+        subscriptions = mqtt_cfg.get("subscriptions") or [
+            {"topic": mqtt_cfg["ecogarden_topic"], "fields": DEFAULT_FIELDS}]
+        self.routes = []
+        for sub in subscriptions:
+            fields = {name: _compile_field(spec) for name, spec in sub["fields"].items()}
+            self.routes.append((sub["topic"], compile_topic(sub["topic"]), fields))
+        self.windows = {label: _parse_window(label) for label in mqtt_cfg["stats_windows"]}
+        self._lock = threading.Lock()
+        self._sensors = {}
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """Call fn(sensor, value, now) for every reading (now is time.monotonic())."""
+        self._listeners.append(fn)
+
+    def topics(self):
+        """Subscription patterns, for the MQTT client."""
+        return [pattern for pattern, _, _ in self.routes]
+
+    def handle(self, topic, payload):
+        """Ingest one raw MQTT message.
+
+        Returns:
+            Number of sensor readings taken from it.
+        """
+        routes = [fields for _, regex, fields in self.routes if regex.match(topic)]
+        if not routes:
+            MESSAGES.labels(result="unmatched").inc()
+            return 0
+        try:
+            data = json.loads(payload.decode() if isinstance(payload, bytes) else payload)
+        except (ValueError, UnicodeDecodeError):
+            MESSAGES.labels(result="invalid").inc()
+            return 0
+        if not isinstance(data, dict):
+            data = {"value": data}
+
+        readings = {}
+        for fields in routes:
+            for name, (keys, scale) in fields.items():
+                for key in keys:
+                    value = data.get(key)
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        readings[name] = value * scale if scale != 1.0 else value
+                        break
+        if not readings:
+            MESSAGES.labels(result="no_fields").inc()
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            for name, value in readings.items():
+                sensor = self._sensors.get(name)
+                if sensor is None:
+                    sensor = self._sensors[name] = Sensor(self.windows)
+                sensor.add(value, topic, now)
+        for name, value in readings.items():
+            READINGS.labels(sensor=name).inc()
+            for fn in self._listeners:
+                try:
+                    fn(name, value, now)
+                except Exception:
+                    log.exception("Sensor listener failed for %s", name)
+        MESSAGES.labels(result="ok").inc()
+        return len(readings)
+
+    def latest(self):
+        """{sensor: latest value}."""
+        with self._lock:
+            return {name: sensor.value for name, sensor in self._sensors.items()}
+
+    def stats(self, name=None):
+        """Snapshot of one sensor (or {sensor: snapshot} for all), with window stats."""
+        now = time.monotonic()
+        with self._lock:
+            if name is not None:
+                sensor = self._sensors.get(name)
+                return sensor.snapshot(now) if sensor else None
+            return {n: sensor.snapshot(now) for n, sensor in self._sensors.items()}
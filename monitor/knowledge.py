@@ -1,12 +1,17 @@
 import logging
 import os
-from datetime import date, datetime
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 
 import yaml
 
 log = logging.getLogger(__name__)
 
 _herbs_cache = None
+_index = None
+_index_lock = threading.Lock()
 
 
 def load_herbs(path=None):
@@ -23,40 +28,163 @@ def load_herbs(path=None):
     return _herbs_cache
 
 
+@lru_cache(maxsize=256)
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
 def get_plant_age(planted_date):
     """Calculate days since planting."""
     if isinstance(planted_date, str):
-        planted_date = datetime.strptime(planted_date, "%Y-%m-%d").date()
+        planted_date = _parse_date(planted_date)
     return (date.today() - planted_date).days
 
 
+class SpeciesStages:
+    """One species' growth stages as sorted boundaries for bisect lookup."""
+
+    def __init__(self, herb):
+        stages = sorted(herb.get("growth_stages", {}).items(), key=lambda item: item[1][0])
+        self.names = [name for name, _ in stages]
+        self.starts = [start for _, (start, _) in stages]
+        self.ends = [end for _, (_, end) in stages]
+        self.harvest = herb.get("days_to_harvest", [60, 90])
+
+    def stage(self, days):
+        """(stage_name, progress_pct) at an age; "mature" outside every stage."""
+        i = bisect_right(self.starts, days) - 1
+        if i < 0:
+            return "mature", 100
+        end = self.ends[i]
+        if end is None:
+            return self.names[i], 100
+        if days >= end:
+            return "mature", 100
+        start = self.starts[i]
+        return self.names[i], int((days - start) / (end - start) * 100)
+
+
+class KnowledgeIndex:
+    """Stage boundaries of every species, computed once from herbs.yaml."""
+
+    def __init__(self, herbs):
+        self.species = {name: SpeciesStages(herb) for name, herb in herbs.items()}
+
+    def stage(self, species, days):
+        stages = self.species.get(species)
+        return stages.stage(days) if stages else ("unknown", 0)
+
+    def forecast(self, plants, days, today=None):
+        """Stage and harvest timeline of every plant for the next `days` days.
+
+        Stage lookup is one numpy searchsorted per species over a
+        (plants x days) age matrix rather than a walk per plant and day.
+
+        Args:
+            plants: Plant config dicts (name, species, planted_date).
+            days: Days to cover, starting today.
+            today: Start date (defaults to today).
+
+        Returns:
+            One dict per plant: age, "stages" as consecutive segments
+            ({stage, start, end, progress_start, progress_end}, dates
+            inclusive) and the harvest window.
+        """
+        import numpy as np
+
+        today = today or date.today()
+        days = max(1, int(days))
+        offsets = np.arange(days)
+        results = [None] * len(plants)
+
+        by_species = {}
+        for i, plant in enumerate(plants):
+            by_species.setdefault(plant["species"], []).append(i)
+
+        for species, rows in by_species.items():
+            planted = [_planted(plants[i]) for i in rows]
+            ages = np.array([(today - p).days for p in planted])[:, None] + offsets[None, :]
+            stages = self.species.get(species)
+            if stages is None or not stages.names:
+                for row, i in enumerate(rows):
+                    results[i] = _plant_forecast(plants[i], planted[row], today, ages[row],
+                                                 None, None, None)
+                continue
+
+            starts = np.array(stages.starts)
+            ends = np.array([np.inf if e is None else e for e in stages.ends], dtype=float)
+            idx = np.searchsorted(starts, ages, side="right") - 1
+            safe = np.clip(idx, 0, None)
+            start, end = starts[safe], ends[safe]
+            mature = (idx < 0) | (ages >= end)
+            span = np.where(np.isfinite(end), end - start, 1)
+            progress = np.where(np.isfinite(end), ((ages - start) * 100) // span, 100)
+            progress = np.where(mature, 100, progress).astype(int)
+            names = np.array(stages.names + ["mature"])
+            stage_idx = np.where(mature, len(stages.names), safe)
+            for row, i in enumerate(rows):
+                results[i] = _plant_forecast(plants[i], planted[row], today, ages[row],
+                                             names[stage_idx[row]], progress[row], stages.harvest)
+        return results
+
+
+def _planted(plant):
+    planted = plant["planted_date"]
+    return _parse_date(planted) if isinstance(planted, str) else planted
+
+
+def _plant_forecast(plant, planted, today, ages, names, progress, harvest):
+    """Collapse one plant's per-day stage arrays into segments."""
+    import numpy as np
+
+    segments = []
+    if names is not None:
+        # Days where the stage changes start a new segment
+        change = [0, *(np.flatnonzero(names[1:] != names[:-1]) + 1).tolist(), len(names)]
+        for first, after in zip(change, change[1:]):
+            last = after - 1
+            segments.append({
+                "stage": str(names[first]),
+                "start": (today + timedelta(days=first)).isoformat(),
+                "end": (today + timedelta(days=last)).isoformat(),
+                "progress_start": int(progress[first]),
+                "progress_end": int(progress[last]),
+            })
+    result = {
+        "name": plant["name"],
+        "species": plant["species"],
+        "age_days": int(ages[0]),
+        "stages": segments,
+        "harvest": None,
+    }
+    if harvest:
+        first = planted + timedelta(days=harvest[0])
+        last = planted + timedelta(days=harvest[1])
+        result["harvest"] = {
+            "window_start": first.isoformat(),
+            "window_end": last.isoformat(),
+            "days_until": max(0, (first - today).days),
+            "ready": first <= today,
+        }
+    return result
+
+
+def get_index():
+    """Shared KnowledgeIndex over herbs.yaml, built on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = KnowledgeIndex(load_herbs())
+        return _index
+
+
 def get_growth_stage(species, days):
     """Determine current growth stage for a species at a given age.
 
     Returns:
         (stage_name, progress_pct) where progress_pct is how far through the stage.
     """
-    herbs = load_herbs()
-    herb = herbs.get(species)
-    if not herb:
-        return "unknown", 0
-
-    stages = herb.get("growth_stages", {})
-    current_stage = "mature"
-    progress = 100
-
-    for stage_name, (start, end) in stages.items():
-        if end is None:
-            if days >= start:
-                current_stage = stage_name
-                progress = 100
-                break
-        elif start <= days < end:
-            current_stage = stage_name
-            progress = int((days - start) / (end - start) * 100)
-            break
-
-    return current_stage, progress
+    return get_index().stage(species, days)
 
 
 def get_care_advice(species, days, temp_c=None):
@@ -1,10 +1,14 @@
 import json
 import logging
+import os
 import threading
 import time
 
 import paho.mqtt.client as mqtt
 
+from ingest import Ingest
+from outbox import Outbox
+
 log = logging.getLogger(__name__)
 
 
@@ -18,8 +22,7 @@ class MQTTClient:
         self.ecogarden_topic = config["mqtt"]["ecogarden_topic"]
         self.publish_topic = config["mqtt"]["publish_topic"]
 
-        self._sensor_data = {"temp_c": None}
-        self._lock = threading.Lock()
+        self.ingest = Ingest(config)
         self._connected = False
 
         self.client = mqtt.Client(
@@ -30,40 +33,41 @@ class MQTTClient:
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
 
+        out = config["mqtt"]["outbox"]
+        self.outbox = Outbox(
+            self.client,
+            os.path.join(config["storage"]["state_dir"], "mqtt_outbox.json"),
+            qos=out["qos"],
+            max_messages=out["max_messages"],
+            ack_timeout=out["ack_timeout_seconds"],
+        )
+
     def _on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             log.info("Connected to MQTT broker %s:%d", self.broker, self.port)
             self._connected = True
-            client.subscribe(self.ecogarden_topic)
-            log.info("Subscribed to %s", self.ecogarden_topic)
+            for topic in self.ingest.topics():
+                client.subscribe(topic)
+                log.info("Subscribed to %s", topic)
+            self.outbox.set_connected(True)
         else:
             log.error("MQTT connection failed with code %s", rc)
 
     def _on_disconnect(self, client, userdata, flags, rc, properties=None):
         self._connected = False
+        self.outbox.set_connected(False)
         if rc != 0:
             log.warning("Unexpected MQTT disconnect (rc=%s), will reconnect", rc)
 
     def _on_message(self, client, userdata, msg):
-        try:
-            payload = json.loads(msg.payload.decode())
-        except (json.JSONDecodeError, UnicodeDecodeError):
-            return
-
-        with self._lock:
-            if "water_temperature" in payload:
-                self._sensor_data["temp_c"] = payload["water_temperature"]
-            elif "temperature" in payload:
-                self._sensor_data["temp_c"] = payload["temperature"]
-            elif "temp" in payload:
-                self._sensor_data["temp_c"] = payload["temp"]
-            if "lux" in payload:
-                self._sensor_data["lux"] = payload["lux"]
+        self.ingest.handle(msg.topic, msg.payload)
 
     def start(self):
         """Connect to broker and start the network loop in a background thread."""
+        self.outbox.start()
         try:
-            self.client.connect(self.broker, self.port, keepalive=60)
+            # Async so a broker that is down at boot is retried by the network loop
+            self.client.connect_async(self.broker, self.port, keepalive=60)
             self.client.loop_start()
             log.info("MQTT client started")
 
@@ -81,17 +85,17 @@ class MQTTClient:
 
     def get_latest_sensor_data(self):
         """Return a copy of the latest sensor readings."""
-        with self._lock:
-            return dict(self._sensor_data)
+        return {"temp_c": None, **self.ingest.latest()}
+
+    def get_sensor_stats(self, name=None):
+        """Latest reading and rolling-window stats per sensor (see ingest.Ingest.stats)."""
+        return self.ingest.stats(name)
 
     def is_connected(self):
         return self._connected
 
     def publish_analysis(self, analysis, plants):
-        """Publish analysis results to MQTT."""
-        if not self._connected:
-            return
-
+        """Publish analysis results to MQTT (retained; queued while offline)."""
         # Find plant closest to harvest
         next_harvest = None
         min_days = float("inf")
@@ -118,25 +122,21 @@ class MQTTClient:
         if ages:
             payload["days_since_planted"] = max(ages)
 
-        try:
-            self.client.publish(
-                self.publish_topic,
-                json.dumps(payload),
-                retain=True,
-            )
-            log.info("Published analysis to MQTT")
-        except Exception as e:
-            log.error("Failed to publish analysis: %s", e)
+        self.outbox.publish(self.publish_topic, json.dumps(payload), retain=True)
+        log.info("Queued analysis for MQTT (%d message(s) waiting)", self.outbox.depth())
+
+    def publish_alert(self, alert):
+        """Publish an alert (missed feed, ...) to <publish_topic>/alert; queued while offline."""
+        self.outbox.publish(self.publish_topic + "/alert", json.dumps(alert))
 
     def _heartbeat_loop(self):
         """Publish heartbeat every 5 minutes."""
         while True:
             time.sleep(300)
-            if self._connected:
-                try:
-                    self.client.publish(
-                        self.publish_topic + "/heartbeat",
-                        json.dumps({"status": "online", "timestamp": time.time()}),
-                    )
-                except Exception:
-                    pass
+            # A heartbeat is only meaningful now: never spooled
+            self.outbox.publish(
+                self.publish_topic + "/heartbeat",
+                json.dumps({"status": "online", "timestamp": time.time()}),
+                qos=0,
+                spool=False,
+            )
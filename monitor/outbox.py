@@ -0,0 +1,158 @@
+"""Outbound MQTT queue that survives broker outages and restarts.
+
+Everything the monitor publishes goes through an Outbox. Messages wait
+in a FIFO that is spooled to state/mqtt_outbox.json. A sender thread
+drains it in order while the client is connected and resumes on
+reconnect. A message leaves the queue only once the broker has
+acknowledged it (or, for QoS 0, once it was handed to the socket).
+
+Retained topics are state, not events: a newer retained message
+replaces a queued one for the same topic, so after an outage Home
+Assistant gets the latest analysis and not a backlog of stale ones.
+Non-spooled messages (heartbeats) are sent only while connected.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEPTH = metrics.gauge("ecogarden_mqtt_outbox_depth", "MQTT messages waiting to be published")
+PUBLISHED = metrics.counter(
+    "ecogarden_mqtt_published_total", "MQTT publishes by outcome", ["result"])
+PUBLISH_SECONDS = metrics.histogram(
+    "ecogarden_mqtt_publish_seconds", "Time from queueing to broker acknowledgement")
+
+RETRY_SECONDS = 5
+
+
+class Outbox:
+    """Ordered, disk-spooled publish queue for one paho client."""
+
+    def __init__(self, client, spool_path, qos=1, max_messages=1000, ack_timeout=10):
+        self.client = client
+        self.spool_path = spool_path
+        self.qos = qos
+        self.max_messages = max_messages
+        self.ack_timeout = ack_timeout
+        self._cond = threading.Condition()
+        self._queue = self._load()
+        self._connected = False
+        self._sending = None
+        DEPTH.set(len(self._queue))
+
+    def _load(self):
+        try:
+            with open(self.spool_path) as f:
+                queue = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable MQTT spool %s: %s", self.spool_path, e)
+            return []
+        if queue:
+            log.info("%d MQTT messages spooled from the last run", len(queue))
+        return queue
+
+    def _save(self):
+        tmp_path = self.spool_path + ".tmp"
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump([m for m in self._queue if m.get("spool", True)], f)
+        os.replace(tmp_path, self.spool_path)
+
+    def publish(self, topic, payload, qos=None, retain=False, spool=True):
+        """Queue a message; it is sent as soon as the broker is reachable.
+
+        Args:
+            topic: MQTT topic.
+            payload: str (JSON-encode dicts first).
+            qos: 0, 1 or 2; defaults to mqtt.outbox.qos.
+            retain: Publish retained; replaces a queued message for the same topic.
+            spool: False for messages only worth sending now (heartbeats):
+                dropped while disconnected, never written to disk.
+        """
+        message = {"topic": topic, "payload": payload, "qos": self.qos if qos is None else qos,
+                   "retain": retain, "queued": time.time()}
+        with self._cond:
+            if not spool:
+                if not self._connected:
+                    PUBLISHED.labels(result="dropped").inc()
+                    return
+                message["spool"] = False
+            if retain:
+                stale = [m for m in self._queue if m["retain"] and m["topic"] == topic
+                         and m is not self._sending]
+                for m in stale:
+                    self._queue.remove(m)
+                PUBLISHED.labels(result="coalesced").inc(len(stale))
+            self._queue.append(message)
+            while len(self._queue) > self.max_messages:
+                dropped = next((m for m in self._queue if m is not self._sending), None)
+                self._queue.remove(dropped)
+                PUBLISHED.labels(result="dropped").inc()
+                log.warning("MQTT outbox full, dropped message for %s", dropped["topic"])
+            if spool:
+                self._persist()
+            DEPTH.set(len(self._queue))
+            self._cond.notify()
+
+    def _persist(self):
+        try:
+            self._save()
+        except OSError as e:
+            log.warning("Failed to write MQTT spool: %s", e)
+
+    def depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def set_connected(self, connected):
+        """Called from the client's connect/disconnect callbacks."""
+        with self._cond:
+            self._connected = connected
+            self._cond.notify()
+
+    def start(self):
+        threading.Thread(target=self._run, name="mqtt-outbox", daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._connected and self._queue):
+                    self._cond.wait()
+                message = self._sending = self._queue[0]
+            ok = self._send(message)
+            with self._cond:
+                self._sending = None
+                if ok:
+                    self._queue.remove(message)
+                    if message.get("spool", True):
+                        self._persist()
+                    DEPTH.set(len(self._queue))
+                else:
+                    # Leave it at the head; retry after a pause or on reconnect
+                    self._cond.wait(RETRY_SECONDS)
+
+    def _send(self, message):
+        try:
+            info = self.client.publish(message["topic"], message["payload"],
+                                       qos=message["qos"], retain=message["retain"])
+            # QoS 0 is "published" once written to the socket, 1 and 2 once acknowledged
+            if info.rc == 0:
+                info.wait_for_publish(timeout=self.ack_timeout)
+            ok = info.rc == 0 and info.is_published()
+        except (RuntimeError, ValueError, OSError) as e:
+            log.warning("MQTT publish to %s failed: %s", message["topic"], e)
+            ok = False
+        if ok:
+            PUBLISHED.labels(result="ok").inc()
+            PUBLISH_SECONDS.observe(max(0.0, time.time() - message["queued"]))
+        else:
+            PUBLISHED.labels(result="retry").inc()
+        return ok
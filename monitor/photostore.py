@@ -0,0 +1,265 @@
+"""Tiered photo retention and stable photo names across formats.
+
+Photos are addressed by their capture name (2026-02-08_12-30.jpg) for
+their whole life, whatever is on disk:
+
+    age < tiers.compact_after_days   full-resolution JPEG, as captured
+    age < storage.retention_days     transcoded to tiers.format (WebP or
+                                     AVIF) at tiers.resolution
+    older                            thinned to the noon shot by cleanup
+
+Gallery URLs, timelapse inputs and deletes use the .jpg name; resolve()
+maps it to whichever file exists, and the read helpers also find photos
+of days packed into monthly archives (see archive.py). Transcoding runs
+in a small process pool at low CPU priority and is idempotent: a photo
+already compacted is skipped, and a crash between writing the compact
+file and removing the JPEG is finished on the next run.
+"""
+
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+from PIL import Image, features
+
+import imaging
+import metrics
+import storage
+
+log = logging.getLogger(__name__)
+
+PHOTO_EXT = ".jpg"
+COMPACT_EXTS = {"webp": ".webp", "avif": ".avif"}
+PHOTO_EXTS = (PHOTO_EXT,) + tuple(COMPACT_EXTS.values())
+
+TRANSCODED = metrics.counter(
+    "ecogarden_photos_transcoded_total", "Photos moved to the compact tier", ["result"])
+TRANSCODE_SAVED = metrics.counter(
+    "ecogarden_photos_transcode_saved_bytes_total", "Bytes saved by compact-tier transcoding")
+
+
+def is_photo(filename):
+    """True for a visible photo file in any tier's format."""
+    return filename.endswith(PHOTO_EXTS) and not filename.startswith(".")
+
+
+def logical_name(filename):
+    """Stable name of a photo: 2026-02-08_12-30.webp -> 2026-02-08_12-30.jpg"""
+    return os.path.splitext(os.path.basename(filename))[0] + PHOTO_EXT
+
+
+def parse_photo_time(filename):
+    """Capture time of day from a photo name, or None if it doesn't parse.
+
+    2026-02-08_12-30.jpg (or .webp/.avif, or a full path) -> time(12, 30)
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        hour, minute = stem.rsplit("_", 1)[-1].split("-")[:2]
+        return time(int(hour), int(minute))
+    except ValueError:
+        return None
+
+
+def find_noon_photo(filenames):
+    """The photo closest to 12:00 among filenames (names or paths), or None."""
+    best = None
+    best_diff = None
+    for fname in filenames:
+        if not is_photo(os.path.basename(fname)):
+            continue
+        taken = parse_photo_time(fname)
+        if taken is None:
+            continue
+        diff = abs(taken.hour * 60 + taken.minute - 720)
+        if best_diff is None or diff < best_diff:
+            best, best_diff = fname, diff
+    return best
+
+
+def list_photos(day_dir):
+    """On-disk photo paths in a day directory, one per photo, by name.
+
+    If both a JPEG and its compact copy exist (a transcode was interrupted
+    before the JPEG was removed), the JPEG wins.
+    """
+    try:
+        names = os.listdir(day_dir)
+    except OSError:
+        return []
+    by_stem = {}
+    for name in names:
+        if not is_photo(name):
+            continue
+        stem = os.path.splitext(name)[0]
+        if stem not in by_stem or name.endswith(PHOTO_EXT):
+            by_stem[stem] = name
+    return [os.path.join(day_dir, by_stem[stem]) for stem in sorted(by_stem)]
+
+
+def resolve(path):
+    """On-disk file for a photo path in any format, or None if it is gone."""
+    stem = os.path.splitext(path)[0]
+    for ext in PHOTO_EXTS:
+        if os.path.isfile(stem + ext):
+            return stem + ext
+    return None
+
+
+def read_bytes(config, path):
+    """Stored bytes of a photo, from its file or from an archive pack.
+
+    Raises:
+        FileNotFoundError: The photo is neither on disk nor packed.
+    """
+    on_disk = resolve(path)
+    if on_disk:
+        with open(on_disk, "rb") as f:
+            return f.read()
+    import archive
+    data = archive.read(config, path)
+    if data is None:
+        raise FileNotFoundError(path)
+    return data
+
+
+def stat_photo(config, path):
+    """(mtime, size) of a photo on disk or in an archive pack."""
+    on_disk = resolve(path)
+    if on_disk:
+        st = os.stat(on_disk)
+        return st.st_mtime, st.st_size
+    import archive
+    entry = archive.lookup(config, path)
+    if entry is None:
+        raise FileNotFoundError(path)
+    return entry["mtime"], entry["size"]
+
+
+def open_image(config, path):
+    """PIL image of a photo on disk or in an archive pack."""
+    on_disk = resolve(path)
+    if on_disk:
+        return Image.open(on_disk)
+    return Image.open(io.BytesIO(read_bytes(config, path)))
+
+
+def read_jpeg(config, path, quality=90):
+    """JPEG bytes of a photo, encoding compact-tier files on the fly.
+
+    The encode runs in the image pool (see imaging.py), so it can raise
+    imaging.Busy.
+    """
+    data = read_bytes(config, path)
+    if data[:3] == b"\xff\xd8\xff":
+        return data
+    with imaging.share(data) as ref:
+        return imaging.run(config, _encode_jpeg, ref, quality)
+
+
+def _encode_jpeg(ref, quality):
+    """Worker: JPEG bytes of an image held in shared memory."""
+    with Image.open(io.BytesIO(imaging.read_shared(ref))) as img:
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+
+
+def _lower_priority(niceness):
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+def _transcode(src, dst, size, fmt, quality):
+    """Worker: write a resized compact copy of src to dst, atomically."""
+    tmp_path = os.path.join(os.path.dirname(dst), "." + os.path.basename(dst) + ".tmp")
+    st = os.stat(src)
+    with Image.open(src) as img:
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.LANCZOS)
+        img.save(tmp_path, format=fmt.upper(), quality=quality)
+    os.utime(tmp_path, (st.st_atime, st.st_mtime))
+    os.replace(tmp_path, dst)
+    return st.st_size, os.path.getsize(dst)
+
+
+def _compact_format(tiers):
+    fmt = tiers["format"].lower()
+    if fmt not in COMPACT_EXTS or not features.check(fmt):
+        log.warning("Compact format %s unavailable in Pillow, using webp", fmt)
+        fmt = "webp"
+    return fmt
+
+
+def _pending(config, fmt):
+    """(jpeg, compact) path pairs for photos that should be compacted."""
+    tiers = config["storage"]["tiers"]
+    horizon = date.today() - timedelta(days=tiers["compact_after_days"])
+    photo_dir = config["storage"]["photo_dir"]
+    ext = COMPACT_EXTS[fmt]
+    try:
+        days = sorted(os.listdir(photo_dir))
+    except OSError:
+        return []
+    pending = []
+    for name in days:
+        try:
+            day = datetime.strptime(name, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if day >= horizon:
+            continue
+        day_dir = os.path.join(photo_dir, name)
+        for f in sorted(os.listdir(day_dir)):
+            if f.endswith(PHOTO_EXT) and not f.startswith("."):
+                src = os.path.join(day_dir, f)
+                pending.append((src, os.path.splitext(src)[0] + ext))
+    return pending
+
+
+def run_tiering(config):
+    """Transcode photos past compact_after_days into the compact format.
+
+    Returns:
+        Number of photos transcoded.
+    """
+    tiers = config["storage"]["tiers"]
+    fmt = _compact_format(tiers)
+    size = tuple(int(v) for v in tiers["resolution"].split("x"))
+    pending = _pending(config, fmt)
+    if not pending:
+        return 0
+
+    done = saved = 0
+    with ProcessPoolExecutor(max_workers=tiers["workers"], initializer=_lower_priority,
+                             initargs=(tiers["nice"],)) as pool:
+        futures = []
+        for src, dst in pending:
+            if os.path.isfile(dst):
+                # Finished before a crash; only the JPEG removal is missing
+                futures.append((src, None))
+            else:
+                futures.append((src, pool.submit(_transcode, src, dst, size, fmt, tiers["quality"])))
+
+        for src, future in futures:
+            try:
+                if future is not None:
+                    before, after = future.result()
+                    saved += before - after
+                os.remove(src)
+            except Exception as e:
+                TRANSCODED.labels(result="failed").inc()
+                log.warning("Failed to transcode %s: %s", src, e)
+                continue
+            TRANSCODED.labels(result="ok").inc()
+            storage.update(config, src)
+            done += 1
+
+    TRANSCODE_SAVED.inc(max(0, saved))
+    log.info("Tiering: compacted %d photos to %s, saved %.1f MB", done, fmt, saved / (1024 * 1024))
+    return done
@@ -0,0 +1,173 @@
+"""Per-request timing: Server-Timing headers, slow-request log and profiler.
+
+Handlers wrap expensive sections in phase("name") and the breakdown shows
+up in the browser devtools (Server-Timing), in the slow-request log for
+requests over web.slow_request_ms, and in /api/debug/slow. With
+web.profile enabled a sampling profiler records where in-flight request
+threads spend their time, and slow requests get their hottest stacks
+attached.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from flask import g, has_request_context, jsonify, request
+
+import metrics
+
+slow_log = logging.getLogger("ecogarden.slow_requests")
+
+HTTP_SECONDS = metrics.histogram(
+    "ecogarden_http_request_seconds", "HTTP request handling time", ["method", "endpoint", "status"])
+SLOW_REQUESTS = metrics.counter(
+    "ecogarden_http_slow_requests_total", "Requests over the slow threshold", ["endpoint"])
+
+_recent_slow = deque(maxlen=20)
+
+
+@contextmanager
+def phase(name):
+    """Time a named sub-phase of the current request (no-op outside one)."""
+    if not has_request_context() or "phases" not in g:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        g.phases.append((name, time.monotonic() - start))
+
+
+def timed_json(data):
+    """jsonify() with serialisation recorded as its own phase."""
+    with phase("json"):
+        return jsonify(data)
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight request threads at a fixed interval.
+
+    Only threads registered via track() are sampled, so the cost is
+    proportional to concurrent requests, not to all threads in the process.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samples = {}
+        thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        thread.start()
+
+    def track(self, ident):
+        with self._lock:
+            self._samples[ident] = Counter()
+
+    def untrack(self, ident):
+        with self._lock:
+            return self._samples.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                idents = list(self._samples)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 12:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                    frame = frame.f_back
+                with self._lock:
+                    counter = self._samples.get(ident)
+                    if counter is not None:
+                        counter[tuple(reversed(stack))] += 1
+
+
+def _open_slow_log(path):
+    if slow_log.handlers:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S"))
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.INFO)
+
+
+def init_app(app, config):
+    """Install the timing hooks and the /api/debug/slow endpoint."""
+    web = config["web"]
+    threshold = web["slow_request_ms"] / 1000.0
+    profiler = SamplingProfiler(web["profile_interval_ms"] / 1000.0) if web["profile"] else None
+    _open_slow_log(os.path.join(config["storage"]["state_dir"], "slow_requests.log"))
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.monotonic()
+        g.phases = []
+        if profiler:
+            profiler.track(threading.get_ident())
+
+    @app.after_request
+    def _finish_timer(response):
+        start = g.get("request_start")
+        if start is None:
+            return response
+        total = time.monotonic() - start
+        samples = profiler.untrack(threading.get_ident()) if profiler else None
+
+        # Label by route pattern, not raw path, to keep cardinality bounded
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.labels(
+            method=request.method, endpoint=rule, status=response.status_code,
+        ).observe(total)
+
+        timings = [f"{name};dur={dur * 1000:.1f}" for name, dur in g.phases]
+        timings.append(f"total;dur={total * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+
+        if total >= threshold:
+            _record_slow(rule, response.status_code, total, g.phases, samples)
+        return response
+
+    @app.route("/api/debug/slow")
+    def api_debug_slow():
+        """Most recent slow requests with their phase breakdown."""
+        return jsonify(list(_recent_slow))
+
+
+def _record_slow(rule, status, total, phases, samples):
+    SLOW_REQUESTS.labels(endpoint=rule).inc()
+    breakdown = " ".join(f"{name}={dur * 1000:.1f}ms" for name, dur in phases)
+    slow_log.info("%s %s %.1fms status=%s %s", request.method, request.full_path.rstrip("?"),
+                  total * 1000, status, breakdown)
+
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": rule,
+        "status": status,
+        "total_ms": round(total * 1000, 1),
+        "phases": {name: round(dur * 1000, 1) for name, dur in phases},
+    }
+    if samples:
+        top = samples.most_common(3)
+        count = sum(samples.values())
+        entry["stacks"] = [
+            {"samples": n, "share": round(n / count, 2), "stack": list(stack)} for stack, n in top
+        ]
+        for stack, n in top:
+            slow_log.info("  %d/%d samples:\n    %s", n, count, "\n    ".join(stack))
+    _recent_slow.append(entry)
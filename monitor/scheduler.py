@@ -1,17 +1,344 @@
+import heapq
+import itertools
+import json
 import logging
+import os
 import threading
 import time
-from datetime import datetime
-
-import schedule
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
 
+import metrics
 from capture import capture_photo
 from timelapse import generate_daily_timelapse, generate_weekly_timelapse
 from analyzer import analyze_plants
+from archive import run_packing
 from cleanup import run_cleanup
+from eviction import run_eviction
+from feeding import check_missed as check_missed_feeds, feed_slot, schedule as feeding_schedule
+from photostore import run_tiering
+from sprites import build_sprite
+from storage import reconcile as reconcile_storage
 
 log = logging.getLogger(__name__)
 
+JOB_SECONDS = metrics.histogram("ecogarden_job_seconds", "Scheduled job run time", ["job"])
+JOB_FAILURES = metrics.counter("ecogarden_job_failures_total", "Scheduled job failures", ["job"])
+JOB_LATENESS = metrics.histogram(
+    "ecogarden_job_start_delay_seconds", "Delay between a job's slot and its start", ["group"])
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Longest the dispatcher sleeps in one go, so wall-clock jumps (NTP sync
+# after boot on the Pi) are noticed within a minute
+MAX_SLEEP = 60
+
+
+def _parse_hhmm(value):
+    hour, minute = value.split(":")
+    return int(hour), int(minute)
+
+
+class Interval:
+    """Every N minutes, aligned to the clock (e.g. :00 and :30 for 30 min)."""
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+
+    def next_after(self, dt):
+        midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = int((dt - midnight).total_seconds() // 60)
+        slots = elapsed // self.minutes + 1
+        return midnight + timedelta(minutes=slots * self.minutes)
+
+    def __str__(self):
+        return f"every {self.minutes} min"
+
+
+class Daily:
+    """Once a day at HH:MM."""
+
+    def __init__(self, at):
+        self.at = at
+        self.hour, self.minute = _parse_hhmm(at)
+
+    def next_after(self, dt):
+        candidate = dt.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate <= dt:
+            candidate += timedelta(days=1)
+        return candidate
+
+    def previous(self, dt):
+        """Most recent slot at or before dt."""
+        candidate = dt.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate > dt:
+            candidate -= timedelta(days=1)
+        return candidate
+
+    def __str__(self):
+        return f"daily at {self.at}"
+
+
+class Weekly:
+    """Once a week on a weekday at HH:MM."""
+
+    def __init__(self, weekday, at):
+        self.weekday = weekday
+        self.at = at
+        self.day_index = WEEKDAYS.index(weekday.lower())
+        self.hour, self.minute = _parse_hhmm(at)
+
+    def next_after(self, dt):
+        candidate = dt.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        candidate += timedelta(days=(self.day_index - dt.weekday()) % 7)
+        if candidate <= dt:
+            candidate += timedelta(days=7)
+        return candidate
+
+    def previous(self, dt):
+        """Most recent slot at or before dt."""
+        candidate = dt.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        candidate -= timedelta(days=(dt.weekday() - self.day_index) % 7)
+        if candidate > dt:
+            candidate -= timedelta(days=7)
+        return candidate
+
+    def __str__(self):
+        return f"{self.weekday} at {self.at}"
+
+
+class Job:
+    """A named job with a trigger and a concurrency group."""
+
+    def __init__(self, name, func, trigger, group, catch_up):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.group = group
+        self.catch_up = catch_up
+        self.next_run = None
+        self.running = False
+
+
+class JobLedger:
+    """Persisted record of each job's last run, kept in a small JSON file.
+
+    Survives restarts so missed slots can be detected and /api/jobs can
+    show when each job last ran and how long it took.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning("Ignoring unreadable job ledger %s: %s", path, e)
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._entries.get(name, {}))
+
+    def record(self, name, scheduled_for, started, duration, error=None):
+        with self._lock:
+            entry = self._entries.setdefault(name, {"runs": 0, "failures": 0})
+            entry["runs"] += 1
+            entry["last_run"] = started.isoformat(timespec="seconds")
+            entry["last_duration_s"] = round(duration, 2)
+            entry["last_error"] = error
+            if error:
+                entry["failures"] += 1
+            else:
+                entry["last_success"] = entry["last_run"]
+                entry["last_scheduled"] = scheduled_for.isoformat(timespec="seconds")
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Scheduler:
+    """Deadline-ordered job dispatcher backed by a small worker pool.
+
+    The dispatcher thread sleeps until the earliest deadline in a heap and
+    hands due jobs to a thread pool, so a long ffmpeg render or API call
+    never delays a capture. Jobs share concurrency groups with a limit
+    each; a job that comes due while its group is full waits in the
+    group's queue and starts as soon as a slot frees.
+    """
+
+    def __init__(self, group_limits, ledger, workers=None):
+        self.group_limits = dict(group_limits)
+        self.ledger = ledger
+        # One worker per group slot means no group can starve another
+        workers = workers or sum(self.group_limits.values())
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._active = {g: 0 for g in self.group_limits}
+        self._waiting = {g: deque() for g in self.group_limits}
+        self._thread = None
+
+    def add(self, name, func, trigger, group, run_now=False, catch_up=True):
+        """Register a job. func is called with the scheduled datetime.
+
+        catch_up marks jobs whose missed slots should be run after a
+        restart (see catch_up_missed); it needs a trigger with previous().
+        """
+        if group not in self.group_limits:
+            raise ValueError(f"Unknown job group: {group}")
+        job = Job(name, func, trigger, group, catch_up and hasattr(trigger, "previous"))
+        with self._cond:
+            self._jobs[name] = job
+            first = datetime.now() if run_now else trigger.next_after(datetime.now())
+            self._push(job, first)
+        return job
+
+    def _push(self, job, when):
+        job.next_run = when
+        heapq.heappush(self._heap, (when, next(self._seq), job.name, when, True))
+        self._cond.notify()
+
+    def _push_extra(self, job, deadline, scheduled_for):
+        """Queue a one-off run that does not move the job's regular slot."""
+        heapq.heappush(self._heap, (deadline, next(self._seq), job.name, scheduled_for, False))
+        self._cond.notify()
+
+    def run_now(self, name):
+        """Queue an extra run of a registered job right away."""
+        with self._cond:
+            now = datetime.now()
+            self._push_extra(self._jobs[name], now, now)
+
+    def catch_up_missed(self, grace_minutes, stagger_seconds):
+        """Run slots missed while the service was down, once each.
+
+        Only the most recent slot of each catch-up job is considered, and
+        only if it fell within the grace window and the ledger has no
+        successful run for it. Runs are spaced stagger_seconds apart so a
+        restart does not start every heavy job at once.
+        """
+        now = datetime.now()
+        grace = timedelta(minutes=grace_minutes)
+        delay = 0
+        with self._cond:
+            for job in self._jobs.values():
+                if not job.catch_up:
+                    continue
+                slot = job.trigger.previous(now)
+                if now - slot > grace:
+                    continue
+                entry = self.ledger.get(job.name)
+                if not entry:
+                    # Never ran on this install: nothing was missed yet
+                    continue
+                last = entry.get("last_scheduled")
+                if last and datetime.fromisoformat(last) >= slot:
+                    continue
+                log.info("Catching up missed %s run from %s (starting in %ds)",
+                         job.name, slot.strftime("%Y-%m-%d %H:%M"), delay)
+                self._push_extra(job, now + timedelta(seconds=delay), slot)
+                delay += stagger_seconds
+
+    def describe(self):
+        """Snapshot of all jobs with next/last run times for the API."""
+        with self._cond:
+            jobs = list(self._jobs.values())
+        result = []
+        for job in sorted(jobs, key=lambda j: j.next_run):
+            entry = self.ledger.get(job.name)
+            result.append({
+                "name": job.name,
+                "group": job.group,
+                "schedule": str(job.trigger),
+                "running": job.running,
+                "next_run": job.next_run.isoformat(timespec="seconds"),
+                "last_run": entry.get("last_run"),
+                "last_success": entry.get("last_success"),
+                "last_duration_s": entry.get("last_duration_s"),
+                "last_error": entry.get("last_error"),
+                "runs": entry.get("runs", 0),
+                "failures": entry.get("failures", 0),
+            })
+        return result
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = datetime.now()
+                while self._heap and self._heap[0][0] <= now:
+                    when, _, name, scheduled_for, regular = heapq.heappop(self._heap)
+                    job = self._jobs[name]
+                    if regular:
+                        # Schedule the following slot
+                        self._push(job, job.trigger.next_after(max(when, now)))
+                    self._submit(job, scheduled_for)
+
+                timeout = MAX_SLEEP
+                if self._heap:
+                    timeout = min(MAX_SLEEP, (self._heap[0][0] - now).total_seconds())
+                self._cond.wait(timeout=max(0.0, timeout))
+
+    def _submit(self, job, scheduled_for):
+        """Start a due job, or park it until its group has a free slot."""
+        if self._active[job.group] >= self.group_limits[job.group]:
+            waiting = self._waiting[job.group]
+            if any(name == job.name for name, _ in waiting):
+                log.info("Job %s still queued, skipping duplicate run", job.name)
+            else:
+                log.info("Job %s waiting for a free %s slot", job.name, job.group)
+                waiting.append((job.name, scheduled_for))
+            return
+        self._active[job.group] += 1
+        job.running = True
+        self._pool.submit(self._execute, job, scheduled_for)
+
+    def _execute(self, job, scheduled_for):
+        started = datetime.now()
+        start = time.monotonic()
+        error = None
+        try:
+            job.func(scheduled_for)
+        except Exception as e:
+            JOB_FAILURES.labels(job=job.name).inc()
+            log.error("Job %s failed: %s", job.name, e)
+            error = str(e)
+        finally:
+            duration = time.monotonic() - start
+            JOB_SECONDS.labels(job=job.name).observe(duration)
+            JOB_LATENESS.labels(group=job.group).observe(
+                max(0.0, (started - scheduled_for).total_seconds()))
+            log.debug("Job %s finished in %.1fs (started %.1fs late)",
+                      job.name, duration, (started - scheduled_for).total_seconds())
+            try:
+                self.ledger.record(job.name, scheduled_for, started, duration, error)
+            except OSError as e:
+                log.warning("Failed to update job ledger: %s", e)
+            with self._cond:
+                job.running = False
+                self._active[job.group] -= 1
+                waiting = self._waiting[job.group]
+                if waiting:
+                    name, when = waiting.popleft()
+                    self._submit(self._jobs[name], when)
+
 
 def _is_capture_hour(config):
     """Check if current hour is within configured capture window."""
@@ -19,89 +346,140 @@ def _is_capture_hour(config):
     return config["capture"]["start_hour"] <= hour < config["capture"]["end_hour"]
 
 
-def _capture_job(config, state):
+def _capture_job(config, state, scheduled_for=None):
     """Capture a photo if within scheduled hours."""
     if not _is_capture_hour(config):
         return
     path = capture_photo(config)
     if path:
         state["last_capture"] = path
+        # Extend today's sprite sheet while the new photo is still in page cache
+        try:
+            build_sprite(config, os.path.basename(os.path.dirname(path)))
+        except Exception as e:
+            log.warning("Sprite update failed: %s", e)
+
 
+# Job functions let exceptions propagate: the scheduler logs them and
+# records the failure in the ledger, so a failed slot is retried on the
+# next restart's catch-up. A None result is a deliberate skip (too few
+# photos, no API key) and counts as a successful run.
 
-def _analysis_job(config, state):
+def _analysis_job(config, state, scheduled_for=None):
     """Run AI plant analysis."""
-    try:
-        analyze_plants(config, state)
-    except Exception as e:
-        log.error("Analysis failed: %s", e)
+    analyze_plants(config, state)
 
 
-def _daily_timelapse_job(config):
-    """Generate timelapse for today."""
-    try:
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        generate_daily_timelapse(config, date_str)
-    except Exception as e:
-        log.error("Daily timelapse failed: %s", e)
+def _daily_timelapse_job(config, scheduled_for):
+    """Generate timelapse for the scheduled day."""
+    date_str = scheduled_for.strftime("%Y-%m-%d")
+    generate_daily_timelapse(config, date_str)
 
 
-def _weekly_timelapse_job(config):
-    """Generate weekly timelapse."""
-    try:
-        now = datetime.now()
-        year, week, _ = now.isocalendar()
-        generate_weekly_timelapse(config, year, week)
-    except Exception as e:
-        log.error("Weekly timelapse failed: %s", e)
+def _weekly_timelapse_job(config, scheduled_for):
+    """Generate weekly timelapse for the scheduled week."""
+    year, week, _ = scheduled_for.isocalendar()
+    generate_weekly_timelapse(config, year, week)
 
 
-def _cleanup_job(config):
+def _cleanup_job(config, scheduled_for=None):
     """Run storage cleanup."""
-    try:
-        run_cleanup(config)
-    except Exception as e:
-        log.error("Cleanup failed: %s", e)
+    run_cleanup(config)
+
+
+def _tiering_job(config, scheduled_for=None):
+    """Move photos past compact_after_days to the compact tier."""
+    run_tiering(config)
+
+
+def _packing_job(config, scheduled_for=None):
+    """Pack closed photo days into monthly archives."""
+    run_packing(config)
+
+
+def _eviction_job(config, scheduled_for=None):
+    """Enforce max_storage_mb if usage is over the high-water mark."""
+    run_eviction(config)
+
+
+def _storage_reconcile_job(config, scheduled_for=None):
+    """Rescan storage to correct drift in the running totals."""
+    reconcile_storage(config)
+
+
+def _feeding_job(config, slot, portions, scheduled_for=None):
+    """Feed a schedule slot (no-op if it already ran today)."""
+    feed_slot(config, slot, portions)
+
+
+def _feeding_watch_job(config, state, scheduled_for=None):
+    """Catch up or alert on missed feeding slots."""
+    check_missed_feeds(config, state)
 
 
 def start_scheduler(config, state):
-    """Start the scheduler in a background thread."""
+    """Register the monitor's jobs and start the dispatcher thread.
+
+    Returns:
+        The running Scheduler (also stored as state["scheduler"]).
+    """
     interval = config["capture"].get("interval_minutes", 30)
+    sched_cfg = config["scheduler"]
+    ledger = JobLedger(os.path.join(config["storage"]["state_dir"], "jobs.json"))
+    sched = Scheduler(sched_cfg["group_limits"], ledger, workers=sched_cfg.get("workers"))
 
-    # Photo capture
-    schedule.every(interval).minutes.do(_capture_job, config, state)
+    # Photo capture, with an initial shot dispatched right away
+    sched.add("capture", partial(_capture_job, config, state),
+              Interval(interval), "capture", run_now=True, catch_up=False)
 
     # AI analysis at configured times
     for t in config["analysis"]["times"]:
-        schedule.every().day.at(t).do(_analysis_job, config, state)
+        sched.add(f"analysis@{t}", partial(_analysis_job, config, state),
+                  Daily(t), "analysis")
 
     # Daily timelapse
-    daily_time = config["timelapse"]["daily_time"]
-    schedule.every().day.at(daily_time).do(_daily_timelapse_job, config)
+    sched.add("daily_timelapse", partial(_daily_timelapse_job, config),
+              Daily(config["timelapse"]["daily_time"]), "timelapse")
 
     # Weekly timelapse
-    weekly_day = config["timelapse"]["weekly_day"]
-    weekly_time = config["timelapse"]["weekly_time"]
-    getattr(schedule.every(), weekly_day).at(weekly_time).do(
-        _weekly_timelapse_job, config
-    )
+    sched.add("weekly_timelapse", partial(_weekly_timelapse_job, config),
+              Weekly(config["timelapse"]["weekly_day"], config["timelapse"]["weekly_time"]),
+              "timelapse")
 
     # Daily cleanup at 01:00
-    schedule.every().day.at("01:00").do(_cleanup_job, config)
+    sched.add("cleanup", partial(_cleanup_job, config), Daily("01:00"), "maintenance")
 
-    def _run():
-        log.info("Scheduler started (capture every %d min, %s-%s)",
-                 interval,
-                 f"{config['capture']['start_hour']:02d}:00",
-                 f"{config['capture']['end_hour']:02d}:00")
-        while True:
-            schedule.run_pending()
-            time.sleep(30)
+    # Compact-tier transcoding, after cleanup has thinned old days
+    sched.add("tiering", partial(_tiering_job, config), Daily("02:00"), "maintenance")
+
+    # Monthly archive packing of closed days
+    sched.add("packing", partial(_packing_job, config), Daily("02:30"), "maintenance")
+
+    # Budget check; a no-op unless usage is over the high-water mark
+    sched.add("eviction", partial(_eviction_job, config), Interval(15), "maintenance",
+              catch_up=False)
 
-    thread = threading.Thread(target=_run, daemon=True)
-    thread.start()
+    # Nightly storage reconciliation, after cleanup
+    sched.add("storage_reconcile", partial(_storage_reconcile_job, config),
+              Daily("03:30"), "maintenance")
 
-    # Take an initial capture if within hours
-    if _is_capture_hour(config):
-        _capture_job(config, state)
+    # Feeding slots; restarts are handled by feeding_watch, not the ledger
+    # catch-up, so a slot is never fed late by hours
+    slots = feeding_schedule(config)
+    for slot, portions in slots:
+        sched.add(f"feeding@{slot}", partial(_feeding_job, config, slot, portions),
+                  Daily(slot), "feeding", catch_up=False)
+    if slots:
+        if sum(p for _, p in slots) > config["feeding"]["max_portions_per_day"]:
+            log.warning("Feeding schedule has more portions than feeding.max_portions_per_day")
+        sched.add("feeding_watch", partial(_feeding_watch_job, config, state), Interval(5),
+                  "feeding", run_now=True, catch_up=False)
 
-    return thread
+    sched.catch_up_missed(sched_cfg["catch_up_grace_minutes"], sched_cfg["catch_up_stagger_seconds"])
+    sched.start()
+    state["scheduler"] = sched
+    log.info("Scheduler started (capture every %d min, %s-%s)",
+             interval,
+             f"{config['capture']['start_hour']:02d}:00",
+             f"{config['capture']['end_hour']:02d}:00")
+    return sched
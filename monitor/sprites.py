@@ -0,0 +1,174 @@
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+from PIL import Image, ImageOps
+
+import imaging
+import photostore
+from capture import get_photos_for_date
+
+log = logging.getLogger(__name__)
+
+_locks = {}   # date -> [lock, holders and waiters]
+_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def _day_lock(date_str):
+    """One builder per day; concurrent requests wait for the same sprite.
+
+    The lock is dropped once nobody holds or waits for it.
+    """
+    with _locks_guard:
+        entry = _locks.setdefault(date_str, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[date_str]
+
+
+def _sprite_paths(config, date_str):
+    sprite_dir = os.path.join(config["storage"]["cache_dir"], "sprites")
+    return (
+        os.path.join(sprite_dir, f"{date_str}.jpg"),
+        os.path.join(sprite_dir, f"{date_str}.json"),
+    )
+
+
+def _signature(config, photos):
+    """Identify each input by name, mtime and size (no decoding needed)."""
+    sig = []
+    for p in photos:
+        mtime, size = photostore.stat_photo(config, p)
+        sig.append([os.path.basename(p), mtime, size])
+    return sig
+
+
+def _load_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _make_tile(config, photo, tile_w, tile_h):
+    """Worker: one thumbnail tile."""
+    img = photostore.open_image(config, photo)
+    # JPEG draft mode decodes at 1/2..1/8 scale, far cheaper than a full decode
+    img.draft("RGB", (tile_w * 2, tile_h * 2))
+    return ImageOps.fit(img.convert("RGB"), (tile_w, tile_h), Image.BILINEAR)
+
+
+def build_sprite(config, date_str):
+    """Build or refresh the thumbnail sprite sheet for a day.
+
+    The sprite is one JPEG with every photo of the day in a grid, plus a
+    JSON index of tile positions. Tiles up to the first input that changed
+    since the last build are kept from the existing sheet, so after a
+    capture only the new tile is decoded. A tile that failed is recorded
+    without its mtime and size, so the next build retries it.
+
+    Returns:
+        Index dict, or None if the day has no photos.
+    """
+    photos = get_photos_for_date(config, date_str)
+    if not photos:
+        return None
+
+    sprite_path, index_path = _sprite_paths(config, date_str)
+    sprite_cfg = config["sprites"]
+    tile_w, tile_h = (int(v) for v in sprite_cfg["tile_size"].split("x"))
+    columns = sprite_cfg["columns"]
+
+    with _day_lock(date_str):
+        signature = _signature(config, photos)
+        index = _load_index(index_path)
+        if index and index["inputs"] == signature and os.path.isfile(sprite_path):
+            return index
+
+        # Reuse the tiles of the unchanged leading inputs
+        reuse = 0
+        if (index and os.path.isfile(sprite_path)
+                and index["tile_size"] == [tile_w, tile_h]
+                and index["columns"] == columns):
+            for old, new in zip(index["inputs"], signature):
+                if old != new:
+                    break
+                reuse += 1
+
+        rows = (len(photos) + columns - 1) // columns
+        sheet = Image.new("RGB", (columns * tile_w, rows * tile_h), (17, 17, 17))
+        if reuse:
+            with Image.open(sprite_path) as old:
+                sheet.paste(old.convert("RGB"), (0, 0))
+
+        # Queue every new tile first so the pool's workers share them
+        futures = [(i, imaging.submit(config, _make_tile, config, photos[i], tile_w, tile_h))
+                   for i in range(reuse, len(photos))]
+        for i, future in futures:
+            x, y = (i % columns) * tile_w, (i // columns) * tile_h
+            try:
+                tile = future.result()
+            except OSError as e:
+                log.warning("Failed to thumbnail %s: %s", photos[i], e)
+                # Blank out whatever the old sheet had here; never match next time
+                sheet.paste((17, 17, 17), (x, y, x + tile_w, y + tile_h))
+                signature[i] = [signature[i][0], None, None]
+                continue
+            sheet.paste(tile, (x, y))
+
+        buf = io.BytesIO()
+        sheet.save(buf, format="JPEG", quality=sprite_cfg["quality"])
+        data = buf.getvalue()
+        os.makedirs(os.path.dirname(sprite_path), exist_ok=True)
+        tmp_sprite = sprite_path + ".tmp"
+        with open(tmp_sprite, "wb") as f:
+            f.write(data)
+        os.replace(tmp_sprite, sprite_path)
+
+        tiles = []
+        for i, p in enumerate(photos):
+            name = photostore.logical_name(p)
+            tiles.append({
+                "filename": name,
+                "url": f"/photos/{date_str}/{name}",
+                "time": name.replace(".jpg", "").split("_")[-1].replace("-", ":"),
+                "col": i % columns,
+                "row": i // columns,
+            })
+
+        index = {
+            "date": date_str,
+            "sprite": f"/sprites/{date_str}.jpg",
+            # Content hash: the URL changes whenever the sheet does
+            "version": hashlib.sha1(data).hexdigest()[:12],
+            "tile_size": [tile_w, tile_h],
+            "columns": columns,
+            "rows": rows,
+            "tiles": tiles,
+            "inputs": signature,
+        }
+        tmp_index = index_path + ".tmp"
+        with open(tmp_index, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_index, index_path)
+
+        log.info("Built sprite for %s (%d tiles, %d reused)", date_str, len(photos), reuse)
+        return index
+
+
+def get_sprite_path(config, date_str):
+    """Path of a day's sprite image, or None if it has not been built."""
+    sprite_path, _ = _sprite_paths(config, date_str)
+    return sprite_path if os.path.isfile(sprite_path) else None
@@ -2,6 +2,7 @@
 
 let currentDate = new Date().toISOString().split("T")[0];
 let currentPhotoUrl = null;
+let timelapseRenditions = { daily: {}, weekly: {} };
 
 document.addEventListener("DOMContentLoaded", () => {
   loadStatus();
@@ -15,6 +16,7 @@ document.addEventListener("DOMContentLoaded", () => {
   setInterval(loadStatus, 60000);
   setInterval(loadTempHistory, 60000);
   setInterval(loadLatestPhoto, 300000);
+  listenForEvents();
 
   // Aquatic friends (desktop only) — delay so page renders first
   setTimeout(initFish, 2500);
@@ -61,51 +63,123 @@ function loadLatestPhoto() {
     .catch(() => {});
 }
 
+let daySprite = null;
+let spritePreviewTimer = null;
+
 function loadThumbnails(dateStr) {
-  fetch("/api/photos/" + dateStr)
-    .then((r) => r.json())
-    .then((photos) => {
-      const strip = document.getElementById("thumbnail-strip");
-      strip.innerHTML = "";
-      photos.forEach((photo, i) => {
-        const wrapper = document.createElement("div");
-        wrapper.className = "thumb-wrapper";
-
-        const img = document.createElement("img");
-        img.src = photo.url;
-        img.alt = photo.time;
-        img.title = photo.time;
-        if (i === photos.length - 1) img.classList.add("active");
-        img.onclick = () => {
-          document.getElementById("latest-photo").src = photo.url;
-          currentPhotoUrl = photo.url;
-          strip.querySelectorAll("img").forEach((t) => t.classList.remove("active"));
-          img.classList.add("active");
-          const timeEl = document.getElementById("photo-time");
-          timeEl.textContent = photo.time;
-        };
-
-        const delBtn = document.createElement("button");
-        delBtn.className = "thumb-delete";
-        delBtn.textContent = "\u00d7";
-        delBtn.onclick = (e) => {
-          e.stopPropagation();
-          deletePhoto(photo.url, dateStr);
-        };
-
-        wrapper.appendChild(img);
-        wrapper.appendChild(delBtn);
-        strip.appendChild(wrapper);
+  // One sprite sheet per day instead of a request per photo
+  fetch("/api/photos/" + dateStr + "/sprite")
+    .then((r) => {
+      if (!r.ok) throw new Error("no sprite");
+      return r.json();
+    })
+    .then((sprite) => {
+      daySprite = sprite;
+      renderThumbnails(dateStr, sprite.tiles, (photo, el) => {
+        el.style.backgroundImage = "url('" + sprite.sprite + "')";
+        setSpriteTile(el, sprite, photo);
       });
-      strip.scrollLeft = strip.scrollWidth;
     })
-    .catch(() => {});
+    .catch(() => {
+      daySprite = null;
+      fetch("/api/photos/" + dateStr)
+        .then((r) => r.json())
+        .then((photos) => renderThumbnails(dateStr, photos, null))
+        .catch(() => {});
+    });
+}
+
+function setSpriteTile(el, sprite, tile) {
+  const cols = sprite.columns;
+  const rows = sprite.rows;
+  el.style.backgroundSize = cols * 100 + "% " + rows * 100 + "%";
+  el.style.backgroundPosition =
+    (cols > 1 ? (tile.col / (cols - 1)) * 100 : 0) + "% " +
+    (rows > 1 ? (tile.row / (rows - 1)) * 100 : 0) + "%";
+}
+
+function renderThumbnails(dateStr, photos, paintTile) {
+  const strip = document.getElementById("thumbnail-strip");
+  strip.innerHTML = "";
+  photos.forEach((photo, i) => {
+    const wrapper = document.createElement("div");
+    wrapper.className = "thumb-wrapper";
+
+    let img;
+    if (paintTile) {
+      img = document.createElement("div");
+      img.className = "thumb-tile";
+      paintTile(photo, img);
+    } else {
+      img = document.createElement("img");
+      img.src = photo.url;
+      img.alt = photo.time;
+    }
+    img.title = photo.time;
+    if (i === photos.length - 1) img.classList.add("active");
+    img.onclick = () => {
+      stopSpritePreview();
+      document.getElementById("latest-photo").src = photo.url;
+      currentPhotoUrl = photo.url;
+      strip.querySelectorAll(".active").forEach((t) => t.classList.remove("active"));
+      img.classList.add("active");
+      const timeEl = document.getElementById("photo-time");
+      timeEl.textContent = photo.time;
+    };
+
+    const delBtn = document.createElement("button");
+    delBtn.className = "thumb-delete";
+    delBtn.textContent = "\u00d7";
+    delBtn.onclick = (e) => {
+      e.stopPropagation();
+      deletePhoto(photo.url, dateStr);
+    };
+
+    wrapper.appendChild(img);
+    wrapper.appendChild(delBtn);
+    strip.appendChild(wrapper);
+  });
+  strip.scrollLeft = strip.scrollWidth;
+  document.getElementById("sprite-play-btn").style.display =
+    paintTile && photos.length > 1 ? "block" : "none";
+}
+
+function toggleSpritePreview() {
+  if (spritePreviewTimer) {
+    stopSpritePreview();
+    return;
+  }
+  if (!daySprite || daySprite.tiles.length < 2) return;
+
+  // Quick animated preview of the day straight from the sprite tiles
+  const player = document.getElementById("sprite-player");
+  const timeEl = document.getElementById("photo-time");
+  player.style.backgroundImage = "url('" + daySprite.sprite + "')";
+  player.style.display = "block";
+  document.getElementById("sprite-play-btn").classList.add("playing");
+
+  let i = 0;
+  spritePreviewTimer = setInterval(() => {
+    const tile = daySprite.tiles[i];
+    setSpriteTile(player, daySprite, tile);
+    timeEl.textContent = tile.time;
+    i = (i + 1) % daySprite.tiles.length;
+  }, 150);
+}
+
+function stopSpritePreview() {
+  if (!spritePreviewTimer) return;
+  clearInterval(spritePreviewTimer);
+  spritePreviewTimer = null;
+  document.getElementById("sprite-player").style.display = "none";
+  document.getElementById("sprite-play-btn").classList.remove("playing");
 }
 
 function loadTimelapses() {
   fetch("/api/timelapse")
     .then((r) => r.json())
     .then((data) => {
+      timelapseRenditions = data.renditions || timelapseRenditions;
       const type = document.getElementById("timelapse-type").value;
       const select = document.getElementById("timelapse-select");
       const videos = data[type] || [];
@@ -137,13 +211,35 @@ function playTimelapse() {
     noData.style.display = "block";
     return;
   }
-  // Cache-bust for regenerated timelapses
-  video.src = "/timelapse/" + type + "/" + file + "?t=" + Date.now();
+  video.src = timelapseSource(type, file);
   video.load();
   video.style.display = "block";
   noData.style.display = "none";
 }
 
+function isSlowConnection() {
+  const conn = navigator.connection;
+  if (!conn) return window.innerWidth < 700;
+  return conn.saveData || ["slow-2g", "2g", "3g"].includes(conn.effectiveType);
+}
+
+function timelapseSource(type, file) {
+  const available = (timelapseRenditions[type] || {})[file] || ["full"];
+  const video = document.getElementById("timelapse-video");
+  const label = file.replace(".mp4", "");
+  // Cache-bust for regenerated timelapses
+  const bust = "?t=" + Date.now();
+
+  // Native HLS (Safari/iOS) starts after the first segment and adapts
+  if (available.includes("hls") && video.canPlayType("application/vnd.apple.mpegurl")) {
+    return "/timelapse/" + type + "/hls/" + label + "/master.m3u8" + bust;
+  }
+  if (available.includes("preview") && isSlowConnection()) {
+    return "/timelapse/" + type + "/preview/" + file + bust;
+  }
+  return "/timelapse/" + type + "/" + file + bust;
+}
+
 // --- Storage ---
 
 function loadStorageStats() {
@@ -427,6 +523,12 @@ function generateTimelapse() {
         btn.disabled = false;
         return;
       }
+      if (data.status === "current") {
+        // Existing video already matches its photos, nothing to encode
+        btn.disabled = false;
+        showGeneratedTimelapse(data.result);
+        return;
+      }
       const status = document.getElementById("timelapse-gen-status");
       const label = document.getElementById("timelapse-gen-label");
       status.style.display = "flex";
@@ -455,37 +557,41 @@ function pollTimelapseStatus() {
         if (data.error) {
           alert("Timelapse failed: " + data.error);
         } else {
-          // Reload list and select the newly generated file
-          const newFile = data.result;
-          fetch("/api/timelapse")
-            .then((r) => r.json())
-            .then((list) => {
-              const type = document.getElementById("timelapse-type").value;
-              const select = document.getElementById("timelapse-select");
-              const videos = list[type] || [];
-              select.innerHTML = "";
-              if (videos.length === 0) {
-                select.innerHTML = '<option value="">None</option>';
-                document.getElementById("timelapse-video").style.display = "none";
-                document.getElementById("timelapse-no-data").style.display = "block";
-                return;
-              }
-              videos.forEach((v) => {
-                const opt = document.createElement("option");
-                opt.value = v;
-                opt.textContent = v.replace(".mp4", "");
-                if (v === newFile) opt.selected = true;
-                select.appendChild(opt);
-              });
-              playTimelapse();
-            })
-            .catch(() => {});
+          showGeneratedTimelapse(data.result);
         }
       }
     })
     .catch(() => {});
 }
 
+function showGeneratedTimelapse(newFile) {
+  // Reload list and select the newly generated file
+  fetch("/api/timelapse")
+    .then((r) => r.json())
+    .then((list) => {
+      timelapseRenditions = list.renditions || timelapseRenditions;
+      const type = document.getElementById("timelapse-type").value;
+      const select = document.getElementById("timelapse-select");
+      const videos = list[type] || [];
+      select.innerHTML = "";
+      if (videos.length === 0) {
+        select.innerHTML = '<option value="">None</option>';
+        document.getElementById("timelapse-video").style.display = "none";
+        document.getElementById("timelapse-no-data").style.display = "block";
+        return;
+      }
+      videos.forEach((v) => {
+        const opt = document.createElement("option");
+        opt.value = v;
+        opt.textContent = v.replace(".mp4", "");
+        if (v === newFile) opt.selected = true;
+        select.appendChild(opt);
+      });
+      playTimelapse();
+    })
+    .catch(() => {});
+}
+
 // --- UI Updates ---
 
 function updateSensors(sensors) {
@@ -555,6 +661,8 @@ function updatePlantCards(plants) {
     html += "<span>" + cap(plant.growth_stage) + "</span>";
     if (plant.days_to_harvest != null) {
       html += "<span>Harvest ~" + plant.days_to_harvest + "d</span>";
+    } else if (plant.harvest_window && !plant.harvest_window.ready) {
+      html += "<span>Harvest from " + esc(plant.harvest_window.window_start) + "</span>";
     }
     html += "</div>";
 
@@ -620,12 +728,15 @@ function feedNow() {
   btn.disabled = true;
   btn.classList.add("feeding");
   fetch("/api/feed", { method: "POST" })
-    .then((r) => r.json())
-    .then(() => {
+    .then((r) => r.json().then((data) => ({ ok: r.ok, data })))
+    .then(({ ok, data }) => {
+      if (!ok && data.error) {
+        alert(data.error);
+      }
       setTimeout(() => {
         btn.disabled = false;
         btn.classList.remove("feeding");
-      }, 2000);
+      }, ok ? 2000 : 0);
     })
     .catch(() => {
       btn.disabled = false;
@@ -633,21 +744,48 @@ function feedNow() {
     });
 }
 
+let capturePolling = null;
+
 function manualCapture() {
   const btn = document.getElementById("capture-btn");
   btn.disabled = true;
   fetch("/capture", { method: "POST" })
     .then((r) => r.json())
-    .then(() => {
-      btn.disabled = false;
-      loadLatestPhoto();
-      loadThumbnails(currentDate);
+    .then((job) => {
+      // Completion usually arrives as a "capture" event; poll as a fallback
+      capturePolling = setInterval(() => pollCapture(job.status_url), 2000);
     })
     .catch(() => {
       btn.disabled = false;
     });
 }
 
+function pollCapture(url) {
+  fetch(url)
+    .then((r) => r.json())
+    .then(captureUpdated)
+    .catch(() => captureUpdated({ status: "failed" }));
+}
+
+function captureUpdated(job) {
+  if (job.status !== "done" && job.status !== "failed") return;
+  if (capturePolling) {
+    clearInterval(capturePolling);
+    capturePolling = null;
+  }
+  document.getElementById("capture-btn").disabled = false;
+  if (job.status === "done") {
+    loadLatestPhoto();
+    loadThumbnails(currentDate);
+  }
+}
+
+function listenForEvents() {
+  if (!window.EventSource) return;
+  const source = new EventSource("/api/events");
+  source.addEventListener("capture", (e) => captureUpdated(JSON.parse(e.data)));
+}
+
 function toggleDetails(btn) {
   const details = btn.nextElementSibling;
   details.classList.toggle("open");
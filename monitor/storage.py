@@ -0,0 +1,311 @@
+"""Running storage totals, so the dashboard never has to walk the SD card.
+
+Usage is tracked in small buckets: one per photo day, one per timelapse
+(master, manifest and renditions together), one per day of analyses and
+one per monthly archive pack.
+Writers call update() with the path they just wrote or deleted, which
+recounts only that bucket and books the change as growth for today. A
+periodic reconcile() rescans everything to correct drift from files
+changed behind the monitor's back. Totals live in state/storage.json.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+GROWTH_DAYS_KEPT = 90
+FORECAST_WINDOW_DAYS = 14
+KINDS = ("photos", "timelapse", "analysis", "archive")
+
+STORAGE_BYTES = metrics.gauge("ecogarden_storage_bytes", "Bytes used per storage kind", ["kind"])
+RECONCILE_DRIFT = metrics.gauge(
+    "ecogarden_storage_reconcile_drift_bytes", "Bytes corrected by the last reconciliation")
+
+_accountants = {}
+_accountants_lock = threading.Lock()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _walk_files(top):
+    """Yield paths of regular, non-hidden files under top."""
+    for root, dirs, names in os.walk(top):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if not name.startswith("."):
+                yield os.path.join(root, name)
+
+
+class StorageAccountant:
+    """Per-bucket byte/file totals plus a per-day growth history."""
+
+    def __init__(self, config):
+        self.config = config
+        storage = config["storage"]
+        self.path = os.path.join(storage["state_dir"], "storage.json")
+        self._roots = {
+            "photos": os.path.abspath(storage["photo_dir"]),
+            "timelapse": os.path.abspath(storage["timelapse_dir"]),
+            "analysis": os.path.abspath(storage["analysis_dir"]),
+            "archive": os.path.abspath(storage["archive_dir"]),
+        }
+        self._lock = threading.Lock()
+        self._bucket_locks = {}   # (kind, key) -> [lock, holders and waiters]
+        self._buckets = {kind: {} for kind in KINDS}
+        self._growth = {}
+        self._reconciled = None
+        loaded = self._load()
+        for kind in KINDS:
+            STORAGE_BYTES.labels(kind=kind).set_function(
+                lambda kind=kind: sum(b["bytes"] for b in self._buckets[kind].values()))
+        if not loaded:
+            self.reconcile()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != STATE_VERSION:
+            return False
+        self._buckets = {kind: data.get("buckets", {}).get(kind, {}) for kind in KINDS}
+        self._growth = data.get("growth", {})
+        self._reconciled = data.get("reconciled")
+        return True
+
+    def _save(self):
+        data = {
+            "version": STATE_VERSION,
+            "reconciled": self._reconciled,
+            "buckets": self._buckets,
+            "growth": self._growth,
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def bucket_for(self, path):
+        """Map a file path to its (kind, key) bucket, or None if untracked.
+
+        photos/2026-02-08[/x.jpg]         -> ("photos", "2026-02-08")
+        timelapse/daily/2026-02-08.mp4    -> ("timelapse", "daily/2026-02-08")
+        timelapse/daily/hls/2026-02-08/.. -> ("timelapse", "daily/2026-02-08")
+        analysis/2026-02-08_10-00.json    -> ("analysis", "2026-02-08")
+        archive/2026-02.1.pack            -> ("archive", "2026-02")
+        """
+        path = os.path.abspath(path)
+        for kind, root in self._roots.items():
+            if not path.startswith(root + os.sep):
+                continue
+            parts = os.path.relpath(path, root).split(os.sep)
+            if kind == "photos":
+                return (kind, parts[0])
+            if kind == "analysis":
+                return (kind, parts[0][:10])
+            if kind == "archive":
+                return (kind, parts[0][:7])
+            if len(parts) >= 2:
+                sub, name = parts[0], parts[1]
+                if name in ("preview", "hls") and len(parts) >= 3:
+                    name = parts[2]
+                return (kind, f"{sub}/{os.path.splitext(name)[0]}")
+        return None
+
+    def _is_item(self, kind, key, path):
+        """Whether path counts as a photo, analysis or video (vs a sidecar)."""
+        if kind == "timelapse":
+            sub, stem = key.split("/", 1)
+            return path == os.path.join(self._roots[kind], sub, stem + ".mp4")
+        if kind == "analysis":
+            return path.endswith(".json")
+        if kind == "archive":
+            return False
+        return True
+
+    def _scan_bucket(self, kind, key):
+        """Count the files that make up one bucket right now."""
+        root = self._roots[kind]
+        if kind == "photos":
+            paths = _walk_files(os.path.join(root, key))
+        elif kind in ("analysis", "archive"):
+            try:
+                names = os.listdir(root)
+            except OSError:
+                names = []
+            paths = [os.path.join(root, n) for n in names if n.startswith(key) and not n.startswith(".")]
+        else:
+            sub, stem = key.split("/", 1)
+            kind_dir = os.path.join(root, sub)
+            paths = [os.path.join(kind_dir, stem + ".mp4"),
+                     os.path.join(kind_dir, stem + ".json"),
+                     os.path.join(kind_dir, "preview", stem + ".mp4")]
+            paths.extend(_walk_files(os.path.join(kind_dir, "hls", stem)))
+
+        totals = {"bytes": 0, "files": 0, "items": 0}
+        for path in paths:
+            self._add_file(totals, kind, key, path)
+        return totals if totals["files"] else None
+
+    def _add_file(self, totals, kind, key, path):
+        size = _file_size(path)
+        if size is not None:
+            totals["bytes"] += size
+            totals["files"] += 1
+            totals["items"] += int(self._is_item(kind, key, path))
+            if kind == "archive" and path.endswith(".idx.json"):
+                # A pack's items are the photos (and days) in its index
+                try:
+                    with open(path) as f:
+                        days = json.load(f).get("days", {})
+                except (OSError, ValueError):
+                    days = {}
+                totals["items"] += sum(len(e) for e in days.values())
+                totals["days"] = totals.get("days", 0) + sum(1 for e in days.values() if e)
+
+    @contextlib.contextmanager
+    def _bucket_lock(self, bucket):
+        """Serialize updates of one bucket; dropped once nobody needs it."""
+        with self._lock:
+            entry = self._bucket_locks.setdefault(bucket, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._bucket_locks[bucket]
+
+    def update(self, path):
+        """Recount the bucket holding path after it was written or deleted."""
+        bucket = self.bucket_for(path)
+        if bucket is None:
+            return
+        kind, key = bucket
+        # Scan and commit together, so an older scan can't land last
+        with self._bucket_lock(bucket):
+            totals = self._scan_bucket(kind, key)
+            with self._lock:
+                old = self._buckets[kind].pop(key, None)
+                if totals:
+                    self._buckets[kind][key] = totals
+                delta = (totals["bytes"] if totals else 0) - (old["bytes"] if old else 0)
+                if delta:
+                    today = date.today().isoformat()
+                    self._growth[today] = self._growth.get(today, 0) + delta
+                    self._trim_growth()
+                self._save()
+
+    def _trim_growth(self):
+        cutoff = (date.today() - timedelta(days=GROWTH_DAYS_KEPT)).isoformat()
+        for day in [d for d in self._growth if d < cutoff]:
+            del self._growth[day]
+
+    def reconcile(self):
+        """Rescan every bucket and replace the running totals.
+
+        Differences are drift (files changed outside the monitor), so they
+        are logged but not booked as growth.
+
+        Returns:
+            Absolute number of bytes the running totals were off by.
+        """
+        buckets = {kind: {} for kind in KINDS}
+        for kind, root in self._roots.items():
+            for path in _walk_files(root):
+                bucket = self.bucket_for(path)
+                if bucket is None:
+                    continue
+                totals = buckets[kind].setdefault(bucket[1], {"bytes": 0, "files": 0, "items": 0})
+                self._add_file(totals, kind, bucket[1], path)
+
+        with self._lock:
+            drift = 0
+            for kind in KINDS:
+                for key in set(buckets[kind]) | set(self._buckets[kind]):
+                    new = buckets[kind].get(key, {}).get("bytes", 0)
+                    old = self._buckets[kind].get(key, {}).get("bytes", 0)
+                    drift += abs(new - old)
+            self._buckets = buckets
+            self._reconciled = datetime.now().isoformat(timespec="seconds")
+            self._trim_growth()
+            self._save()
+
+        RECONCILE_DRIFT.set(drift)
+        if drift:
+            log.info("Storage reconcile corrected %.1f MB of drift", drift / (1024 * 1024))
+        return drift
+
+    def snapshot(self):
+        """Totals per kind, per-bucket detail and growth history."""
+        with self._lock:
+            buckets = {kind: dict(b) for kind, b in self._buckets.items()}
+            growth = dict(self._growth)
+            reconciled = self._reconciled
+        totals = {
+            kind: {
+                "bytes": sum(b["bytes"] for b in buckets[kind].values()),
+                "files": sum(b["files"] for b in buckets[kind].values()),
+                "items": sum(b["items"] for b in buckets[kind].values()),
+            }
+            for kind in KINDS
+        }
+        return {"totals": totals, "buckets": buckets, "growth": growth, "reconciled": reconciled}
+
+    def daily_growth(self):
+        """Mean net bytes added per day over the recent complete days.
+
+        Returns:
+            Bytes per day, or None if no complete day has been recorded.
+        """
+        today = date.today().isoformat()
+        cutoff = (date.today() - timedelta(days=FORECAST_WINDOW_DAYS)).isoformat()
+        with self._lock:
+            days = [v for d, v in self._growth.items() if cutoff <= d < today]
+        if not days:
+            return None
+        return sum(days) / len(days)
+
+
+def get_accountant(config):
+    """Shared accountant for this config's state directory."""
+    path = os.path.abspath(config["storage"]["state_dir"])
+    with _accountants_lock:
+        accountant = _accountants.get(path)
+        if accountant is None:
+            accountant = _accountants[path] = StorageAccountant(config)
+        return accountant
+
+
+def update(config, path):
+    """Book a write or delete of path in the running totals.
+
+    Never raises: accounting must not break the capture or render that
+    triggered it, and the next reconcile fixes any miss.
+    """
+    try:
+        get_accountant(config).update(path)
+    except Exception as e:
+        log.warning("Storage accounting update failed for %s: %s", path, e)
+
+
+def reconcile(config):
+    """Rescan the storage tree and correct the running totals."""
+    return get_accountant(config).reconcile()
@@ -1,182 +1,528 @@
+import json
 import logging
 import os
+import shutil
 import subprocess
-
+import tempfile
+from datetime import date, datetime, timedelta
+
+import catalog
+import imaging
+import metrics
+import photostore
+import storage
 from capture import get_photos_for_date
 
 log = logging.getLogger(__name__)
 
+RENDER_SECONDS = metrics.histogram(
+    "ecogarden_ffmpeg_seconds", "ffmpeg run time by rendition", ["rendition"])
+RENDERS = metrics.counter(
+    "ecogarden_timelapse_renders_total", "Timelapse generate requests by outcome", ["result"])
+
+MANIFEST_VERSION = 1
+
+
+def _encoder_settings(config):
+    """Return the ffmpeg encoder settings recorded in each manifest."""
+    tl = config["timelapse"]
+    fps = tl.get("fps", 3)
+    return {
+        "codec": "libx264",
+        "preset": tl.get("preset", "fast"),
+        "crf": tl.get("crf", 28),
+        "resolution": tl.get("resolution", "1920x1080"),
+        "pix_fmt": "yuv420p",
+        # Keyframe every HLS segment so renditions can be segmented by copy
+        "gop": max(1, int(fps * tl.get("hls_segment_seconds", 2))),
+    }
+
+
+def _manifest_path(output_path):
+    """Manifest sidecar for a timelapse: 2026-02-08.mp4 -> 2026-02-08.json."""
+    return os.path.splitext(output_path)[0] + ".json"
+
+
+def _build_manifest(config, photos, fps, encoder):
+    """Describe the inputs and settings that produce a timelapse."""
+    inputs = []
+    for photo in photos:
+        mtime, size = photostore.stat_photo(config, photo)
+        inputs.append({
+            "file": os.path.abspath(photo),
+            "mtime": mtime,
+            "size": size,
+        })
+    return {
+        "version": MANIFEST_VERSION,
+        "fps": fps,
+        "encoder": encoder,
+        "inputs": inputs,
+    }
+
+
+def _load_manifest(output_path):
+    try:
+        with open(_manifest_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
 
-def generate_daily_timelapse(config, date_str):
-    """Generate a timelapse video from a day's photos.
 
-    Args:
-        config: App config dict.
-        date_str: Date string (YYYY-MM-DD).
+def _manifest_matches(output_path, manifest):
+    """True if output_path exists and was built from exactly these inputs."""
+    if not os.path.isfile(output_path):
+        return False
+    existing = _load_manifest(output_path)
+    if not existing:
+        return False
+    return (
+        existing.get("version") == manifest["version"]
+        and existing.get("fps") == manifest["fps"]
+        and existing.get("encoder") == manifest["encoder"]
+        and existing.get("inputs") == manifest["inputs"]
+    )
 
-    Returns:
-        Output file path, or None if skipped.
-    """
-    photos = get_photos_for_date(config, date_str)
-    min_photos = config["timelapse"].get("min_photos", 5)
 
-    if len(photos) < min_photos:
-        log.info("Skipping timelapse for %s: only %d photos (need %d)",
-                 date_str, len(photos), min_photos)
-        return None
+def _render_timelapse(config, photos, output_path, force=False):
+    """Encode photos into output_path unless an up-to-date render exists.
 
-    output_dir = os.path.join(config["storage"]["timelapse_dir"], "daily")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{date_str}.mp4")
+    Returns:
+        Output file path.
 
+    Raises:
+        RuntimeError: ffmpeg failed.
+    """
     fps = config["timelapse"].get("fps", 3)
+    encoder = _encoder_settings(config)
+    manifest = _build_manifest(config, photos, fps, encoder)
+
+    if not force and _manifest_matches(output_path, manifest):
+        RENDERS.labels(result="cached").inc()
+        log.info("Timelapse up to date, skipping re-encode: %s", output_path)
+        return output_path
+
+    output_dir = os.path.dirname(output_path)
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    width, height = encoder["resolution"].split("x")
 
-    # Create a temporary file list for ffmpeg concat demuxer
-    list_path = os.path.join(output_dir, f".{date_str}_files.txt")
+    # Render to a temp file so a crash never leaves a half-written video
+    # behind a valid manifest
+    tmp_path = os.path.join(output_dir, f".{stem}.tmp.mp4")
     try:
-        with open(list_path, "w") as f:
-            for photo in photos:
-                f.write(f"file '{os.path.abspath(photo)}'\n")
-                f.write(f"duration {1.0 / fps}\n")
-            # Repeat last frame to avoid ffmpeg cutting it short
-            f.write(f"file '{os.path.abspath(photos[-1])}'\n")
-
-        result = subprocess.run(
+        with RENDER_SECONDS.labels(rendition="master").time():
+            returncode, stderr, skipped = _encode_frames(
+                config, photos, fps, encoder, width, height, tmp_path)
+
+        if returncode != 0:
+            RENDERS.labels(result="failed").inc()
+            log.error("ffmpeg failed: %s", stderr)
+            raise RuntimeError(f"ffmpeg exited with {returncode} encoding {output_path}")
+
+        RENDERS.labels(result="encoded").inc()
+        if skipped:
+            # Leave them out of the manifest so the next run re-renders
+            missing = {os.path.abspath(photo) for photo in skipped}
+            manifest["inputs"] = [i for i in manifest["inputs"] if i["file"] not in missing]
+        os.replace(tmp_path, output_path)
+        with open(_manifest_path(output_path), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return output_path
+
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _encode_frames(config, photos, fps, encoder, width, height, output_path):
+    """Pipe photos to ffmpeg as a JPEG stream and encode them.
+
+    Piping instead of a concat list lets one video mix full-size JPEGs,
+    compact-tier WebP/AVIF photos (converted on the way) and photos read
+    straight out of archive packs.
+
+    A frame that can't be read is skipped and logged rather than failing
+    the render.
+
+    Returns:
+        (returncode, stderr text, skipped photo paths)
+    """
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
             [
                 "ffmpeg", "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", list_path,
-                "-vf", f"fps={fps},scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1",
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "28",
-                "-pix_fmt", "yuv420p",
+                "-f", "image2pipe",
+                "-c:v", "mjpeg",
+                "-framerate", str(fps),
+                "-i", "-",
+                "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:-1:-1",
+                "-c:v", encoder["codec"],
+                "-preset", encoder["preset"],
+                "-crf", str(encoder["crf"]),
+                "-g", str(encoder["gop"]),
+                "-pix_fmt", encoder["pix_fmt"],
+                "-movflags", "+faststart",
                 output_path,
             ],
-            capture_output=True,
-            timeout=300,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
         )
+        skipped = []
+        try:
+            try:
+                for photo in photos:
+                    try:
+                        frame = photostore.read_jpeg(config, photo)
+                    except (OSError, ValueError, imaging.Busy) as e:
+                        # Cleanup, tiering or packing can move a photo mid-render
+                        log.warning("Skipping unreadable timelapse frame %s: %s", photo, e)
+                        skipped.append(photo)
+                        continue
+                    proc.stdin.write(frame)
+                proc.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg exited early; its stderr says why
+                pass
+            proc.wait(timeout=300)
+        except subprocess.TimeoutExpired:
+            log.error("ffmpeg timed out encoding %s", output_path)
+        finally:
+            # Whatever went wrong, never leave ffmpeg behind
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+        stderr.seek(0)
+        return proc.returncode, stderr.read().decode(errors="replace"), skipped
 
-        if result.returncode != 0:
-            log.error("ffmpeg failed: %s", result.stderr.decode(errors="replace"))
-            return None
 
-        log.info("Generated daily timelapse: %s (%d photos)", output_path, len(photos))
-        return output_path
+def _preview_path(output_path):
+    """daily/2026-02-08.mp4 -> daily/preview/2026-02-08.mp4"""
+    return os.path.join(os.path.dirname(output_path), "preview", os.path.basename(output_path))
 
-    finally:
-        if os.path.exists(list_path):
-            os.remove(list_path)
 
+def _hls_dir(output_path):
+    """daily/2026-02-08.mp4 -> daily/hls/2026-02-08/"""
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    return os.path.join(os.path.dirname(output_path), "hls", stem)
 
-def generate_weekly_timelapse(config, year, week):
-    """Generate a weekly timelapse from noon photos of each day.
 
-    Args:
-        config: App config dict.
-        year: ISO year.
-        week: ISO week number.
+def _is_stale(path, source):
+    """True if path is missing or older than the file it was derived from."""
+    return not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source)
 
-    Returns:
-        Output file path, or None if skipped.
+
+def _run_ffmpeg(args, what):
+    with RENDER_SECONDS.labels(rendition=what).time():
+        result = subprocess.run(["ffmpeg", "-y", *args], capture_output=True, timeout=300)
+    if result.returncode != 0:
+        log.error("ffmpeg %s failed: %s", what, result.stderr.decode(errors="replace"))
+        return False
+    return True
+
+
+def _render_preview(config, output_path):
+    """Transcode the master into a small, fast-start preview MP4."""
+    preview = _preview_path(output_path)
+    if not _is_stale(preview, output_path):
+        return preview
+
+    tl = config["timelapse"]
+    width, _ = tl.get("preview_resolution", "640x360").split("x")
+    os.makedirs(os.path.dirname(preview), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(preview), "." + os.path.basename(preview))
+    try:
+        ok = _run_ffmpeg([
+            "-i", output_path,
+            "-vf", f"scale={width}:-2",
+            "-c:v", "libx264",
+            "-preset", tl.get("preset", "fast"),
+            "-crf", str(tl.get("preview_crf", 32)),
+            # Same GOP as the master so HLS segments of both renditions line up
+            "-g", str(_encoder_settings(config)["gop"]),
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+            tmp_path,
+        ], "preview")
+        if not ok:
+            return None
+        os.replace(tmp_path, preview)
+        return preview
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _segment_hls(source, out_dir, segment_seconds):
+    """Cut a video into HLS segments without re-encoding."""
+    os.makedirs(out_dir, exist_ok=True)
+    for f in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, f))
+    return _run_ffmpeg([
+        "-i", source,
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "seg_%03d.ts"),
+        os.path.join(out_dir, "index.m3u8"),
+    ], "hls")
+
+
+def _render_hls(config, output_path, preview):
+    """Segment master (and preview) into HLS with a variant playlist.
+
+    The master playlist lists the full and preview renditions so players
+    can start on the first segment and drop to the preview on slow links.
     """
-    from datetime import date, timedelta
+    hls_dir = _hls_dir(output_path)
+    master_playlist = os.path.join(hls_dir, "master.m3u8")
+    if not _is_stale(master_playlist, output_path):
+        return master_playlist
+
+    segment_seconds = config["timelapse"].get("hls_segment_seconds", 2)
+    variants = [("full", output_path, config["timelapse"].get("resolution", "1920x1080"))]
+    if preview:
+        variants.append(("preview", preview, config["timelapse"].get("preview_resolution", "640x360")))
+
+    # Rough bitrate from file size and frame count, good enough for ABR
+    duration = max(1.0, _video_duration(output_path, config))
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for name, source, resolution in variants:
+        if not _segment_hls(source, os.path.join(hls_dir, name), segment_seconds):
+            return None
+        bandwidth = int(os.path.getsize(source) * 8 / duration)
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}")
+        lines.append(f"{name}/index.m3u8")
+
+    tmp_path = master_playlist + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, master_playlist)
+    return master_playlist
+
+
+def _video_duration(output_path, config):
+    """Video length in seconds, derived from the manifest frame count."""
+    manifest = _load_manifest(output_path) or {}
+    frames = len(manifest.get("inputs", []))
+    return frames / config["timelapse"].get("fps", 3)
+
 
-    # Find the Monday of this ISO week
+def _render_renditions(config, output_path):
+    """Bring the web renditions of a master timelapse up to date."""
+    tl = config["timelapse"]
+    preview = _render_preview(config, output_path) if tl.get("preview", True) else None
+    if tl.get("hls", False):
+        _render_hls(config, output_path, preview)
+
+
+def _week_monday(year, week):
+    """Return the Monday of an ISO week."""
     jan4 = date(year, 1, 4)
     start_of_week1 = jan4 - timedelta(days=jan4.isoweekday() - 1)
-    monday = start_of_week1 + timedelta(weeks=week - 1)
+    return start_of_week1 + timedelta(weeks=week - 1)
+
+
+def _daily_output_path(config, date_str):
+    return os.path.join(config["storage"]["timelapse_dir"], "daily", f"{date_str}.mp4")
+
+
+def _weekly_output_path(config, year, week):
+    return os.path.join(config["storage"]["timelapse_dir"], "weekly", f"{year}-W{week:02d}.mp4")
+
+
+def _select_daily_photos(config, date_str):
+    """A day's photos, minus those flagged in the catalog."""
+    return catalog.usable(config, get_photos_for_date(config, date_str))
+
+
+def _select_weekly_photos(config, year, week):
+    """Pick the photo closest to noon for each day of an ISO week."""
+    monday = _week_monday(year, week)
 
     noon_photos = []
     for day_offset in range(7):
         day = monday + timedelta(days=day_offset)
         date_str = day.strftime("%Y-%m-%d")
-        photos = get_photos_for_date(config, date_str)
-
-        # Find the photo closest to noon
-        best = None
-        best_diff = float("inf")
-        for p in photos:
-            fname = os.path.basename(p)
-            # Parse YYYY-MM-DD_HH-MM.jpg
-            try:
-                parts = fname.replace(".jpg", "").split("_")
-                time_parts = parts[-1].split("-")
-                hour = int(time_parts[0])
-                minute = int(time_parts[1])
-                diff = abs((hour * 60 + minute) - 720)  # 720 = noon
-                if diff < best_diff:
-                    best_diff = diff
-                    best = p
-            except (IndexError, ValueError):
-                continue
+        photos = catalog.usable(config, get_photos_for_date(config, date_str))
+
+        best = photostore.find_noon_photo(photos)
         if best:
             noon_photos.append(best)
 
+    return noon_photos
+
+
+def generate_daily_timelapse(config, date_str, force=False):
+    """Generate a timelapse video from a day's photos.
+
+    Args:
+        config: App config dict.
+        date_str: Date string (YYYY-MM-DD).
+        force: Re-encode even if the manifest shows the video is up to date.
+
+    Returns:
+        Output file path, or None if skipped (too few photos).
+
+    Raises:
+        RuntimeError: ffmpeg failed.
+    """
+    photos = _select_daily_photos(config, date_str)
+    min_photos = config["timelapse"].get("min_photos", 5)
+
+    if len(photos) < min_photos:
+        log.info("Skipping timelapse for %s: only %d photos (need %d)",
+                 date_str, len(photos), min_photos)
+        return None
+
+    output_path = _daily_output_path(config, date_str)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    result = _render_timelapse(config, photos, output_path, force=force)
+    _render_renditions(config, result)
+    storage.update(config, result)
+    log.info("Generated daily timelapse: %s (%d photos)", output_path, len(photos))
+    return result
+
+
+def generate_weekly_timelapse(config, year, week, force=False):
+    """Generate a weekly timelapse from noon photos of each day.
+
+    Args:
+        config: App config dict.
+        year: ISO year.
+        week: ISO week number.
+        force: Re-encode even if the manifest shows the video is up to date.
+
+    Returns:
+        Output file path, or None if skipped (too few photos).
+
+    Raises:
+        RuntimeError: ffmpeg failed.
+    """
+    noon_photos = _select_weekly_photos(config, year, week)
+
     min_photos = config["timelapse"].get("min_photos", 5)
     if len(noon_photos) < min_photos:
         log.info("Skipping weekly timelapse for %d-W%02d: only %d photos",
                  year, week, len(noon_photos))
         return None
 
-    output_dir = os.path.join(config["storage"]["timelapse_dir"], "weekly")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{year}-W{week:02d}.mp4")
+    output_path = _weekly_output_path(config, year, week)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    result = _render_timelapse(config, noon_photos, output_path, force=force)
+    _render_renditions(config, result)
+    storage.update(config, result)
+    log.info("Generated weekly timelapse: %s (%d photos)", output_path, len(noon_photos))
+    return result
+
 
+def is_timelapse_current(config, kind, date_str=None, year=None, week=None):
+    """Check whether an existing timelapse matches its current inputs.
+
+    Lets callers answer a generate request without starting a render.
+    """
+    if kind == "daily":
+        photos = _select_daily_photos(config, date_str)
+        output_path = _daily_output_path(config, date_str)
+    else:
+        photos = _select_weekly_photos(config, year, week)
+        output_path = _weekly_output_path(config, year, week)
+
+    if not photos:
+        return False
     fps = config["timelapse"].get("fps", 3)
+    manifest = _build_manifest(config, photos, fps, _encoder_settings(config))
+    return _manifest_matches(output_path, manifest)
+
 
-    list_path = os.path.join(output_dir, f".{year}-W{week:02d}_files.txt")
+def invalidate_timelapses(config, date_str, filename=None):
+    """Drop manifests of timelapses that used deleted photos from date_str.
+
+    Called when photos are deleted. The videos stay playable, but the next
+    generate request for that day or week re-encodes instead of returning
+    the stale render. With filename, only timelapses that used that exact
+    photo are invalidated.
+    """
     try:
-        with open(list_path, "w") as f:
-            for photo in noon_photos:
-                f.write(f"file '{os.path.abspath(photo)}'\n")
-                f.write(f"duration {1.0 / fps}\n")
-            f.write(f"file '{os.path.abspath(noon_photos[-1])}'\n")
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return
+
+    year, week, _ = day.isocalendar()
+    prefix = os.path.join(os.path.abspath(config["storage"]["photo_dir"]), date_str) + os.sep
+    if filename:
+        # Match by capture name: the manifest may list the compact-tier file
+        prefix += os.path.splitext(filename)[0] + "."
+
+    for output_path in (_daily_output_path(config, date_str),
+                        _weekly_output_path(config, year, week)):
+        manifest = _load_manifest(output_path)
+        if not manifest:
+            continue
+        if any(i["file"].startswith(prefix) for i in manifest.get("inputs", [])):
+            try:
+                os.remove(_manifest_path(output_path))
+            except FileNotFoundError:
+                continue  # invalidated concurrently for another day of the week
+            storage.update(config, output_path)
+            log.info("Invalidated timelapse manifest: %s", output_path)
 
-        result = subprocess.run(
-            [
-                "ffmpeg", "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", list_path,
-                "-vf", f"fps={fps},scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1",
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "28",
-                "-pix_fmt", "yuv420p",
-                output_path,
-            ],
-            capture_output=True,
-            timeout=300,
-        )
 
-        if result.returncode != 0:
-            log.error("ffmpeg failed: %s", result.stderr.decode(errors="replace"))
-            return None
+def remove_timelapse(config, output_path):
+    """Delete a timelapse together with its manifest and web renditions.
 
-        log.info("Generated weekly timelapse: %s (%d photos)", output_path, len(noon_photos))
-        return output_path
+    Returns:
+        Bytes freed.
+    """
+    paths = [output_path, _manifest_path(output_path), _preview_path(output_path)]
+    hls_dir = _hls_dir(output_path)
+    for root, _, names in os.walk(hls_dir):
+        paths.extend(os.path.join(root, f) for f in names)
 
-    finally:
-        if os.path.exists(list_path):
-            os.remove(list_path)
+    freed = 0
+    for path in paths:
+        if os.path.isfile(path):
+            freed += os.path.getsize(path)
+            os.remove(path)
+    if os.path.isdir(hls_dir):
+        shutil.rmtree(hls_dir, ignore_errors=True)
+
+    storage.update(config, output_path)
+    log.info("Removed timelapse %s (%.1f MB)", output_path, freed / (1024 * 1024))
+    return freed
 
 
 def get_available_timelapses(config):
-    """List available timelapse videos.
+    """List available timelapse videos and their web renditions.
 
     Returns:
-        {"daily": ["2026-02-08.mp4", ...], "weekly": ["2026-W06.mp4", ...]}
+        {"daily": ["2026-02-08.mp4", ...], "weekly": ["2026-W06.mp4", ...],
+         "renditions": {"daily": {"2026-02-08.mp4": ["full", "preview", "hls"]}, ...}}
     """
-    result = {"daily": [], "weekly": []}
+    result = {"daily": [], "weekly": [], "renditions": {"daily": {}, "weekly": {}}}
 
     for kind in ("daily", "weekly"):
         d = os.path.join(config["storage"]["timelapse_dir"], kind)
         if os.path.isdir(d):
             result[kind] = sorted(
-                [f for f in os.listdir(d) if f.endswith(".mp4")],
+                [f for f in os.listdir(d) if f.endswith(".mp4") and not f.startswith(".")],
                 reverse=True,
             )
+        for f in result[kind]:
+            output_path = os.path.join(d, f)
+            available = ["full"]
+            if os.path.isfile(_preview_path(output_path)):
+                available.append("preview")
+            if os.path.isfile(os.path.join(_hls_dir(output_path), "master.m3u8")):
+                available.append("hls")
+            result["renditions"][kind][f] = available
 
     return result
@@ -1,10 +1,23 @@
 import logging
+import mimetypes
 import os
 import re
 import threading
+import time
 
 from flask import Flask, Response, jsonify, render_template, request, send_file
 
+import catalog
+import device
+import device_commands
+import events
+import imaging
+import metrics
+import photostore
+import request_timing
+import storage
+from request_timing import phase, timed_json
+
 log = logging.getLogger(__name__)
 
 
@@ -16,29 +29,38 @@ def create_app(config, state):
         static_folder=os.path.join(os.path.dirname(__file__), "static"),
     )
 
+    request_timing.init_app(app, config)
+
+    @app.errorhandler(imaging.Busy)
+    def image_queue_full(e):
+        """Photo encodes and thumbnails are backlogged; ask the client to come back."""
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        """Prometheus scrape endpoint."""
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
     @app.route("/")
     def index():
-        import time
         return render_template("index.html", v=int(time.time()))
 
+    gateway = device.get_gateway(config)
+    commands = device_commands.get_queue(config)
+
     @app.route("/api/status")
     def api_status():
-        import json as _json
-        import urllib.request
-
         mqtt = state.get("mqtt_client")
-        sensors = mqtt.get_latest_sensor_data() if mqtt else {}
+        with phase("mqtt"):
+            sensors = mqtt.get_latest_sensor_data() if mqtt else {}
 
-        # Fallback: fetch temperature directly from device if MQTT has no data
+        # Fallback: temperature from the device (cached) if MQTT has no data
         if sensors.get("temp_c") is None:
-            try:
-                with urllib.request.urlopen(
-                    f"http://{config['ecogarden']['device_ip']}/hooks/water_temperature",
-                    timeout=3,
-                ) as resp:
-                    sensors["temp_c"] = _json.loads(resp.read()).get("value")
-            except Exception:
-                pass
+            with phase("device"):
+                try:
+                    sensors["temp_c"] = gateway.temperature()
+                except device.DeviceUnavailable:
+                    pass
 
         # Record temperature for history graph
         if sensors.get("temp_c") is not None:
@@ -54,15 +76,36 @@ def create_app(config, state):
 
         # Load latest analysis
         from analyzer import _load_previous_analysis
-        analysis = _load_previous_analysis(config)
+        with phase("analysis"):
+            analysis = _load_previous_analysis(config)
 
         # Build plant info
-        from knowledge import get_growth_stage, get_plant_age, load_herbs, get_care_advice
+        with phase("plants"):
+            plants = _build_plants(analysis, sensors)
+
+        return timed_json({
+            "plants": plants,
+            "sensors": sensors,
+            "sensor_stats": mqtt.get_sensor_stats() if mqtt else {},
+            "mqtt_connected": mqtt.is_connected() if mqtt else False,
+            "mqtt_outbox": mqtt.outbox.depth() if mqtt else 0,
+            "analysis_date": analysis.get("date") if analysis else None,
+            "overall_health": analysis.get("overall_health") if analysis else None,
+            "summary": analysis.get("summary") if analysis else None,
+            "alerts": analysis.get("alerts", []) if analysis else [],
+            "sensor_alerts": state["alerts"].active() if state.get("alerts") else [],
+        })
+
+    def _build_plants(analysis, sensors):
+        """Per-plant growth, analysis and care advice for /api/status."""
+        from knowledge import load_herbs, get_care_advice
         herbs = load_herbs()
+        forecasts = _forecast(1)
         plants = []
-        for plant in config["plants"]:
-            age = get_plant_age(plant["planted_date"])
-            stage, progress = get_growth_stage(plant["species"], age)
+        for plant, forecast in zip(config["plants"], forecasts):
+            age = forecast["age_days"]
+            stage = forecast["stages"][0]["stage"] if forecast["stages"] else "unknown"
+            progress = forecast["stages"][0]["progress_start"] if forecast["stages"] else 0
             herb = herbs.get(plant["species"], {})
 
             plant_analysis = None
@@ -86,6 +129,7 @@ def create_app(config, state):
                 "growth_stage": stage,
                 "stage_progress": progress,
                 "harvest_range": herb.get("days_to_harvest", [60, 90]),
+                "harvest_window": forecast["harvest"],
                 "harvest_tips": herb.get("harvest_tips", ""),
                 "health_score": plant_analysis["health_score"] if plant_analysis else None,
                 "observations": plant_analysis["observations"] if plant_analysis else None,
@@ -93,30 +137,51 @@ def create_app(config, state):
                 "days_to_harvest": plant_analysis.get("days_to_harvest") if plant_analysis else None,
                 "advice": advice,
             })
-
-        return jsonify({
-            "plants": plants,
-            "sensors": sensors,
-            "mqtt_connected": mqtt.is_connected() if mqtt else False,
-            "analysis_date": analysis.get("date") if analysis else None,
-            "overall_health": analysis.get("overall_health") if analysis else None,
-            "summary": analysis.get("summary") if analysis else None,
-            "alerts": analysis.get("alerts", []) if analysis else [],
-        })
+        return plants
 
     @app.route("/api/photos/<date_str>")
     def api_photos(date_str):
         from capture import get_photos_for_date
-        photos = get_photos_for_date(config, date_str)
-        return jsonify([
+        with phase("scan"):
+            photos = get_photos_for_date(config, date_str)
+        names = [photostore.logical_name(p) for p in photos]
+        entries = catalog.get_day(config, date_str)
+        return timed_json([
             {
-                "filename": os.path.basename(p),
-                "url": f"/photos/{date_str}/{os.path.basename(p)}",
-                "time": os.path.basename(p).replace(".jpg", "").split("_")[-1].replace("-", ":"),
+                "filename": name,
+                "url": f"/photos/{date_str}/{name}",
+                "time": name.replace(".jpg", "").split("_")[-1].replace("-", ":"),
+                "duplicate_of": entries.get(name, {}).get("duplicate_of"),
+                "quality": entries.get(name, {}).get("quality", []),
             }
-            for p in photos
+            for name in names
         ])
 
+    @app.route("/api/photos/<date_str>/sprite")
+    def api_photos_sprite(date_str):
+        """Thumbnail sprite index for a day (built on first request)."""
+        if not re.match(r"^\d{4}-\d{2}-\d{2}$", date_str):
+            return jsonify({"error": "Invalid date format"}), 400
+        from sprites import build_sprite
+        index = build_sprite(config, date_str)
+        if not index:
+            return jsonify({"error": "No photos for date"}), 404
+        result = dict(index)
+        result.pop("inputs")
+        result["sprite"] = f"{index['sprite']}?v={index['version']}"
+        return jsonify(result)
+
+    @app.route("/sprites/<date_str>.jpg")
+    def serve_sprite(date_str):
+        if not re.match(r"^\d{4}-\d{2}-\d{2}$", date_str):
+            return "Not found", 404
+        from sprites import get_sprite_path
+        path = get_sprite_path(config, date_str)
+        if not path:
+            return "Not found", 404
+        # URL carries a version, so the sheet can be cached hard
+        return send_file(path, mimetype="image/jpeg", max_age=86400)
+
     @app.route("/api/photos/latest")
     def api_photos_latest():
         from capture import get_latest_photo
@@ -125,7 +190,7 @@ def create_app(config, state):
             return jsonify({"error": "No photos available"}), 404
 
         date_str = os.path.basename(os.path.dirname(photo))
-        filename = os.path.basename(photo)
+        filename = photostore.logical_name(photo)
         return jsonify({
             "filename": filename,
             "url": f"/photos/{date_str}/{filename}",
@@ -140,6 +205,31 @@ def create_app(config, state):
             return jsonify({"error": "No analysis available"}), 404
         return jsonify(analysis)
 
+    forecast_cache = {}
+
+    def _forecast(days):
+        """Plant forecasts for the next `days` days, computed once per day."""
+        from datetime import date
+        from knowledge import get_index
+        key = (date.today(), days)
+        result = forecast_cache.get(key)
+        if result is None:
+            result = get_index().forecast(config["plants"], days, today=key[0])
+            if len(forecast_cache) > 16:
+                forecast_cache.clear()
+            forecast_cache[key] = result
+        return result
+
+    @app.route("/api/forecast")
+    def api_forecast():
+        """Stage timeline and harvest window of every plant for the next ?days= days."""
+        try:
+            days = int(request.args.get("days", 30))
+        except ValueError:
+            return jsonify({"error": "days must be an integer"}), 400
+        days = max(1, min(days, 365))
+        return jsonify({"days": days, "plants": _forecast(days)})
+
     @app.route("/api/plants")
     def api_plants():
         from knowledge import load_herbs
@@ -157,33 +247,66 @@ def create_app(config, state):
     @app.route("/api/timelapse")
     def api_timelapse():
         from timelapse import get_available_timelapses
-        return jsonify(get_available_timelapses(config))
+        with phase("scan"):
+            timelapses = get_available_timelapses(config)
+        return timed_json(timelapses)
+
+    @app.route("/api/jobs")
+    def api_jobs():
+        """Scheduled jobs with next/last run times and durations."""
+        sched = state.get("scheduler")
+        if not sched:
+            return jsonify({"jobs": []})
+        return jsonify({"jobs": sched.describe()})
 
     @app.route("/api/storage")
     def api_storage():
         from cleanup import get_storage_stats
-        return jsonify(get_storage_stats(config))
+        with phase("scan"):
+            stats = get_storage_stats(config)
+        return timed_json(stats)
+
+    @app.route("/api/storage/cleanup")
+    def api_storage_cleanup():
+        """Dry run: what the next retention cleanup would delete."""
+        from cleanup import plan_cleanup
+        return timed_json(plan_cleanup(config))
+
+    @app.route("/api/storage/eviction")
+    def api_storage_eviction():
+        """Dry run: what eviction would free to get back under low water."""
+        from eviction import plan_eviction
+        return timed_json(plan_eviction(config))
 
     @app.route("/api/dates")
     def api_dates():
         """List available photo dates."""
+        import archive
         photo_dir = config["storage"]["photo_dir"]
-        if not os.path.isdir(photo_dir):
-            return jsonify([])
-        dates = sorted(
-            [d for d in os.listdir(photo_dir)
-             if os.path.isdir(os.path.join(photo_dir, d))],
-            reverse=True,
-        )
-        return jsonify(dates)
+        dates = set(archive.packed_days(config))
+        if os.path.isdir(photo_dir):
+            dates.update(d for d in os.listdir(photo_dir)
+                         if os.path.isdir(os.path.join(photo_dir, d)))
+        return jsonify(sorted(dates, reverse=True))
 
     @app.route("/photos/<date_str>/<filename>")
     def serve_photo(date_str, filename):
         base_dir = os.path.realpath(config["storage"]["photo_dir"])
         filepath = os.path.realpath(os.path.join(base_dir, date_str, filename))
-        if not filepath.startswith(base_dir + os.sep) or not os.path.isfile(filepath):
+        if not filepath.startswith(base_dir + os.sep):
             return "Not found", 404
-        return send_file(filepath, mimetype="image/jpeg")
+        # The .jpg URL stays valid after the photo moves to the compact tier
+        # or into a monthly archive pack
+        on_disk = photostore.resolve(filepath)
+        if on_disk:
+            return send_file(on_disk)
+        import archive
+        entry = archive.lookup(config, filepath)
+        if not entry:
+            return "Not found", 404
+        mimetype = mimetypes.guess_type(entry["name"])[0] or "application/octet-stream"
+        return Response(archive.read(config, filepath), mimetype=mimetype,
+                        headers={"Cache-Control": "public, max-age=86400"})
 
     @app.route("/timelapse/<kind>/<filename>")
     def serve_timelapse(kind, filename):
@@ -195,6 +318,29 @@ def create_app(config, state):
             return "Not found", 404
         return send_file(filepath, mimetype="video/mp4")
 
+    @app.route("/timelapse/<kind>/preview/<filename>")
+    def serve_timelapse_preview(kind, filename):
+        if kind not in ("daily", "weekly"):
+            return "Not found", 404
+        base_dir = os.path.realpath(config["storage"]["timelapse_dir"])
+        filepath = os.path.realpath(os.path.join(base_dir, kind, "preview", filename))
+        if not filepath.startswith(base_dir + os.sep) or not os.path.isfile(filepath):
+            return "Not found", 404
+        return send_file(filepath, mimetype="video/mp4")
+
+    @app.route("/timelapse/<kind>/hls/<label>/<path:filename>")
+    def serve_timelapse_hls(kind, label, filename):
+        """Serve HLS playlists and segments of a timelapse."""
+        if kind not in ("daily", "weekly"):
+            return "Not found", 404
+        base_dir = os.path.realpath(config["storage"]["timelapse_dir"])
+        filepath = os.path.realpath(os.path.join(base_dir, kind, "hls", label, filename))
+        if not filepath.startswith(base_dir + os.sep) or not os.path.isfile(filepath):
+            return "Not found", 404
+        if filepath.endswith(".m3u8"):
+            return send_file(filepath, mimetype="application/vnd.apple.mpegurl", max_age=0)
+        return send_file(filepath, mimetype="video/mp2t")
+
     @app.route("/latest.jpg")
     def latest_jpg():
         """Serve the latest photo as raw JPEG (for Home Assistant camera entity)."""
@@ -202,6 +348,8 @@ def create_app(config, state):
         photo = get_latest_photo(config)
         if not photo or not os.path.isfile(photo):
             return "No photo available", 404
+        if not photo.endswith(".jpg"):
+            return Response(photostore.read_jpeg(config, photo), mimetype="image/jpeg")
         return send_file(photo, mimetype="image/jpeg")
 
     @app.route("/stream")
@@ -212,59 +360,86 @@ def create_app(config, state):
         if not photo or not os.path.isfile(photo):
             return "No photo available", 404
 
-        with open(photo, "rb") as f:
-            frame = f.read()
+        frame = photostore.read_jpeg(config, photo)
 
         return Response(
             b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n",
             mimetype="multipart/x-mixed-replace; boundary=frame",
         )
 
+    @app.route("/api/sensors")
+    def api_sensors():
+        """Latest MQTT sensor readings with rolling 1h/24h statistics."""
+        mqtt = state.get("mqtt_client")
+        return jsonify(mqtt.get_sensor_stats() if mqtt else {})
+
+    @app.route("/api/alerts")
+    def api_alerts():
+        """Active sensor alerts and the state of every compiled rule."""
+        engine = state.get("alerts")
+        if not engine:
+            return jsonify({"active": [], "rules": []})
+        return jsonify({"active": engine.active(), "rules": engine.describe()})
+
     @app.route("/api/light", methods=["GET"])
     def api_light():
-        """Get current growlight state from EcoGarden device."""
-        import urllib.request
+        """Get current growlight state (cached; a pending toggle shows as its target)."""
         try:
-            with urllib.request.urlopen(
-                f"http://{config['ecogarden']['device_ip']}/rpc/LED.Get", timeout=5
-            ) as resp:
-                return Response(resp.read(), mimetype="application/json")
-        except Exception:
+            return jsonify(commands.light_state())
+        except device.DeviceUnavailable:
             return jsonify({"state": None, "error": "Device unreachable"}), 503
 
     @app.route("/api/light/toggle", methods=["POST"])
     def api_light_toggle():
-        """Toggle the EcoGarden growlight."""
-        import urllib.request
+        """Toggle the EcoGarden growlight (debounced, applied by the command queue)."""
         try:
-            with urllib.request.urlopen(
-                f"http://{config['ecogarden']['device_ip']}/rpc/LED.Toggle", timeout=5
-            ) as resp:
-                return Response(resp.read(), mimetype="application/json")
-        except Exception:
+            desired = commands.toggle_light()
+        except device.DeviceUnavailable:
             return jsonify({"error": "Device unreachable"}), 503
+        return jsonify({"state": desired, "pending": True})
 
     @app.route("/api/feed", methods=["POST"])
     def api_feed():
-        """Trigger the EcoGarden fish feeder."""
-        import urllib.request
+        """Queue one portion for the fish feeder, within the feeding limits."""
         try:
-            with urllib.request.urlopen(
-                f"http://{config['ecogarden']['device_ip']}/hooks/feed_now", timeout=5
-            ) as resp:
-                return Response(resp.read(), mimetype="application/json")
-        except Exception:
+            entry = commands.feed()
+        except device_commands.FeedRefused as e:
+            headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+            return jsonify({"error": str(e), **commands.feed_status()}), 429, headers
+        except device.DeviceUnavailable:
             return jsonify({"error": "Device unreachable"}), 503
+        return jsonify({"command": entry, **commands.feed_status()}), 202
+
+    @app.route("/api/device/commands")
+    def api_device_commands():
+        """Recent light and feed commands with their latency, and today's feeding slots."""
+        import feeding
+        return jsonify({"commands": commands.recent(), "feeding": commands.feed_status(),
+                        "schedule": feeding.status(config)})
+
+    from capture import CaptureJobs
+    capture_jobs = CaptureJobs(config, state)
 
     @app.route("/capture", methods=["POST"])
     def manual_capture():
-        """Trigger a manual photo capture."""
-        from capture import capture_photo
-        path = capture_photo(config)
-        if path:
-            state["last_capture"] = path
-            return jsonify({"status": "ok", "path": os.path.basename(path)})
-        return jsonify({"status": "error", "message": "Capture failed"}), 500
+        """Queue a manual photo capture; requests seconds apart share one job."""
+        job = capture_jobs.request()
+        job["status_url"] = f"/capture/{job['id']}"
+        return jsonify(job), 202
+
+    @app.route("/capture/<job_id>")
+    def manual_capture_status(job_id):
+        """State of a manual capture job (also pushed as "capture" events)."""
+        job = capture_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown capture job"}), 404
+        return jsonify(job)
+
+    @app.route("/api/events")
+    def api_events():
+        """Server-sent event stream of capture updates and other live events."""
+        return Response(events.stream(events.subscribe()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     # --- Feature: Delete Photos ---
 
@@ -278,10 +453,19 @@ def create_app(config, state):
 
         base_dir = os.path.realpath(config["storage"]["photo_dir"])
         filepath = os.path.realpath(os.path.join(base_dir, date_str, filename))
-        if not filepath.startswith(base_dir + os.sep) or not os.path.isfile(filepath):
+        if not filepath.startswith(base_dir + os.sep):
             return "Not found", 404
+        on_disk = photostore.resolve(filepath)
+        if on_disk:
+            os.remove(on_disk)
+            storage.update(config, on_disk)
+        else:
+            import archive
+            if archive.remove(config, filepath) is None:
+                return "Not found", 404
 
-        os.remove(filepath)
+        from timelapse import invalidate_timelapses
+        invalidate_timelapses(config, date_str, filename)
 
         # Remove empty date directory
         date_dir = os.path.dirname(filepath)
@@ -327,8 +511,10 @@ from(bucket: "{influx['bucket']}")
                     "Accept": "application/csv",
                 },
             )
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                csv_data = resp.read().decode()
+            from influxdb_writer import QUERY_SECONDS
+            with phase("influx"), QUERY_SECONDS.labels(query=f"light_history_{range_param}").time():
+                with urllib.request.urlopen(req, timeout=10) as resp:
+                    csv_data = resp.read().decode()
 
             # Parse InfluxDB annotated CSV:
             # Lines starting with '#' are annotations (skip)
@@ -358,9 +544,11 @@ from(bucket: "{influx['bucket']}")
                 except (ValueError, IndexError):
                     continue
 
-            return jsonify({"range": range_param, "points": points})
+            return timed_json({"range": range_param, "points": points})
 
         except Exception as e:
+            from influxdb_writer import QUERY_FAILURES
+            QUERY_FAILURES.labels(query=f"light_history_{range_param}").inc()
             log.warning("InfluxDB light history query failed: %s", e)
             return jsonify({"range": range_param, "points": [], "error": str(e)})
 
@@ -402,6 +590,23 @@ from(bucket: "{influx['bucket']}")
         else:
             return jsonify({"error": "Provide 'date' or 'year'+'week'"}), 400
 
+        force = bool(data.get("force"))
+
+        # Same inputs and settings as the existing video: nothing to encode
+        if not force:
+            from timelapse import is_timelapse_current
+            if gen_type == "daily":
+                current = is_timelapse_current(config, "daily", date_str=label)
+            else:
+                current = is_timelapse_current(config, "weekly", year=year, week=week)
+            if current:
+                return jsonify({
+                    "status": "current",
+                    "type": gen_type,
+                    "label": label,
+                    "result": f"{label}.mp4",
+                })
+
         with timelapse_lock:
             timelapse_status.update({
                 "generating": True,
@@ -415,9 +620,9 @@ from(bucket: "{influx['bucket']}")
             try:
                 from timelapse import generate_daily_timelapse, generate_weekly_timelapse
                 if gen_type == "daily":
-                    result = generate_daily_timelapse(config, label)
+                    result = generate_daily_timelapse(config, label, force=force)
                 else:
-                    result = generate_weekly_timelapse(config, year, week)
+                    result = generate_weekly_timelapse(config, year, week, force=force)
 
                 with timelapse_lock:
                     timelapse_status["result"] = os.path.basename(result) if result else None